@@ -3,6 +3,9 @@ from tqdm import tqdm
 import os
 from SPARQLWrapper import SPARQLWrapper, JSON
 import time
+import numpy as np
+from umls_index import load_umls_index
+from wikidata_fetch import WikidataNeighborFetcher, DEFAULT_ENDPOINT, normalize_qid
 
 def get_wikidata_neighbors(entity_id, limit=10):
 
@@ -49,40 +52,77 @@ def get_wikidata_neighbors(entity_id, limit=10):
     return neighbors
 
 
-def load_umls_relations(mrrel_path):
-    umls_kb = {}
-    if not os.path.exists(mrrel_path):
-        print(f"Warning: MRREL.RRF not found at '{mrrel_path}'. UMLS neighbor lookup will be skipped.")
-        return umls_kb
-
-    with open(mrrel_path, 'r', encoding='utf-8') as f:
-        for line in tqdm(f, desc="Loading MRREL.RRF"):
-            parts = line.strip().split('|')
-            if len(parts) > 4:
-                cui1, rel, cui2 = parts[0], parts[3], parts[4]
-                if cui1 not in umls_kb: umls_kb[cui1] = []
-                umls_kb[cui1].append({"relation_name": rel, "neighbor_id": cui2})
-                if cui2 not in umls_kb: umls_kb[cui2] = []
-                umls_kb[cui2].append({"relation_name": f"inverse_{rel}", "neighbor_id": cui1})
-    print("UMLS relationships loaded.")
-    return umls_kb
-
-def get_umls_neighbors(entity_id, umls_kb, limit=10):
-    if entity_id in umls_kb:
-        all_neighbors = umls_kb[entity_id]
-        if len(all_neighbors) > limit:
-            import random
-            return random.sample(all_neighbors, limit)
-        return all_neighbors
-    return []
+def get_umls_neighbors(entity_id, umls_index, limit=10, rng=None):
+    return umls_index.sample_neighbors([umls_index.cui_id(entity_id)], limit=limit, rng=rng)[0]
+
+
+def wikidata_ids_of(item):
+    return {entity["linked_id"] for entity in item.get('linked_entities', [])
+            if entity.get("link_source") == "Wikidata" and entity.get("linked_id")}
+
+
+def expand_item(item, umls_index, wikidata_neighbors, max_neighbors_per_entity=10, rng=None):
+    """
+    给一篇文档的每个链接实体加上 neighbors 字段：UMLS 实体从本地索引批量采样，
+    Wikidata 实体从已预取的 wikidata_neighbors（{QID: [neighbor, ...]}）中取。
+    """
+    entities = item.get('linked_entities', [])
+    # 一次性为整篇文档的 UMLS 实体批量采样邻居
+    umls_positions = [i for i, entity in enumerate(entities)
+                      if entity.get("link_source") == "MeSH/UMLS" and entity.get("linked_id")]
+    sampled = {}
+    if umls_index is not None and umls_positions:
+        cui_ids = umls_index.cui_ids([entities[i]["linked_id"] for i in umls_positions])
+        for i, raw_neighbors in zip(umls_positions, umls_index.sample_neighbors(
+                cui_ids, limit=max_neighbors_per_entity, rng=rng)):
+            sampled[i] = raw_neighbors
+
+    enhanced_entities = []
+    for i, entity in enumerate(entities):
+        neighbors = []
+        for n in sampled.get(i, []):
+            neighbors.append({
+                "relation_id": n["relation_name"],
+                "relation_name": n["relation_name"],
+                "neighbor_id": n["neighbor_id"],
+                "neighbor_name": "N/A (Lookup required)"
+            })
+        if entity.get("link_source") == "Wikidata" and entity.get("linked_id"):
+            neighbors = wikidata_neighbors.get(normalize_qid(entity["linked_id"]), [])
+        entity['neighbors'] = neighbors
+        enhanced_entities.append(entity)
+    item['linked_entities'] = enhanced_entities
+    return item
 
 
 def main():
     input_filepath = "data.json" 
     output_filepath = "data_with_neighbors.jsonl" 
     mrrel_file_path = "./MRREL.RRF" 
+    umls_index_dir = "./umls_index"
     max_neighbors_per_entity = 10 
-    umls_kb = load_umls_relations(mrrel_file_path)
+    wikidata_endpoint = DEFAULT_ENDPOINT
+    wikidata_cache_path = "wikidata_cache.sqlite"
+    umls_index = load_umls_index(mrrel_file_path, umls_index_dir)
+    rng = np.random.default_rng()
+
+    # 先扫描一遍收集所有 Wikidata 实体，批量异步预取邻居（结果落在本地缓存中）
+    wikidata_ids = set()
+    with open(input_filepath, 'r', encoding='utf-8') as f_in:
+        for line in f_in:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            wikidata_ids.update(wikidata_ids_of(item))
+    wikidata_neighbors = {}
+    if wikidata_ids:
+        fetcher = WikidataNeighborFetcher(endpoint=wikidata_endpoint, cache_path=wikidata_cache_path,
+                                          limit=max_neighbors_per_entity)
+        wikidata_neighbors = fetcher.fetch_all(sorted(wikidata_ids))
+        print(f"Wikidata neighbor fetch stats: {fetcher.stats}")
+        fetcher.close()
+
     with open(input_filepath, 'r', encoding='utf-8') as f_in, \
          open(output_filepath, 'w', encoding='utf-8') as f_out:
         
@@ -92,23 +132,7 @@ def main():
             except json.JSONDecodeError:
                 continue
 
-            enhanced_entities = []
-            for entity in item.get('linked_entities', []):
-                entity_id = entity.get("linked_id")
-                source = entity.get("link_source")
-                neighbors = []
-                if source == "MeSH/UMLS" and entity_id and umls_kb:
-                    raw_neighbors = get_umls_neighbors(entity_id, umls_kb, limit=max_neighbors_per_entity)
-                    for n in raw_neighbors:
-                         neighbors.append({
-                             "relation_id": n["relation_name"],
-                             "relation_name": n["relation_name"],
-                             "neighbor_id": n["neighbor_id"],
-                             "neighbor_name": "N/A (Lookup required)"
-                         })
-                entity['neighbors'] = neighbors
-                enhanced_entities.append(entity)
-            item['linked_entities'] = enhanced_entities
+            expand_item(item, umls_index, wikidata_neighbors, max_neighbors_per_entity, rng)
             json.dump(item, f_out, ensure_ascii=False)
             f_out.write('\n')
             
@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+from kg_store import open_kg
+
+ANN_DIRNAME = "ann"
+ANN_FORMAT_VERSION = 1
+
+
+def load_embeddings(path):
+    """读取实体 embedding：.npy 直接 memory-map，.pt（deepwalk.pt / entity_embeddings_rotate.pt）用 torch 读入。"""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode='r')
+    import torch
+    return torch.load(path, map_location='cpu').float().numpy()
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def _assign(vectors, centroids, chunk_size=65536):
+    """每个向量分配到内积最大的中心（向量与中心均已归一化，即余弦最近）。"""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = _normalize(vectors[start:start + chunk_size])
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, num_lists, iters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = _normalize(vectors)
+    centroids = vectors[rng.choice(len(vectors), num_lists, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=num_lists)
+        empty = counts == 0
+        # 空簇用随机样本重新初始化
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def build_ivf_index(embeddings, index_dir, num_lists=None, kmeans_iters=20, train_size=None, seed=0, source=None):
+    """
+    在实体 embedding 上构建 IVF（倒排文件）近邻索引，度量为余弦相似度。
+
+    先在采样的向量上做球面 k-means 得到 num_lists 个中心，再把每个实体归入最近的中心；
+    向量按所属列表重排后连续存放，查询时只需扫描 nprobe 个列表。
+
+    产物:
+        centroids.npy     (num_lists, dim) 归一化的中心
+        list_offsets.npy  第 i 个列表为 [offsets[i], offsets[i + 1])
+        list_ids.npy      重排后每行对应的实体 ID
+        vectors.npy       重排后的归一化向量（float32）
+        meta.json         格式版本、规模与 embedding 来源
+    """
+    num_vectors, dim = embeddings.shape
+    num_lists = num_lists or max(1, min(num_vectors, int(4 * np.sqrt(num_vectors))))
+    train_size = min(num_vectors, train_size or 256 * num_lists)
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(num_vectors, train_size, replace=False))
+    print(f"Training {num_lists} IVF lists on {train_size} of {num_vectors} vectors...")
+    centroids = spherical_kmeans(np.asarray(embeddings[sample]), num_lists, iters=kmeans_iters, seed=seed)
+
+    labels = _assign(embeddings, centroids)
+    order = np.argsort(labels, kind='stable')
+    offsets = np.zeros(num_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=num_lists), out=offsets[1:])
+
+    tmp_dir = index_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "centroids.npy"), centroids)
+    np.save(os.path.join(tmp_dir, "list_offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "list_ids.npy"), order.astype(np.int64))
+    vectors = np.lib.format.open_memmap(os.path.join(tmp_dir, "vectors.npy"), mode='w+', dtype=np.float32,
+                                        shape=(num_vectors, dim))
+    for start in range(0, num_vectors, 65536):
+        rows = order[start:start + 65536]
+        by_row = np.argsort(rows)
+        chunk = np.empty((len(rows), dim), dtype=np.float32)
+        chunk[by_row] = _normalize(embeddings[rows[by_row]])
+        vectors[start:start + len(rows)] = chunk
+    vectors.flush()
+    del vectors
+    with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "format_version": ANN_FORMAT_VERSION,
+            "metric": "cosine",
+            "num_vectors": int(num_vectors),
+            "dim": int(dim),
+            "num_lists": int(num_lists),
+            "source": os.path.abspath(source) if source else None,
+            "source_mtime": os.path.getmtime(source) if source else None,
+        }, f, indent=2)
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+    print(f"IVF index written to '{index_dir}'.")
+
+
+class IVFIndex:
+    """IVF 索引的只读视图（memory-map）。"""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != ANN_FORMAT_VERSION:
+            raise ValueError(f"ANN index at '{index_dir}' has format {self.meta.get('format_version')}, "
+                             f"expected {ANN_FORMAT_VERSION}. Rebuild it with build_ivf_index().")
+        self.centroids = np.load(os.path.join(index_dir, "centroids.npy"))
+        self.list_offsets = np.load(os.path.join(index_dir, "list_offsets.npy"))
+        self.list_ids = np.load(os.path.join(index_dir, "list_ids.npy"), mmap_mode='r')
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.list_ids)
+
+    def search(self, queries, k=10, nprobe=8, exclude=None):
+        """
+        批量查询余弦相似度最高的 k 个实体。
+
+        Args:
+            queries: (Q, dim) 查询向量
+            nprobe: 每个查询扫描的列表数，越大越准、越慢；等于 num_lists 时为精确搜索
+            exclude: 可选，长度 Q 的实体 ID，从对应查询的结果中排除（用于查询实体自身的近邻）
+        Returns:
+            (ids, scores): 形状均为 (Q, k)，不足 k 个时 ids 以 -1 填充
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, lists in enumerate(probe):
+            starts, ends = self.list_offsets[lists], self.list_offsets[lists + 1]
+            rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+            if len(rows) == 0:
+                continue
+            rows.sort()
+            candidate_ids = np.asarray(self.list_ids[rows])
+            sims = np.asarray(self.vectors[rows]) @ queries[i]
+            if exclude is not None:
+                sims[candidate_ids == exclude[i]] = -np.inf
+            top = min(k, len(rows))
+            best = np.argpartition(-sims, top - 1)[:top]
+            best = best[np.argsort(-sims[best])]
+            valid = np.isfinite(sims[best])
+            ids[i, :valid.sum()] = candidate_ids[best[valid]]
+            scores[i, :valid.sum()] = sims[best[valid]]
+        return ids, scores
+
+
+def ann_dir(kg_dir, embedding_path):
+    name = os.path.splitext(os.path.basename(embedding_path))[0]
+    return os.path.join(kg_dir, ANN_DIRNAME, name)
+
+
+def open_ann(kg_dir, embedding_path, **build_kwargs):
+    """打开 <kg_dir>/ann/<embedding 名>/ 下的索引；不存在或比 embedding 旧时先构建。"""
+    index_dir = ann_dir(kg_dir, embedding_path)
+    meta_path = os.path.join(index_dir, "meta.json")
+    if not os.path.exists(meta_path) or os.path.getmtime(embedding_path) > os.path.getmtime(meta_path):
+        build_ivf_index(load_embeddings(embedding_path), index_dir, source=embedding_path, **build_kwargs)
+    return IVFIndex(index_dir)
+
+
+class EntityNeighborSearch:
+    """把 IVF 索引和 KG 实体名结合起来：按实体名或向量批量查询近邻实体。"""
+
+    def __init__(self, kg_dir, embedding_path, nprobe=8, **build_kwargs):
+        self.kg = open_kg(kg_dir)
+        self.index = open_ann(kg_dir, embedding_path, **build_kwargs)
+        if len(self.index) != self.kg.num_entities:
+            raise ValueError(f"'{embedding_path}' has {len(self.index)} rows but the KG has "
+                             f"{self.kg.num_entities} entities; retrain or rebuild the index.")
+        self.embedding_path = embedding_path
+        self._embeddings = None
+        self.nprobe = nprobe
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = load_embeddings(self.embedding_path)
+        return self._embeddings
+
+    def _results(self, ids, scores):
+        return [[(int(e), self.kg.entity_name(e), float(s)) for e, s in zip(row_ids, row_scores) if e >= 0]
+                for row_ids, row_scores in zip(ids, scores)]
+
+    def search_vectors(self, vectors, k=10):
+        """Returns: 每个查询一个列表 [(entity_id, entity_name, cosine), ...]。"""
+        return self._results(*self.index.search(vectors, k=k, nprobe=self.nprobe))
+
+    def search_entities(self, names, k=10):
+        """按实体名（entity2id 中的名字）查询近邻，结果不含实体自身；不在 KG 中的名字返回空列表。"""
+        entity_ids = np.array([self.kg.entity_id(n, -1) for n in names], dtype=np.int64)
+        found = np.flatnonzero(entity_ids >= 0)
+        results = [[] for _ in names]
+        if len(found):
+            rows = entity_ids[found]
+            order = np.argsort(rows)
+            vectors = np.empty((len(rows), self.embeddings.shape[1]), dtype=np.float32)
+            vectors[order] = self.embeddings[rows[order]]
+            ids, scores = self.index.search(vectors, k=k, nprobe=self.nprobe, exclude=rows)
+            for i, res in zip(found, self._results(ids, scores)):
+                results[i] = res
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Build or query the IVF nearest-neighbor index over entity embeddings.")
+    parser.add_argument("--kg_dir", default="./final_enriched_kg")
+    parser.add_argument("--embedding", default="deepwalk.pt")
+    parser.add_argument("--num_lists", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("entities", nargs="*", help="Entity names to query.")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        build_ivf_index(load_embeddings(args.embedding), ann_dir(args.kg_dir, args.embedding),
+                        num_lists=args.num_lists, source=args.embedding)
+    search = EntityNeighborSearch(args.kg_dir, args.embedding, nprobe=args.nprobe, num_lists=args.num_lists)
+    for name, neighbors in zip(args.entities, search.search_entities(args.entities, k=args.k)):
+        print(f"{name}:")
+        for entity_id, neighbor_name, score in neighbors:
+            print(f"  {score:.4f}\t{entity_id}\t{neighbor_name}")
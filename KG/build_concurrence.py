@@ -1,6 +1,10 @@
 import json
 from itertools import combinations
 import os
+from array import array
+import numpy as np
+import scipy.sparse as sp
+from kg_store import convert_text_kg, write_kg_store
 from tqdm import tqdm # 引入tqdm来显示进度条
 
 def build_cooccurrence_graph(data_file_path, output_dir):
@@ -55,11 +59,147 @@ def build_cooccurrence_graph(data_file_path, output_dir):
             rid = relation_to_id[r]
             tid = entity_to_id[t]
             f.write(f"{hid}\t{tid}\t{rid}\n")
+    convert_text_kg(output_dir)
+
+    print(f"Successfully created all files in {output_dir}")
+
+def doc_pairs(ids, window=None):
+    """
+    一篇文档内的去重实体对 (i < j)。
+
+    window 为 None 时取文档内所有实体两两组合；否则只配对提及位置相距不超过 window 的实体。
+    """
+    if window is None:
+        ids = np.unique(ids)
+        left, right = np.triu_indices(len(ids), k=1)
+        return ids[left], ids[right]
+    offsets = range(1, min(window, len(ids) - 1) + 1)
+    if not offsets:
+        return np.zeros(0, dtype=ids.dtype), np.zeros(0, dtype=ids.dtype)
+    heads = np.concatenate([ids[:-offset] for offset in offsets])
+    tails = np.concatenate([ids[offset:] for offset in offsets])
+    keep = heads != tails
+    pairs = np.unique(np.stack([np.minimum(heads[keep], tails[keep]), np.maximum(heads[keep], tails[keep])]), axis=1)
+    return pairs[0], pairs[1]
+
+
+def _top_k_mask(rows, cols, weights, top_k):
+    """每条边只要在任一端点的前 top_k 条（按权重）之内就保留。"""
+    nodes = np.concatenate([rows, cols])
+    edge = np.concatenate([np.arange(len(rows)), np.arange(len(rows))])
+    order = np.lexsort((-np.concatenate([weights, weights]), nodes))
+    sorted_nodes = nodes[order]
+    group_start = np.searchsorted(sorted_nodes, sorted_nodes, side='left')
+    rank = np.arange(len(order)) - group_start
+    keep = np.zeros(len(rows), dtype=bool)
+    keep[edge[order[rank < top_k]]] = True
+    return keep
+
+
+def build_weighted_cooccurrence_graph(data_file_path, output_dir, min_count=1, min_pmi=None, top_k=None,
+                                      window=None, weight="count", flush_pairs=10_000_000):
+    """
+    聚合版共现图：每个实体对只输出一条带权边，而不是每篇文档一条重复三元组。
+
+    Args:
+        min_count (int): 共现文档数低于该值的实体对被丢弃。
+        min_pmi (float): 若给定，丢弃 PMI 低于该值的实体对；PMI 按文档级共现计算。
+        top_k (int): 若给定，每个节点只保留权重最高的 top_k 条边（对任一端点满足即保留）。
+        window (int): 若给定，只统计提及位置相距不超过 window 的实体对。
+        weight (str): 输出边权，"count" 或 "pmi"。
+        flush_pairs (int): 缓冲的实体对达到该数量时合并进稀疏计数矩阵，控制峰值内存。
+    """
+    if window is not None and window < 1:
+        raise ValueError(f"window must be a positive number of mentions or None, got {window}.")
+    entity_to_id = {}
+    doc_freq = array('q')
+    num_docs = 0
+    rows_buf, cols_buf = array('q'), array('q')
+    counts = sp.csr_matrix((0, 0), dtype=np.int64)
+
+    def flush():
+        nonlocal counts, rows_buf, cols_buf
+        n = len(entity_to_id)
+        counts.resize((n, n))
+        if len(rows_buf):
+            rows = np.frombuffer(rows_buf, dtype=np.int64)
+            cols = np.frombuffer(cols_buf, dtype=np.int64)
+            counts = counts + sp.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(n, n))
+        rows_buf, cols_buf = array('q'), array('q')
+
+    with open(data_file_path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(tqdm(f, desc="Counting co-occurrences")):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping malformed JSON on line {line_num + 1}")
+                continue
+            # 按提及顺序编码为整数 ID
+            ids = np.array([
+                entity_to_id.setdefault(entity['linked_id'], len(entity_to_id))
+                for entity in data.get('linked_entities', [])
+                if entity and 'linked_id' in entity and entity['linked_id']
+            ], dtype=np.int64)
+            num_docs += 1
+            unique_ids = np.unique(ids)
+            doc_freq.extend([0] * (len(entity_to_id) - len(doc_freq)))
+            for eid in unique_ids.tolist():
+                doc_freq[eid] += 1
+            if len(unique_ids) < 2:
+                continue
+            heads, tails = doc_pairs(ids, window)
+            rows_buf.extend(heads.tolist())
+            cols_buf.extend(tails.tolist())
+            if len(rows_buf) >= flush_pairs:
+                flush()
+    flush()
+
+    coo = counts.tocoo()
+    rows, cols, pair_counts = coo.row, coo.col, coo.data
+    df = np.frombuffer(doc_freq, dtype=np.int64)
+    pmi = np.log(pair_counts * num_docs / (df[rows] * df[cols]).astype(np.float64))
+    print(f"\nCounted {len(pair_counts)} unique entity pairs over {num_docs} documents and {len(entity_to_id)} entities.")
+
+    keep = pair_counts >= min_count
+    if min_pmi is not None:
+        keep &= pmi >= min_pmi
+    rows, cols, pair_counts, pmi = rows[keep], cols[keep], pair_counts[keep], pmi[keep]
+    weights = pmi if weight == "pmi" else pair_counts.astype(np.float64)
+    if top_k is not None:
+        keep = _top_k_mask(rows, cols, weights, top_k)
+        rows, cols, weights = rows[keep], cols[keep], weights[keep]
+    print(f"Kept {len(rows)} weighted edges after filtering.")
+
+    # 与原版一致：实体按名字排序分配 ID，保证每次运行 ID 相同
+    entity_list = sorted(entity_to_id)
+    remap = np.empty(len(entity_list), dtype=np.int64)
+    remap[[entity_to_id[name] for name in entity_list]] = np.arange(len(entity_list))
+    heads, tails = remap[rows], remap[cols]
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    print(f"Writing output files to: {output_dir}")
+    with open(os.path.join(output_dir, 'entity2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(entity_list)}\n")
+        for eid, name in enumerate(entity_list):
+            f.write(f"{name}\t{eid}\n")
+    with open(os.path.join(output_dir, 'relation2id.txt'), 'w', encoding='utf-8') as f:
+        f.write("1\n")
+        f.write("co_occurrence\t0\n")
+    with open(os.path.join(output_dir, 'train2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(heads)}\n")
+        np.savetxt(f, np.stack([heads, tails, np.zeros_like(heads)], axis=1), fmt='%d', delimiter='\t')
+    write_kg_store(output_dir, entity_list, ["co_occurrence"], np.stack([heads, tails, np.zeros_like(heads)], axis=1))
+    # 边权与 train2id.txt 逐行对齐
+    with open(os.path.join(output_dir, 'train2weight.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(weights)}\n")
+        np.savetxt(f, weights, fmt='%.6g')
 
     print(f"Successfully created all files in {output_dir}")
 
 if __name__ == "__main__":
     input_file = "data.json" 
     output_folder = "cooccurrence_kg"
-    build_cooccurrence_graph(input_file, output_folder)
+    build_weighted_cooccurrence_graph(input_file, output_folder, min_count=1)
 
@@ -1,95 +1,126 @@
 import json
 from tqdm import tqdm
 import os
+from array import array
 from itertools import combinations
+import numpy as np
+from kg_store import write_kg_store, write_text_kg
 
-def create_kg_files_from_neighbor_data(input_path, output_dir):
-    print("--- Step 1: Scanning file to collect all entities and relations ---")
-    
-    all_entities = set()
-    all_relations = set()
-    
-    with open(input_path, 'r', encoding='utf-8') as f:
-        for line in tqdm(f, desc="Scanning entities and relations"):
-            try:
-                item = json.loads(line)
-            except json.JSONDecodeError:
-                continue
 
-            seed_entities_in_doc = set()
-            for entity in item.get('linked_entities', []):
-                seed_entities_in_doc.add(entity['linked_id'])
-                for neighbor_info in entity.get('neighbors', []):
-                    all_entities.add(neighbor_info['neighbor_id'])
-                    all_relations.add(neighbor_info['relation_id'])
-            
-            all_entities.update(seed_entities_in_doc)
-            if len(seed_entities_in_doc) >= 2:
-                all_relations.add("co_occurrence")
-
-    print(f"Found {len(all_entities)} unique entities and {len(all_relations)} unique relations.")
-    print("\n--- Step 2: Creating ID maps for entities and relations ---")
-    
-    entity_list = sorted(list(all_entities))
-    relation_list = sorted(list(all_relations))
-    
-    entity_to_id = {name: i for i, name in enumerate(entity_list)}
-    relation_to_id = {name: i for i, name in enumerate(relation_list)}
+def doc_graph(item):
+    """
+    从一篇带邻居的文档中抽取实体、关系和三元组（字符串形式）。
 
-    print("ID maps created.")
+    Returns:
+        entities: 文档中出现的全部实体（种子实体，包括 Fallback，以及邻居实体）
+        relations: 文档中出现的全部关系（有 >= 2 个种子实体时包含 co_occurrence）
+        triplets: [(head, relation, tail), ...]；没有显式关系的非 Fallback 种子实体对生成共现三元组
+    """
+    entities = []
+    relations = []
+    triplets = []
+    explicit_pairs = set()
+    seeds = set()
+    for entity in item.get('linked_entities', []):
+        head_id = entity['linked_id']
+        seeds.add(head_id)
+        entities.append(head_id)
+        for neighbor_info in entity.get('neighbors', []):
+            rel_id = neighbor_info['relation_id']
+            tail_id = neighbor_info['neighbor_id']
+            entities.append(tail_id)
+            relations.append(rel_id)
+            triplets.append((head_id, rel_id, tail_id))
+            explicit_pairs.add(tuple(sorted((head_id, tail_id))))
+    if len(seeds) >= 2:
+        relations.append("co_occurrence")
+    linked_seeds = sorted({
+        entity['linked_id']
+        for entity in item.get('linked_entities', [])
+        if entity.get('link_source') != 'Fallback'
+    })
+    # 种子实体按名字排序后两两组合，共现三元组的方向确定、可复现
+    for e1, e2 in combinations(linked_seeds, 2):
+        if (e1, e2) not in explicit_pairs:
+            triplets.append((e1, "co_occurrence", e2))
+    return entities, relations, triplets
+
+
+def unique_triplets(triplets):
+    """对 (N, 3) 整数三元组数组做排序去重。"""
+    if len(triplets) == 0:
+        return triplets.reshape(0, 3)
+    return np.unique(triplets, axis=0)
+
+
+def create_kg_files_from_neighbor_data(input_path, output_dir, deterministic_ids=True, compact_every=20_000_000):
+    """
+    单遍流式构建 KG：边读边增量分配实体/关系 ID，三元组以整数数组累积并向量化去重。
+
+    Args:
+        deterministic_ids (bool): 为 True 时最后把 ID 重映射为按名字排序的顺序（与旧版输出一致）；
+            否则保留首次出现的顺序，省去重映射。
+        compact_every (int): 缓冲的三元组达到该数量时先去重一次，限制峰值内存。
+    """
+    print("--- Step 1: Streaming documents, assigning IDs and collecting triplets ---")
+
+    entity_to_id = {}
+    relation_to_id = {}
+    heads, rels, tails = array('q'), array('q'), array('q')
+    compacted = np.zeros((0, 3), dtype=np.int64)
+
+    def compact():
+        nonlocal heads, rels, tails, compacted
+        buffered = np.stack([np.frombuffer(heads, dtype=np.int64),
+                             np.frombuffer(rels, dtype=np.int64),
+                             np.frombuffer(tails, dtype=np.int64)], axis=1)
+        compacted = unique_triplets(np.concatenate([compacted, buffered]))
+        heads, rels, tails = array('q'), array('q'), array('q')
 
-    print("\n--- Step 3: Generating all triplets from the data ---")
-    
-    all_triplets = set()
-    
     with open(input_path, 'r', encoding='utf-8') as f:
-        for line in tqdm(f, desc="Generating triplets"):
+        for line in tqdm(f, desc="Building graph"):
             try:
                 item = json.loads(line)
             except json.JSONDecodeError:
                 continue
 
-            seed_entities_in_doc = {
-                entity['linked_id'] 
-                for entity in item.get('linked_entities', []) 
-                if entity.get('link_source') != 'Fallback'
-            }
-            
-            explicit_relations_in_doc = set()
-            for entity in item.get('linked_entities', []):
-                head_id = entity['linked_id']
-                for neighbor_info in entity.get('neighbors', []):
-                    rel_id = neighbor_info['relation_id']
-                    tail_id = neighbor_info['neighbor_id']
-                    
-                    if head_id in entity_to_id and rel_id in relation_to_id and tail_id in entity_to_id:
-                        all_triplets.add((head_id, rel_id, tail_id))
-                        pair = tuple(sorted((head_id, tail_id)))
-                        explicit_relations_in_doc.add(pair)
-            if len(seed_entities_in_doc) >= 2:
-                for e1, e2 in combinations(seed_entities_in_doc, 2):
-                    pair = tuple(sorted((e1, e2)))
-                    if pair not in explicit_relations_in_doc:
-                        all_triplets.add((e1, "co_occurrence", e2))
+            entities, relations, triplets = doc_graph(item)
+            for name in entities:
+                entity_to_id.setdefault(name, len(entity_to_id))
+            for name in relations:
+                relation_to_id.setdefault(name, len(relation_to_id))
+            for h, r, t in triplets:
+                heads.append(entity_to_id[h])
+                rels.append(relation_to_id[r])
+                tails.append(entity_to_id[t])
+            if len(heads) >= compact_every:
+                compact()
+    compact()
+    all_triplets = compacted
+
+    print(f"Found {len(entity_to_id)} unique entities and {len(relation_to_id)} unique relations.")
+
+    entity_list = list(entity_to_id)
+    relation_list = list(relation_to_id)
+    if deterministic_ids:
+        print("\n--- Step 2: Remapping IDs to sorted order ---")
+        entity_order = sorted(range(len(entity_list)), key=entity_list.__getitem__)
+        relation_order = sorted(range(len(relation_list)), key=relation_list.__getitem__)
+        entity_remap = np.empty(len(entity_list), dtype=np.int64)
+        entity_remap[entity_order] = np.arange(len(entity_list))
+        relation_remap = np.empty(len(relation_list), dtype=np.int64)
+        relation_remap[relation_order] = np.arange(len(relation_list))
+        entity_list = [entity_list[i] for i in entity_order]
+        relation_list = [relation_list[i] for i in relation_order]
+        all_triplets = unique_triplets(np.stack([entity_remap[all_triplets[:, 0]],
+                                                 relation_remap[all_triplets[:, 1]],
+                                                 entity_remap[all_triplets[:, 2]]], axis=1))
 
     print(f"Generated {len(all_triplets)} unique triplets.")
-    print("\n--- Step 4: Writing graph files to the output directory ---")
+    print("\n--- Step 3: Writing graph files to the output directory ---")
     
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    with open(os.path.join(output_dir, 'entity2id.txt'), 'w', encoding='utf-8') as f:
-        f.write(f"{len(entity_to_id)}\n")
-        for name, eid in entity_to_id.items(): f.write(f"{name}\t{eid}\n")
-    with open(os.path.join(output_dir, 'relation2id.txt'), 'w', encoding='utf-8') as f:
-        f.write(f"{len(relation_to_id)}\n")
-        for name, rid in relation_to_id.items(): f.write(f"{name}\t{rid}\n")
-    with open(os.path.join(output_dir, 'train2id.txt'), 'w', encoding='utf-8') as f:
-        f.write(f"{len(all_triplets)}\n")
-        for h, r, t in tqdm(all_triplets, desc="Writing train2id.txt"):
-            hid = entity_to_id[h]
-            rid = relation_to_id[r]
-            tid = entity_to_id[t]
-            f.write(f"{hid}\t{tid}\t{rid}\n") 
+    write_text_kg(output_dir, entity_list, relation_list, all_triplets[:, [0, 2, 1]])
+    write_kg_store(output_dir, entity_list, relation_list, all_triplets[:, [0, 2, 1]])
 
     print(f"\nAll files successfully created in '{output_dir}'. You can now use this directory for KGE model training.")
 
@@ -100,5 +131,6 @@ if __name__ == "__main__":
     OUTPUT_KG_FOLDER = "final_enriched_kg"
     create_kg_files_from_neighbor_data(
         input_path=INPUT_NEIGHBOR_FILE,
-        output_dir=OUTPUT_KG_FOLDER
+        output_dir=OUTPUT_KG_FOLDER,
+        deterministic_ids=True
     )
\ No newline at end of file
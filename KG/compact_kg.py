@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import numpy as np
+from kg_store import open_kg, write_kg_store, write_text_kg
+from random_walk import build_csr
+from subgraph_extract import SPLITS, iter_split_documents
+
+COMPACT_FILENAME = "compact.json"
+
+
+def load_seed_entities(data_dir, splits=SPLITS, file_pattern="wos_{split}.json"):
+    """数据集文档中引用的全部 linked_id（即分类器会查 embedding 的实体）。"""
+    seeds = set()
+    for split in splits:
+        path = os.path.join(data_dir, file_pattern.format(split=split))
+        if not os.path.exists(path):
+            print(f"Warning: '{path}' not found, skipping split '{split}'.")
+            continue
+        for linked_ids in iter_split_documents(path):
+            seeds.update(linked_ids)
+    return seeds
+
+
+def _expand(indptr, indices, nodes):
+    starts, ends = indptr[nodes], indptr[nodes + 1]
+    counts = ends - starts
+    offsets = np.cumsum(counts) - counts
+    positions = np.repeat(starts - offsets, counts) + np.arange(int(counts.sum()))
+    return np.unique(np.asarray(indices[positions], dtype=np.int64))
+
+
+def prune_kg(triplets_htr, num_entities, num_relations, seed_mask, min_degree=2, min_relation_count=5,
+             max_hops=2, drop_relations=(), max_iters=50):
+    """
+    计算剪枝后保留的实体和三元组，种子实体无论度数多少都保留。
+
+    1. 去掉自环、出现次数少于 min_relation_count 的关系以及 drop_relations 中的关系；
+    2. 反复删除度数小于 min_degree 的非种子实体（删掉一个实体可能让邻居的度数也降下来）；
+    3. 只保留距某个种子实体不超过 max_hops 跳的实体（max_hops 为 None 时保留种子所在的连通分量）。
+
+    Returns:
+        (entity_mask, edge_mask): 长度分别为 num_entities 和三元组数的布尔数组
+    """
+    heads, tails, rels = (np.asarray(triplets_htr[:, i], dtype=np.int64) for i in range(3))
+    rel_counts = np.bincount(rels, minlength=num_relations)
+    rel_keep = rel_counts >= min_relation_count
+    rel_keep[list(drop_relations)] = False
+    edge_mask = rel_keep[rels] & (heads != tails)
+
+    alive = np.ones(num_entities, dtype=bool)
+    for _ in range(max_iters):
+        degree = np.bincount(heads[edge_mask], minlength=num_entities) \
+            + np.bincount(tails[edge_mask], minlength=num_entities)
+        dead = alive & ~seed_mask & (degree < min_degree)
+        if not dead.any():
+            break
+        alive &= ~dead
+        edge_mask &= alive[heads] & alive[tails]
+
+    indptr, indices = build_csr(num_entities, heads[edge_mask], tails[edge_mask])
+    reached = seed_mask.copy()
+    frontier = np.flatnonzero(seed_mask)
+    hop = 0
+    while len(frontier) and (max_hops is None or hop < max_hops):
+        neighbors = _expand(indptr, indices, frontier)
+        frontier = neighbors[~reached[neighbors]]
+        reached[frontier] = True
+        hop += 1
+    alive &= reached
+    edge_mask &= alive[heads] & alive[tails]
+    return alive, edge_mask
+
+
+def _stats(num_entities, num_relations, triplets_htr, seed_mask, dim):
+    degree = np.bincount(triplets_htr[:, 0], minlength=num_entities) \
+        + np.bincount(triplets_htr[:, 1], minlength=num_entities)
+    return {
+        "entities": int(num_entities),
+        "relations": int(num_relations),
+        "triplets": int(len(triplets_htr)),
+        "seed_entities": int(seed_mask.sum()),
+        "isolated_seeds": int((seed_mask & (degree == 0)).sum()),
+        "mean_degree": float(degree.mean()) if num_entities else 0.0,
+        "embedding_mb": num_entities * dim * 4 / 2 ** 20,
+    }
+
+
+def remap_embeddings(embedding_path, entity_mask, output_path, chunk_rows=65536):
+    """按 entity_mask 取出保留实体的行（新 ID 即保留实体的原始顺序），写成 .npy 或 .pt。"""
+    from ann_index import load_embeddings
+
+    embeddings = load_embeddings(embedding_path)
+    if len(embeddings) != len(entity_mask):
+        raise ValueError(f"'{embedding_path}' has {len(embeddings)} rows but the KG has {len(entity_mask)} entities.")
+    rows = np.flatnonzero(entity_mask)
+    if output_path.endswith(".npy"):
+        out = np.lib.format.open_memmap(output_path, mode='w+', dtype=embeddings.dtype,
+                                        shape=(len(rows), embeddings.shape[1]))
+        for start in range(0, len(rows), chunk_rows):
+            out[start:start + chunk_rows] = embeddings[rows[start:start + chunk_rows]]
+        out.flush()
+        del out
+    else:
+        import torch
+        torch.save(torch.from_numpy(np.ascontiguousarray(embeddings[rows])), output_path)
+    print(f"Remapped embeddings ({len(rows)} of {len(embeddings)} rows) saved to {output_path}.")
+
+
+def compact_kg(kg_dir, output_dir, data_dir, splits=SPLITS, min_degree=2, min_relation_count=5, max_hops=2,
+               drop_relations=(), embedding_path=None, output_embedding_path=None, dim=128):
+    """
+    剪枝并压缩 KG，写出到 output_dir（文本格式与二进制 store）。
+
+    保留的实体和关系按原 ID 顺序重新连续编号；output_dir 下的 id_map.npy / relation_id_map.npy
+    给出旧 ID -> 新 ID（被删除的为 -1），compact.json 记录参数和前后统计。
+    给出 embedding_path 时同时把已训练的 embedding 按新 ID 重排，不必重新训练。
+    """
+    if os.path.abspath(kg_dir) == os.path.abspath(output_dir):
+        raise ValueError("output_dir must differ from kg_dir; the compacted KG is written to a new directory.")
+    kg = open_kg(kg_dir)
+    if embedding_path:
+        from ann_index import load_embeddings
+        embeddings = load_embeddings(embedding_path)
+        if len(embeddings) != kg.num_entities:
+            raise ValueError(f"'{embedding_path}' has {len(embeddings)} rows but the KG has {kg.num_entities} entities.")
+        dim = embeddings.shape[1]
+        del embeddings
+    seeds = load_seed_entities(data_dir, splits)
+    seed_ids = np.array([i for i in (kg.entity_id(name) for name in seeds) if i is not None], dtype=np.int64)
+    seed_mask = np.zeros(kg.num_entities, dtype=bool)
+    seed_mask[seed_ids] = True
+    print(f"{len(seed_ids)} of {len(seeds)} entities referenced by the dataset are in the KG.")
+
+    relation_to_id = {name: i for i, name in enumerate(kg.relation_names)}
+    drop_ids = [relation_to_id[name] for name in drop_relations if name in relation_to_id]
+    triplets = np.asarray(kg.triplets, dtype=np.int64)
+    entity_mask, edge_mask = prune_kg(triplets, kg.num_entities, kg.num_relations, seed_mask,
+                                      min_degree=min_degree, min_relation_count=min_relation_count,
+                                      max_hops=max_hops, drop_relations=drop_ids)
+
+    kept = triplets[edge_mask]
+    id_map = np.full(kg.num_entities, -1, dtype=np.int64)
+    id_map[entity_mask] = np.arange(int(entity_mask.sum()))
+    relation_mask = np.zeros(kg.num_relations, dtype=bool)
+    relation_mask[kept[:, 2]] = True
+    relation_id_map = np.full(kg.num_relations, -1, dtype=np.int64)
+    relation_id_map[relation_mask] = np.arange(int(relation_mask.sum()))
+    new_triplets = np.stack([id_map[kept[:, 0]], id_map[kept[:, 1]], relation_id_map[kept[:, 2]]], axis=1)
+
+    entity_names = kg.entity_names()
+    new_entity_names = [entity_names[i] for i in np.flatnonzero(entity_mask)]
+    new_relation_names = [kg.relation_names[i] for i in np.flatnonzero(relation_mask)]
+    write_text_kg(output_dir, new_entity_names, new_relation_names, new_triplets)
+    write_kg_store(output_dir, new_entity_names, new_relation_names, new_triplets)
+    np.save(os.path.join(output_dir, "id_map.npy"), id_map)
+    np.save(os.path.join(output_dir, "relation_id_map.npy"), relation_id_map)
+
+    before = _stats(kg.num_entities, kg.num_relations, triplets, seed_mask, dim)
+    after = _stats(len(new_entity_names), len(new_relation_names), new_triplets, seed_mask[entity_mask], dim)
+    with open(os.path.join(output_dir, COMPACT_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump({
+            "source": os.path.abspath(kg_dir),
+            "min_degree": min_degree, "min_relation_count": min_relation_count, "max_hops": max_hops,
+            "drop_relations": list(drop_relations),
+            "before": before, "after": after,
+        }, f, indent=2)
+
+    print(f"\n{'':<16}{'before':>14}{'after':>14}{'ratio':>9}")
+    for key in ("entities", "relations", "triplets", "seed_entities", "isolated_seeds", "mean_degree", "embedding_mb"):
+        b, a = before[key], after[key]
+        ratio = f"{b / a:8.2f}x" if a else f"{'-':>9}"
+        print(f"{key:<16}{b:>14.6g}{a:>14.6g}{ratio}")
+
+    if embedding_path:
+        remap_embeddings(embedding_path, entity_mask, output_embedding_path)
+    return before, after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Prune a KG to the part connected to the dataset's linked entities and renumber it densely.")
+    parser.add_argument("--kg_dir", default="./final_enriched_kg")
+    parser.add_argument("--output_dir", default="./final_enriched_kg_compact")
+    parser.add_argument("--data_dir", default="../dataset/KGWebOfScience")
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS))
+    parser.add_argument("--min_degree", type=int, default=2, help="非种子实体的最小度数（迭代剪枝）")
+    parser.add_argument("--min_relation_count", type=int, default=5, help="出现次数更少的关系整体删除")
+    parser.add_argument("--max_hops", type=int, default=2, help="与种子实体的最大跳数；-1 表示保留整个连通分量")
+    parser.add_argument("--drop_relations", nargs="*", default=[])
+    parser.add_argument("--embedding", default=None, help="可选，把已训练的 embedding 按新 ID 重排")
+    parser.add_argument("--output_embedding", default=None)
+    args = parser.parse_args()
+
+    output_embedding = args.output_embedding
+    if args.embedding and not output_embedding:
+        stem, ext = os.path.splitext(args.embedding)
+        output_embedding = f"{stem}_compact{ext}"
+    compact_kg(args.kg_dir, args.output_dir, args.data_dir, args.splits, args.min_degree, args.min_relation_count,
+               None if args.max_hops < 0 else args.max_hops, args.drop_relations, args.embedding, output_embedding)
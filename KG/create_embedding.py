@@ -4,35 +4,75 @@ from torch_geometric.nn.kge import RotatE # 1. 导入 RotatE
 from tqdm import tqdm
 import os
 import numpy as np
-
-# 设置使用的GPU
-os.environ['CUDA_VISIBLE_DEVICES']='5' 
+from kg_store import open_kg
+from kge_eval import split_triplets, degree_alias_table, rotate_loss, FilterIndex, RotatEEvaluator
 
 def load_kg_data(data_dir):
-    with open(os.path.join(data_dir, 'entity2id.txt'), 'r') as f:
-        num_nodes = int(f.readline().strip())
-    with open(os.path.join(data_dir, 'relation2id.txt'), 'r') as f:
-        num_relations = int(f.readline().strip())
+    kg = open_kg(data_dir)
+    num_nodes = kg.num_entities
+    num_relations = kg.num_relations
         
-    # 加载三元组，假设是 (h, t, r) 格式
-    triplets_htr = np.loadtxt(os.path.join(data_dir, 'train2id.txt'), dtype=np.int64, skiprows=1)
-    # 转换为 PyG 需要的 (h, r, t) 格式
-    triplets_hrt = triplets_htr[:, [0, 2, 1]] 
-    
-    head_index = torch.from_numpy(triplets_hrt[:, 0])
-    relation_type = torch.from_numpy(triplets_hrt[:, 1])
-    tail_index = torch.from_numpy(triplets_hrt[:, 2])
+    # 加载三元组 (h, t, r)，二进制存储直接 memory-map
+    triplets_htr = np.asarray(kg.triplets, dtype=np.int64)
 
-    print(f"Loaded {num_nodes} entities, {num_relations} relations, and {len(head_index)} triplets.")
+    print(f"Loaded {num_nodes} entities, {num_relations} relations, and {len(triplets_htr)} triplets.")
     
-    return num_nodes, num_relations, head_index, relation_type, tail_index
+    return num_nodes, num_relations, triplets_htr
+
+
+def to_hrt_tensors(triplets_htr):
+    # 转换为 PyG 需要的 (h, r, t) 格式
+    triplets_htr = np.ascontiguousarray(triplets_htr)
+    return (torch.from_numpy(triplets_htr[:, 0].copy()), torch.from_numpy(triplets_htr[:, 2].copy()),
+            torch.from_numpy(triplets_htr[:, 1].copy()))
+
+
+def train_epoch(model, optimizer, head_index, relation_type, tail_index, batch_size, sampler, rng, device, desc):
+    model.train()
+    total_loss = 0
+    loader = model.loader(
+        head_index=head_index.to(device),
+        rel_type=relation_type.to(device),
+        tail_index=tail_index.to(device),
+        batch_size=batch_size,
+        shuffle=True,
+    )
+    pbar = tqdm(loader, desc=desc)
+    for head, rel, tail in pbar:
+        optimizer.zero_grad()
+        loss = rotate_loss(model, head, rel, tail, sampler, rng)
+        loss.backward()
+        optimizer.step()
+        total_loss += loss.item()
+        pbar.set_postfix({'loss': f'{loss.item():.4f}'})
+    return total_loss / len(loader)
 
 
-def train_embeddings_with_pyg(data_dir, embedding_dim=768, epochs=500, lr=0.001, batch_size=2048, checkpoint_interval=10):
+def train_embeddings_with_pyg(data_dir, embedding_dim=768, epochs=500, lr=0.001, batch_size=2048, checkpoint_interval=10,
+                              valid_frac=0.01, test_frac=0.01, max_valid_triplets=5000, patience=3,
+                              negative_sampling="degree", degree_power=1.0, seed=0, final_refit=True):
+    """
+    每 checkpoint_interval 个 epoch 在验证集上计算 filtered MRR，按 MRR 保存最优模型；
+    连续 patience 次评估没有提升时提前停止。训练结束后报告测试集上的 filtered MRR / Hits@k。
+
+    final_refit=True 时验证只用来选 epoch 数：评估完成后重新初始化模型，在全部三元组（含验证/测试集）上
+    训练同样多的 epoch，保存的 embedding 来自这个模型，不会缺少留出的边；False 时保存验证集上最优的模型。
+
+    negative_sampling: "degree" 按实体度数（alias 表）采样负样本，"uniform" 为 PyG 默认的均匀采样。
+    """
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     print(f"Using device: {device}")
 
-    num_nodes, num_relations, head_index, relation_type, tail_index = load_kg_data(data_dir)
+    num_nodes, num_relations, triplets_htr = load_kg_data(data_dir)
+    train_htr, valid_htr, test_htr = split_triplets(triplets_htr, valid_frac, test_frac, seed=seed)
+    if len(valid_htr) > max_valid_triplets:
+        valid_htr = valid_htr[np.random.default_rng(seed).choice(len(valid_htr), max_valid_triplets, replace=False)]
+    print(f"Split: {len(train_htr)} train, {len(valid_htr)} valid, {len(test_htr)} test triplets.")
+    head_index, relation_type, tail_index = to_hrt_tensors(train_htr)
+
+    rng = np.random.default_rng(seed)
+    sampler = degree_alias_table(num_nodes, train_htr, power=degree_power) if negative_sampling == "degree" else None
+
     model = RotatE(
         num_nodes=num_nodes,
         num_relations=num_relations,
@@ -40,43 +80,37 @@ def train_embeddings_with_pyg(data_dir, embedding_dim=768, epochs=500, lr=0.001,
     ).to(device)
     print(f"Using RotatE model with embedding dimension: {embedding_dim} (hidden_channels={embedding_dim//2})")
     optimizer = optim.Adam(model.parameters(), lr=lr)
+    # 过滤集合包含全部已知三元组（train + valid + test）
+    evaluator = RotatEEvaluator(model, FilterIndex(triplets_htr, num_nodes, num_relations))
     
-    best_loss = float('inf')
+    best_mrr = -1.0
+    best_epoch = epochs
+    bad_evals = 0
 
     for epoch in range(1, epochs + 1):
-        model.train()
-        total_loss = 0
-        
-        loader = model.loader(
-            head_index=head_index.to(device),
-            rel_type=relation_type.to(device),
-            tail_index=tail_index.to(device),
-            batch_size=batch_size,
-            shuffle=True,
-        )
-        
-        pbar = tqdm(loader, desc=f"Epoch {epoch}/{epochs}")
-        for head, rel, tail in pbar:
-            optimizer.zero_grad()
-            loss = model.loss(head, rel, tail)
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
-            pbar.set_postfix({'loss': f'{loss.item():.4f}'})
-
-        avg_loss = total_loss / len(loader)
-        print(f"Epoch {epoch}/{epochs}, Average Loss: {avg_loss:.4f}, Best Loss: {best_loss:.4f}")
+        avg_loss = train_epoch(model, optimizer, head_index, relation_type, tail_index, batch_size, sampler, rng,
+                               device, desc=f"Epoch {epoch}/{epochs}")
+        print(f"Epoch {epoch}/{epochs}, Average Loss: {avg_loss:.4f}, Best Valid MRR: {best_mrr:.4f}")
         
         if epoch % checkpoint_interval == 0:
-            if avg_loss < best_loss:
-                print(f"Loss improved from {best_loss:.4f} to {avg_loss:.4f}. Saving model...")
-                best_loss = avg_loss
+            model.eval()
+            metrics = evaluator.evaluate(valid_htr)
+            print(f"Validation: " + ", ".join(f"{k}={v:.4f}" for k, v in metrics.items()))
+            if metrics["mrr"] > best_mrr:
+                print(f"Valid MRR improved from {best_mrr:.4f} to {metrics['mrr']:.4f}. Saving model...")
+                best_mrr = metrics["mrr"]
+                best_epoch = epoch
+                bad_evals = 0
                 
                 # 4. 修改保存的文件名
                 torch.save(model.state_dict(), "best_model_rotate.pt")
                 print("Model state_dict saved to best_model_rotate.pt")
             else:
-                print(f"Loss did not improve from {best_loss:.4f}. Not saving.")
+                bad_evals += 1
+                print(f"Valid MRR did not improve from {best_mrr:.4f} ({bad_evals}/{patience}). Not saving.")
+                if bad_evals >= patience:
+                    print(f"Early stopping at epoch {epoch}.")
+                    break
     best_model_path = "best_model_rotate.pt"
     print(f"\nTraining finished. Loading best model from {best_model_path} to save final embeddings...")
     
@@ -87,9 +121,24 @@ def train_embeddings_with_pyg(data_dir, embedding_dim=768, epochs=500, lr=0.001,
         print("No best model was saved during training. Saving the final model instead.")
         
     model.eval()
+    if len(test_htr):
+        metrics = evaluator.evaluate(test_htr)
+        print(f"Test: " + ", ".join(f"{k}={v:.4f}" for k, v in metrics.items()))
+
+    if final_refit:
+        print(f"\nRefitting on all {len(triplets_htr)} triplets for {best_epoch} epochs (best validation epoch)...")
+        head_index, relation_type, tail_index = to_hrt_tensors(triplets_htr)
+        sampler = degree_alias_table(num_nodes, triplets_htr, power=degree_power) if negative_sampling == "degree" else None
+        model.reset_parameters()
+        optimizer = optim.Adam(model.parameters(), lr=lr)
+        for epoch in range(1, best_epoch + 1):
+            avg_loss = train_epoch(model, optimizer, head_index, relation_type, tail_index, batch_size, sampler, rng,
+                                   device, desc=f"Refit epoch {epoch}/{best_epoch}")
+            print(f"Refit epoch {epoch}/{best_epoch}, Average Loss: {avg_loss:.4f}")
+        model.eval()
     entity_embeddings = model.node_emb.weight.data.cpu()
     torch.save(entity_embeddings, "entity_embeddings_rotate.pt")
-    print(f"Entity embeddings from the best model saved to entity_embeddings_rotate.pt. Shape: {entity_embeddings.shape}")
+    print(f"Entity embeddings from the {'refit' if final_refit else 'best'} model saved to entity_embeddings_rotate.pt. Shape: {entity_embeddings.shape}")
 
     relation_embeddings = model.rel_emb.weight.data.cpu()
     torch.save(relation_embeddings, "relation_embeddings_rotate.pt")
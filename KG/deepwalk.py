@@ -1,53 +1,153 @@
+import argparse
+import json
 import os
-os.environ['CUDA_VISIBLE_DEVICES']='5' 
 import torch
 
 from torch_geometric.nn import Node2Vec
 from torch_geometric.data import Data
 import numpy as np
 from tqdm import tqdm
+from kg_store import open_kg
+from random_walk import CSRGraph, WalkLoader, PrecomputedWalkLoader, precompute_walks
+from mmap_embedding import MmapEmbeddingTable
+
+EPS = 1e-15
 
 def load_edge_index(data_dir):
 
-    with open(os.path.join(data_dir, 'entity2id.txt'), 'r') as f:
-        num_nodes = int(f.readline().strip())
+    kg = open_kg(data_dir)
+    num_nodes = kg.num_entities
         
     print(f"Total number of nodes (entities): {num_nodes}")
     
-    triplets = np.loadtxt(os.path.join(data_dir, 'train2id.txt'), dtype=np.int64, skiprows=1)
-    
-    head_nodes = triplets[:, 0]
-    tail_nodes = triplets[:, 1]
+    head_nodes = np.asarray(kg.heads, dtype=np.int64)
+    tail_nodes = np.asarray(kg.tails, dtype=np.int64)
 
-    edge_index_forward = torch.tensor([head_nodes, tail_nodes], dtype=torch.long)
-    edge_index_backward = torch.tensor([tail_nodes, head_nodes], dtype=torch.long)
+    edge_index_forward = torch.from_numpy(np.stack([head_nodes, tail_nodes]))
+    edge_index_backward = torch.from_numpy(np.stack([tail_nodes, head_nodes]))
     edge_index = torch.cat([edge_index_forward, edge_index_backward], dim=1)
     
     print(f"Created edge_index with {edge_index.shape[1]} edges (bidirectional).")
     
     return num_nodes, edge_index
 
-def train_with_deepwalk(data_dir, embedding_dim=768, walk_length=80, context_size=10, walks_per_node=10, epochs=5, batch_size=128, lr=0.01):
+def walk_loss(lookup, rw, positive, embedding_dim):
+    """Node2Vec 的 skip-gram loss（与 torch_geometric 实现一致）；lookup 把节点下标映射为 embedding。"""
+    start, rest = rw[:, 0], rw[:, 1:].contiguous()
+    h_start = lookup(start).view(rw.size(0), 1, embedding_dim)
+    h_rest = lookup(rest.view(-1)).view(rw.size(0), -1, embedding_dim)
+    out = (h_start * h_rest).sum(dim=-1).view(-1)
+    prob = torch.sigmoid(out) if positive else 1 - torch.sigmoid(out)
+    return -torch.log(prob + EPS).mean()
+
+
+class SkipGram(torch.nn.Module):
+    """Node2Vec 的 embedding 与 loss，游走由 random_walk 提供，不依赖 torch-cluster。"""
+
+    def __init__(self, num_nodes, embedding_dim, sparse=True):
+        super().__init__()
+        self.embedding_dim = embedding_dim
+        self.embedding = torch.nn.Embedding(num_nodes, embedding_dim, sparse=sparse)
+        self.embedding.reset_parameters()
+
+    def forward(self):
+        return self.embedding.weight
+
+    def loss(self, pos_rw, neg_rw):
+        return (walk_loss(self.embedding, pos_rw, True, self.embedding_dim)
+                + walk_loss(self.embedding, neg_rw, False, self.embedding_dim))
+
+
+def walks_meta_path(walks_path):
+    return os.path.splitext(walks_path)[0] + ".meta.json"
+
+
+def _walks_meta(graph, walk_length, walks_per_node, p, q, seed):
+    # CSR 缓存随 KG store 重建（包括 incremental_kg 追加）而重写，其 meta.json 的 mtime 即 KG 版本
+    csr_meta = os.path.join(graph.csr_dir, "meta.json") if graph.csr_dir else None
+    return {
+        "num_nodes": int(graph.num_nodes),
+        "num_edges": int(len(graph.indices)),
+        "kg_version": os.stat(csr_meta).st_mtime_ns if csr_meta and os.path.exists(csr_meta) else None,
+        "walk_length": walk_length,
+        "walks_per_node": walks_per_node,
+        "p": p,
+        "q": q,
+        "seed": seed,
+    }
+
+
+def build_walk_loader(graph, walk_length, context_size, walks_per_node, batch_size, p=1.0, q=1.0, walks_path=None,
+                      num_workers=4, seed=0):
+    """
+    native 游走引擎的 loader；指定 walks_path 时把全部游走预先写入该 .npy（memory-map）。
+
+    已有的游走只有在 <walks>.meta.json 记录的图规模、KG 版本和游走参数都与本次一致时才复用，否则重新生成。
+    预计算的游走在每个 epoch 重复使用（只打乱顺序）；不指定 walks_path 时 WalkLoader 每个 epoch 流式生成新的游走。
+    """
+    if walks_path:
+        meta = _walks_meta(graph, walk_length, walks_per_node, p, q, seed)
+        meta_path = walks_meta_path(walks_path)
+        cached = None
+        if os.path.exists(walks_path) and os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        if cached != meta:
+            if os.path.exists(walks_path):
+                print(f"Walks in {walks_path} were generated for a different KG or walk parameters, regenerating...")
+            else:
+                print(f"Precomputing {walks_per_node} walks per node to {walks_path}...")
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            precompute_walks(graph, walks_path, walk_length, walks_per_node, p=p, q=q,
+                             num_workers=num_workers, seed=seed)
+            with open(meta_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2)
+            os.replace(meta_path + ".tmp", meta_path)
+        return PrecomputedWalkLoader(walks_path, graph.num_nodes, context_size, num_negative_samples=1,
+                                     batch_size=batch_size, shuffle=True, seed=seed)
+    return WalkLoader(graph, walk_length, context_size, walks_per_node=walks_per_node, num_negative_samples=1,
+                      p=p, q=q, batch_size=batch_size, shuffle=True, num_workers=num_workers, seed=seed)
+
+
+def train_with_deepwalk(data_dir, embedding_dim=768, walk_length=80, context_size=10, walks_per_node=10, epochs=5,
+                        batch_size=128, lr=0.01, p=1.0, q=1.0, walk_engine="native", walks_path=None, num_workers=4,
+                        seed=0):
+    """
+    walk_engine:
+        "native"  random_walk.py 的 CSR 游走（多进程、向量化，p/q != 1 时为 node2vec 有偏游走）
+        "pyg"     torch_geometric Node2Vec 自带的 loader（需要 torch-cluster）
+    walks_path: 仅 native 有效；指定后把全部游走预先写入该 .npy（memory-map），参数与 KG 未变时直接复用。
+    """
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     print(f"Using device: {device}")
 
-    num_nodes, edge_index = load_edge_index(data_dir)
-
-    model = Node2Vec(
-        num_nodes=num_nodes,
-        edge_index=edge_index,
-        embedding_dim=embedding_dim,
-        walk_length=walk_length,       
-        context_size=context_size,     
-        walks_per_node=walks_per_node, 
-        p=1.0,                         
-        q=1.0,                         
-        num_negative_samples=1,        
-        sparse=True,                 
-    ).to(device)
-    
-    print("DeepWalk (Node2Vec p=1, q=1) model created.")
-    loader = model.loader(batch_size=batch_size, shuffle=True, num_workers=4)
+    if walk_engine == "pyg":
+        num_nodes, edge_index = load_edge_index(data_dir)
+        model = Node2Vec(
+            num_nodes=num_nodes,
+            edge_index=edge_index,
+            embedding_dim=embedding_dim,
+            walk_length=walk_length,
+            context_size=context_size,
+            walks_per_node=walks_per_node,
+            p=p,
+            q=q,
+            num_negative_samples=1,
+            sparse=True,
+        ).to(device)
+        loader = model.loader(batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    elif walk_engine == "native":
+        graph = CSRGraph.from_kg(data_dir)
+        num_nodes = graph.num_nodes
+        print(f"Total number of nodes (entities): {num_nodes}, CSR edges (bidirectional): {len(graph.indices)}")
+        model = SkipGram(num_nodes, embedding_dim, sparse=True).to(device)
+        loader = build_walk_loader(graph, walk_length, context_size, walks_per_node, batch_size, p=p, q=q,
+                                   walks_path=walks_path, num_workers=num_workers, seed=seed)
+    else:
+        raise ValueError(f"Unknown walk_engine: {walk_engine}")
+
+    print(f"DeepWalk (Node2Vec p={p}, q={q}) model created, walk engine: {walk_engine}.")
     optimizer = torch.optim.SparseAdam(list(model.parameters()), lr=lr)
 
     def train_epoch():
@@ -76,15 +176,119 @@ def train_with_deepwalk(data_dir, embedding_dim=768, walk_length=80, context_siz
     print(f"Node embeddings saved to {output_filename}. Shape: {all_embeddings.shape}")
 
 
+def train_table_epoch(table, loader, lr, embedding_dim, device, trainable=None):
+    """
+    在 MmapEmbeddingTable 上训练一个 epoch：每个 batch 只 gather 游走中出现的行到 device 上求梯度，
+    再用逐行 Adagrad 写回。trainable 为布尔数组时只更新其为 True 的行，其余行作为固定的上下文。
+    """
+    total_loss = 0
+    pbar = tqdm(loader, desc="Training Epoch")
+    for pos_rw, neg_rw in pbar:
+        pos_rw, neg_rw = pos_rw.numpy(), neg_rw.numpy()
+        rows, local = np.unique(np.concatenate([pos_rw.ravel(), neg_rw.ravel()]), return_inverse=True)
+        local = torch.from_numpy(local.reshape(-1).astype(np.int64)).to(device)
+        pos_local = local[:pos_rw.size].view(pos_rw.shape)
+        neg_local = local[pos_rw.size:].view(neg_rw.shape)
+
+        weights = torch.from_numpy(table.gather(rows)).to(device).requires_grad_()
+        lookup = lambda idx: weights[idx]
+        loss = (walk_loss(lookup, pos_local, True, embedding_dim)
+                + walk_loss(lookup, neg_local, False, embedding_dim))
+        loss.backward()
+        grads = weights.grad.cpu().numpy()
+        if trainable is not None:
+            keep = trainable[rows]
+            rows, grads = rows[keep], grads[keep]
+        if len(rows):
+            table.adagrad_update(rows, grads, lr)
+
+        total_loss += loss.item()
+        pbar.set_postfix({'loss': f'{loss.item():.4f}', 'rows': len(rows)})
+    table.flush()
+    return total_loss / len(loader)
+
+
+def train_with_deepwalk_out_of_core(data_dir, output_path="deepwalk.npy", embedding_dim=768, walk_length=80,
+                                    context_size=10, walks_per_node=10, epochs=5, batch_size=128, lr=0.1, p=1.0,
+                                    q=1.0, walks_path=None, num_workers=4, seed=0, resume=True):
+    """
+    embedding 表放在 output_path 的 memory-map .npy 中，不整表载入内存，适合百万级节点的 KG。
+
+    每个 batch 只 gather 游走中出现的行到 device 上求梯度，再用逐行 Adagrad 写回 mmap；
+    训练结束时 output_path 即为最终的 (num_nodes, embedding_dim) float32 embedding。
+    resume=True 时从已有的 output_path（及其 Adagrad 状态）继续训练。
+    """
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    print(f"Using device: {device}")
+
+    graph = CSRGraph.from_kg(data_dir)
+    num_nodes = graph.num_nodes
+    print(f"Total number of nodes (entities): {num_nodes}, CSR edges (bidirectional): {len(graph.indices)}")
+    table = MmapEmbeddingTable(output_path, num_nodes, embedding_dim, resume=resume, seed=seed)
+    loader = build_walk_loader(graph, walk_length, context_size, walks_per_node, batch_size, p=p, q=q,
+                               walks_path=walks_path, num_workers=num_workers, seed=seed)
+
+    print("\nStarting out-of-core training...")
+    for epoch in range(1, epochs + 1):
+        loss = train_table_epoch(table, loader, lr, embedding_dim, device)
+        print(f'Epoch: {epoch:02d}, Loss: {loss:.4f}')
+    table.flush()
+    print(f"Node embeddings written to {output_path}. Shape: {table.weights.shape}")
+
+
 if __name__ == "__main__":
-    kg_data_directory = "./final_enriched_kg" 
-    train_with_deepwalk(
-        data_dir=kg_data_directory,
-        embedding_dim=768,      
-        walk_length=80,         
-        context_size=10,       
-        walks_per_node=100,     
-        epochs=5,
-        batch_size=8,
-        lr=0.005
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser("Train DeepWalk / node2vec node embeddings on the KG.")
+    parser.add_argument("--data_dir", default="./final_enriched_kg")
+    parser.add_argument("--embedding_dim", type=int, default=768)
+    parser.add_argument("--walk_length", type=int, default=80)
+    parser.add_argument("--context_size", type=int, default=10)
+    parser.add_argument("--walks_per_node", type=int, default=100)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--lr", type=float, default=None, help="默认 0.005，--out_of_core 时为 0.1")
+    parser.add_argument("--p", type=float, default=1.0)
+    parser.add_argument("--q", type=float, default=1.0)
+    parser.add_argument("--walk_engine", choices=["native", "pyg"], default="native")
+    parser.add_argument("--walks_path", default=None,
+                        help="把全部游走预先写入该 .npy 并在各 epoch 复用（占用 walks_per_node * 节点数 * (walk_length + 1) 个整数）；"
+                             "默认每个 epoch 流式生成新的游走")
+    # 节点数过多、embedding 表放不进内存时使用，结果写到 --output（memory-map .npy）
+    parser.add_argument("--out_of_core", action="store_true")
+    parser.add_argument("--output", default="deepwalk.npy", help="--out_of_core 的输出")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.out_of_core:
+        train_with_deepwalk_out_of_core(
+            data_dir=args.data_dir,
+            output_path=args.output,
+            embedding_dim=args.embedding_dim,
+            walk_length=args.walk_length,
+            context_size=args.context_size,
+            walks_per_node=args.walks_per_node,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            lr=args.lr if args.lr is not None else 0.1,
+            p=args.p,
+            q=args.q,
+            walks_path=args.walks_path,
+            num_workers=args.num_workers,
+            seed=args.seed,
+        )
+    else:
+        train_with_deepwalk(
+            data_dir=args.data_dir,
+            embedding_dim=args.embedding_dim,
+            walk_length=args.walk_length,
+            context_size=args.context_size,
+            walks_per_node=args.walks_per_node,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            lr=args.lr if args.lr is not None else 0.005,
+            p=args.p,
+            q=args.q,
+            walk_engine=args.walk_engine,
+            walks_path=args.walks_path,
+            num_workers=args.num_workers,
+            seed=args.seed,
+        )
@@ -0,0 +1,417 @@
+import argparse
+import json
+import os
+import pickle
+import time
+from collections import deque
+
+ENTITY_TYPE_MAPPING = {
+    "Person": ["professor", "scientist", "student", "author", "researcher"],
+    "Organization": ["university", "institute", "company", "lab", "department"],
+    "Location": ["china", "germany", "hospital", "center", "beijing"],
+    "Technology": ["deep learning", "cnn", "transformer", "wireless sensor", "mri", "algorithm", "blockchain"],
+    "Medical": ["diabetes", "cancer", "brain", "liver", "antibody", "virus", "therapy", "alzheimer", "epilepsy"],
+    "Biological": ["bacteria", "protein", "enzyme", "mouse", "dna", "gene"],
+    "Abstract": ["intelligence", "emotion", "consciousness", "freedom"],
+    "Product": ["iphone", "mri machine", "vaccine"],
+    "Event": ["covid-19", "earthquake", "war"],
+}
+
+# UMLS 中有大量与常用词同形的别名（如 "All"、"Was"），直接匹配会产生很多误链
+DEFAULT_STOP_ALIASES = frozenset("""
+a an and are as at be but by can could did do does for from had has have he her his how if in into is it its may
+might more most no not of on or our out over she should so some such than that the their them then there these they
+this those to too under up use used using very was we were what when where which while who why will with would you
+all any both each few many much one two three other same own only just also well new old high low large small
+""".split())
+
+
+class AhoCorasick:
+    """
+    纯 Python 的 Aho-Corasick 自动机：一次扫描找出文本中所有词典模式的出现位置，耗时与模式数量无关。
+
+    goto[node] 为字符 -> 子节点的 dict；fail 为失配指针；value[node] 为以该节点结尾的模式所带的值，
+    out_link[node] 指向沿失配链最近的、有值的节点，用于枚举同一位置结尾的所有较短模式。
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.value = [None]
+        self.depth = [0]
+        self.out_link = [0]
+
+    def add(self, pattern, value):
+        """插入模式；同一模式重复插入时保留第一次的值。返回是否为新模式。"""
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.value.append(None)
+                self.depth.append(self.depth[node] + 1)
+                self.out_link.append(0)
+            node = nxt
+        if self.value[node] is not None:
+            return False
+        self.value[node] = value
+        return True
+
+    def _node(self, pattern):
+        node = 0
+        for ch in pattern:
+            node = self.goto[node].get(ch)
+            if node is None:
+                return None
+        return node
+
+    def get(self, pattern, default=None):
+        node = self._node(pattern)
+        return default if node is None or self.value[node] is None else self.value[node]
+
+    def set(self, pattern, value):
+        """覆盖已有模式的值（模式必须已经 add 过）。"""
+        self.value[self._node(pattern)] = value
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                f = self.fail[child]
+                self.out_link[child] = f if self.value[f] is not None else self.out_link[f]
+
+    def iter(self, text):
+        """Yields: (start, end, value)，text[start:end] 为匹配到的模式。"""
+        goto, fail, value, depth, out_link = self.goto, self.fail, self.value, self.depth, self.out_link
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if value[node] is not None else out_link[node]
+            while hit:
+                yield i + 1 - depth[hit], i + 1, value[hit]
+                hit = out_link[hit]
+
+
+class TypeKeywordMatcher:
+    """
+    把类型关键词表编译成一个自动机，结果与逐类型、逐关键词做子串判断完全一致：
+    返回关键词表中第一个有关键词出现在实体文本里的类型。
+    """
+
+    def __init__(self, mapping=ENTITY_TYPE_MAPPING):
+        self.types = list(mapping)
+        self.automaton = AhoCorasick()
+        # 多个类型共用的关键词保留排在前面的类型
+        for rank, keywords in enumerate(mapping.values()):
+            for keyword in keywords:
+                self.automaton.add(keyword, rank)
+        self.automaton.build()
+
+    def guess(self, entity_text):
+        ranks = [rank for _, _, rank in self.automaton.iter(entity_text.lower())]
+        return self.types[min(ranks)] if ranks else "Unknown"
+
+
+def iter_umls_aliases(mrconso_path, sources=None, language="ENG"):
+    """
+    读取 MRCONSO.RRF（CUI|LAT|TS|LUI|STT|SUI|ISPREF|AUI|SAUI|SCUI|SDUI|SAB|TTY|CODE|STR|SRL|SUPPRESS|CVF），
+    只取 language 语言、未被抑制的字符串；sources 可限定词表（如 MSH）。
+
+    Yields:
+        (cui, text, preferred): preferred 表示该字符串是概念的首选名
+    """
+    from tqdm import tqdm
+    with open(mrconso_path, 'r', encoding='utf-8') as f:
+        for line in tqdm(f, desc="Loading MRCONSO.RRF"):
+            parts = line.rstrip('\n').split('|')
+            if len(parts) < 17 or parts[1] != language or parts[16] not in ('N', ''):
+                continue
+            if sources and parts[11] not in sources:
+                continue
+            yield parts[0], parts[14], parts[2] == 'P' and parts[4] == 'PF' and parts[6] == 'Y'
+
+
+def iter_wikidata_aliases(alias_path):
+    """
+    读取 Wikidata 别名表（TSV，每行: QID<TAB>label<TAB>alias1|alias2|...<TAB>description，后两列可省略）。
+
+    Yields:
+        (qid, label, aliases, description)
+    """
+    with open(alias_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) < 2 or not parts[0].startswith('Q'):
+                continue
+            aliases = parts[2].split('|') if len(parts) > 2 and parts[2] else []
+            description = parts[3] if len(parts) > 3 and parts[3] else "N/A"
+            yield parts[0], parts[1], aliases, description
+
+
+def _is_boundary(text, index):
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+class DictionaryLinker:
+    """
+    基于别名词典的实体链接：UMLS (MRCONSO.RRF) 和 Wikidata 别名表编译成一个 Aho-Corasick 自动机，
+    每篇文档扫描一遍即可同时完成实体识别和链接，输出与 linker.py 相同的 linked_entities 结构。
+
+    匹配不区分大小写，只接受两端都在词边界上的匹配，重叠时取最左、最长的一个。
+    """
+
+    def __init__(self, min_alias_length=3, stop_aliases=DEFAULT_STOP_ALIASES, type_mapping=ENTITY_TYPE_MAPPING):
+        self.automaton = AhoCorasick()
+        self.min_alias_length = min_alias_length
+        self.stop_aliases = stop_aliases
+        self.entity_ids = []
+        self.entity_names = []
+        self.entity_descriptions = []
+        self.entity_sources = []
+        self._entity_index = {}
+        self._preferred = set()
+        self.num_aliases = 0
+        self.types = TypeKeywordMatcher(type_mapping)
+        # build_dictionary_linker 写入：构建所用的词典文件与参数，用于判断缓存是否过期
+        self.source_meta = None
+
+    def _entity(self, entity_id, name, description, source):
+        key = (source, entity_id)
+        index = self._entity_index.get(key)
+        if index is None:
+            index = len(self.entity_ids)
+            self._entity_index[key] = index
+            self.entity_ids.append(entity_id)
+            self.entity_names.append(name)
+            self.entity_descriptions.append(description)
+            self.entity_sources.append(source)
+        elif name and not self.entity_names[index]:
+            self.entity_names[index] = name
+        return index
+
+    def add_alias(self, alias, entity_index, preferred=False):
+        """
+        别名冲突时先加入的来源优先；同一来源内，作为某实体首选名的别名可以覆盖非首选的。
+        """
+        alias = " ".join(alias.lower().split())
+        if len(alias) < self.min_alias_length or alias in self.stop_aliases or alias.replace(' ', '').isdigit():
+            return
+        if self.automaton.add(alias, entity_index):
+            self.num_aliases += 1
+            if preferred:
+                self._preferred.add(alias)
+        elif preferred and alias not in self._preferred:
+            if self.entity_sources[self.automaton.get(alias)] == self.entity_sources[entity_index]:
+                self.automaton.set(alias, entity_index)
+                self._preferred.add(alias)
+
+    def add_umls(self, mrconso_path, sources=None, language="ENG"):
+        for cui, text, preferred in iter_umls_aliases(mrconso_path, sources, language):
+            index = self._entity(cui, text if preferred else "", "N/A", "MeSH/UMLS")
+            self.add_alias(text, index, preferred)
+        for index, name in enumerate(self.entity_names):
+            if not name:
+                self.entity_names[index] = self.entity_ids[index]
+
+    def add_wikidata(self, alias_path):
+        for qid, label, aliases, description in iter_wikidata_aliases(alias_path):
+            index = self._entity(qid, label, description, "Wikidata")
+            self.add_alias(label, index, preferred=True)
+            for alias in aliases:
+                self.add_alias(alias, index)
+
+    def build(self):
+        self.automaton.build()
+        self._entity_index = None
+        self._preferred = None
+        return self
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def find(self, text):
+        """Returns: [(start, end, entity_index), ...]，最左最长、互不重叠，且两端都在词边界上。"""
+        lowered = text.lower()
+        matches = [(s, e, v) for s, e, v in self.automaton.iter(lowered)
+                   if _is_boundary(lowered, s - 1) and _is_boundary(lowered, e)]
+        matches.sort(key=lambda m: (m[0], -m[1]))
+        selected = []
+        last_end = 0
+        for start, end, value in matches:
+            if start >= last_end:
+                selected.append((start, end, value))
+                last_end = end
+        return selected
+
+    def link_text(self, text):
+        """
+        Returns:
+            与 linker.link_documents 相同结构的 linked_entities；同一实体在一篇文档中只保留第一次出现。
+        """
+        linked, seen = [], set()
+        # 别名在匹配前做了空白压缩，这里对文本做同样的处理，保证位置一致
+        text = " ".join(text.split())
+        for start, end, index in self.find(text):
+            if index in seen:
+                continue
+            seen.add(index)
+            original_text = text[start:end]
+            linked.append({
+                "original_text": original_text,
+                "original_type": self.types.guess(original_text),
+                "linked_id": self.entity_ids[index],
+                "linked_name": self.entity_names[index],
+                "linked_description": self.entity_descriptions[index],
+                "link_source": self.entity_sources[index],
+                # 词典精确匹配，与 linker.py 中精确命中的得分相同
+                "link_score": 1.0,
+            })
+        return linked
+
+    def link_item(self, item):
+        """原始语料的一条记录（doc_token / doc_label）-> linker.py 输出格式的一条记录。"""
+        return {
+            "text": item["doc_token"],
+            "label_level_1": item["doc_label"][0],
+            "label_level_2": item["doc_label"][1],
+            "linked_entities": self.link_text(item["doc_token"]),
+        }
+
+
+def _source_meta(mrconso_path, wikidata_aliases_path, umls_sources, min_alias_length):
+    def file_meta(path):
+        if not path:
+            return None
+        stat = os.stat(path)
+        return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    return {
+        "mrconso": file_meta(mrconso_path),
+        "wikidata_aliases": file_meta(wikidata_aliases_path),
+        "umls_sources": sorted(umls_sources) if umls_sources else None,
+        "min_alias_length": min_alias_length,
+    }
+
+
+def build_dictionary_linker(mrconso_path=None, wikidata_aliases_path=None, cache_path=None, umls_sources=None,
+                            min_alias_length=3):
+    """
+    构建（或从 cache_path 读取已编译的）词典链接器；Wikidata 先加入，别名冲突时与 linker.py 一样优先 Wikidata。
+
+    缓存中记录了构建时的词典文件（路径、大小、mtime）与参数，与本次请求不一致时重新构建。
+    """
+    sources = _source_meta(mrconso_path, wikidata_aliases_path, umls_sources, min_alias_length)
+    if cache_path and os.path.exists(cache_path):
+        linker = DictionaryLinker.load(cache_path)
+        if getattr(linker, "source_meta", None) == sources:
+            return linker
+        print(f"'{cache_path}' was built from different dictionaries or parameters, rebuilding...")
+    linker = DictionaryLinker(min_alias_length=min_alias_length)
+    linker.source_meta = sources
+    if wikidata_aliases_path:
+        linker.add_wikidata(wikidata_aliases_path)
+    if mrconso_path:
+        linker.add_umls(mrconso_path, umls_sources)
+    linker.build()
+    print(f"Dictionary linker: {len(linker.entity_ids)} entities, {linker.num_aliases} aliases, "
+          f"{len(linker.automaton.goto)} automaton states.")
+    if cache_path:
+        linker.save(cache_path)
+    return linker
+
+
+def link_file(linker, input_path, output_path, commit_every=1000, resume=True):
+    """流式链接整个语料，输出与 linker.py 相同格式的 JSON Lines（可断点续跑）。"""
+    from tqdm import tqdm
+    from stream_io import ResumableJsonlWriter, iter_jsonl
+
+    start_time = time.time()
+    num_docs = 0
+    with ResumableJsonlWriter(input_path, output_path, resume=resume) as writer:
+        if writer.finished:
+            print(f"'{output_path}' is already complete ({writer.records} records).")
+            return
+        offset = writer.input_offset
+        for offset, item in tqdm(iter_jsonl(input_path, writer.input_offset), desc="Dictionary linking",
+                                 initial=writer.records):
+            writer.write(linker.link_item(item))
+            num_docs += 1
+            if writer.pending >= commit_every:
+                writer.commit(offset)
+        writer.commit(offset, finished=True)
+    elapsed = time.time() - start_time
+    print(f"Linked {num_docs} documents in {elapsed:.1f}s ({num_docs / max(elapsed, 1e-9):.1f} docs/s).")
+
+
+def recall_report(reference_path, candidate_path, sources=("MeSH/UMLS", "Wikidata")):
+    """
+    按行对齐比较两份 linked_entities 输出（如 linker.py 的结果与词典链接的结果）：
+    以 reference 中来源属于 sources 的 linked_id 为基准，统计 candidate 的召回率，以及 candidate 中有多少落在基准里。
+    """
+    totals = {source: [0, 0] for source in sources}
+    found = reference_total = candidate_total = num_docs = 0
+    with open(reference_path, 'r', encoding='utf-8') as f_ref, open(candidate_path, 'r', encoding='utf-8') as f_cand:
+        for ref_line, cand_line in zip(f_ref, f_cand):
+            ref = json.loads(ref_line).get('linked_entities', [])
+            cand = json.loads(cand_line).get('linked_entities', [])
+            num_docs += 1
+            ref_ids = {(e['link_source'], e['linked_id']) for e in ref if e['link_source'] in sources}
+            cand_ids = {(e['link_source'], e['linked_id']) for e in cand}
+            for source, linked_id in ref_ids:
+                totals[source][0] += 1
+                totals[source][1] += (source, linked_id) in cand_ids
+            reference_total += len(ref_ids)
+            found += len(ref_ids & cand_ids)
+            candidate_total += len(cand_ids)
+    report = {
+        "documents": num_docs,
+        "reference_links": reference_total,
+        "candidate_links": candidate_total,
+        "recall": found / reference_total if reference_total else 0.0,
+        "agreement": found / candidate_total if candidate_total else 0.0,
+    }
+    for source, (total, hit) in totals.items():
+        report[f"recall[{source}]"] = hit / total if total else 0.0
+    for key, value in report.items():
+        print(f"{key:<22} {value:.4f}" if isinstance(value, float) else f"{key:<22} {value}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Link entities with an Aho-Corasick automaton over UMLS/Wikidata alias tables.")
+    parser.add_argument("--input", default="../dataset/WebOfScience/wos_total.json")
+    parser.add_argument("--output", default="output_linked_data.dict.json")
+    parser.add_argument("--mrconso", default="./MRCONSO.RRF")
+    parser.add_argument("--umls_sources", nargs="*", default=None, help="只使用这些 SAB 词表，如 MSH")
+    parser.add_argument("--wikidata_aliases", default=None, help="QID<TAB>label<TAB>aliases(|分隔)<TAB>description")
+    parser.add_argument("--cache", default="dict_linker.pkl", help="编译好的自动机缓存；词典文件或参数变化时自动重建")
+    parser.add_argument("--min_alias_length", default=3, type=int)
+    parser.add_argument("--reference", default=None, help="linker.py 的输出，给出时打印召回对比")
+    parser.add_argument("--no_resume", action="store_true")
+    args = parser.parse_args()
+
+    dict_linker = build_dictionary_linker(args.mrconso if os.path.exists(args.mrconso) else None,
+                                          args.wikidata_aliases, args.cache, args.umls_sources, args.min_alias_length)
+    link_file(dict_linker, args.input, args.output, resume=not args.no_resume)
+    if args.reference:
+        recall_report(args.reference, args.output)
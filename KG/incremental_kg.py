@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+from array import array
+import numpy as np
+from tqdm import tqdm
+from build_final_kg import doc_graph, unique_triplets
+from kg_store import open_kg, write_kg_store, write_text_kg
+
+DELTA_FILENAME = "last_delta.json"
+
+
+def append_documents(kg_dir, input_path):
+    """
+    把一批新文档（已经过链接和邻居扩展，格式同 data_with_neighbors.jsonl）增量并入已有 KG。
+
+    已有实体/关系的 ID 保持不变，新名字追加在词表末尾，因此 load_linkedid 和已训练的
+    embedding 行号都仍然有效；新三元组去掉已存在的之后追加到 train2id 末尾。
+
+    Returns:
+        dict: 增量信息（新旧规模、新增三元组），同时写入 <kg_dir>/last_delta.json 和 new_triplets.npy。
+    """
+    kg = open_kg(kg_dir)
+    entity_names = kg.entity_names()
+    relation_names = list(kg.relation_names)
+    entity_to_id = {name: i for i, name in enumerate(entity_names)}
+    relation_to_id = {name: i for i, name in enumerate(relation_names)}
+    old_num_entities, old_num_relations = len(entity_names), len(relation_names)
+
+    heads, rels, tails = array('q'), array('q'), array('q')
+    num_docs = 0
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line in tqdm(f, desc="Reading new documents"):
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            num_docs += 1
+            entities, relations, triplets = doc_graph(item)
+            for name in entities:
+                if name not in entity_to_id:
+                    entity_to_id[name] = len(entity_names)
+                    entity_names.append(name)
+            for name in relations:
+                if name not in relation_to_id:
+                    relation_to_id[name] = len(relation_names)
+                    relation_names.append(name)
+            for h, r, t in triplets:
+                heads.append(entity_to_id[h])
+                rels.append(relation_to_id[r])
+                tails.append(entity_to_id[t])
+
+    # 新三元组同样按 (head, tail, relation) 存放，与 store 中的列顺序一致
+    new = unique_triplets(np.stack([np.frombuffer(heads, dtype=np.int64),
+                                    np.frombuffer(tails, dtype=np.int64),
+                                    np.frombuffer(rels, dtype=np.int64)], axis=1))
+    old = np.asarray(kg.triplets, dtype=np.int64)
+    num_entities, num_relations = len(entity_names), len(relation_names)
+
+    def keys(t):
+        return (t[:, 0] * num_entities + t[:, 1]) * num_relations + t[:, 2]
+
+    new = new[~np.isin(keys(new), keys(old))]
+    merged = np.concatenate([old, new])
+    del kg
+
+    write_text_kg(kg_dir, entity_names, relation_names, merged)
+    write_kg_store(kg_dir, entity_names, relation_names, merged)
+    np.save(os.path.join(kg_dir, "new_triplets.npy"), new)
+    delta = {
+        "input": os.path.abspath(input_path),
+        "num_documents": num_docs,
+        "old_num_entities": old_num_entities,
+        "new_num_entities": num_entities,
+        "old_num_relations": old_num_relations,
+        "new_num_relations": num_relations,
+        "num_new_triplets": int(len(new)),
+        "num_triplets": int(len(merged)),
+    }
+    with open(os.path.join(kg_dir, DELTA_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(delta, f, indent=2)
+    print(f"Appended {num_entities - old_num_entities} entities, {num_relations - old_num_relations} relations "
+          f"and {len(new)} triplets from {num_docs} documents to '{kg_dir}'.")
+    return delta
+
+
+def _neighbors(graph, nodes):
+    nodes = np.asarray(nodes, dtype=np.int64)
+    starts, ends = graph.indptr[nodes], graph.indptr[nodes + 1]
+    counts = ends - starts
+    offsets = np.cumsum(counts) - counts
+    positions = np.repeat(starts - offsets, counts) + np.arange(int(counts.sum()))
+    return np.asarray(graph.indices[positions], dtype=np.int64), np.repeat(np.arange(len(nodes)), counts)
+
+
+def affected_nodes(graph, old_num_entities, new_triplets_htr, hops=1):
+    """需要重新训练的节点：新实体、新三元组的端点，以及它们的 hops 跳邻域。"""
+    new_triplets_htr = np.asarray(new_triplets_htr, dtype=np.int64).reshape(-1, 3)
+    mask = np.zeros(graph.num_nodes, dtype=bool)
+    mask[old_num_entities:] = True
+    mask[new_triplets_htr[:, 0]] = True
+    mask[new_triplets_htr[:, 1]] = True
+    frontier = np.flatnonzero(mask)
+    for _ in range(hops):
+        neighbors, _ = _neighbors(graph, frontier)
+        neighbors = np.unique(neighbors)
+        frontier = neighbors[~mask[neighbors]]
+        mask[frontier] = True
+    return mask
+
+
+def warm_start_table(table, old_embeddings, graph, old_num_entities, chunk_rows=65536):
+    """已有实体直接拷贝旧 embedding；新实体初始化为其已有邻居的均值（没有已有邻居的保持随机初始化）。"""
+    for start in range(0, old_num_entities, chunk_rows):
+        end = min(start + chunk_rows, old_num_entities)
+        table.weights[start:end] = np.asarray(old_embeddings[start:end], dtype=np.float32)
+    new_ids = np.arange(old_num_entities, graph.num_nodes)
+    neighbors, owner = _neighbors(graph, new_ids)
+    known = neighbors < old_num_entities
+    neighbors, owner = neighbors[known], owner[known]
+    if len(neighbors):
+        sums = np.zeros((len(new_ids), table.dim), dtype=np.float32)
+        np.add.at(sums, owner, np.asarray(table.weights[neighbors], dtype=np.float32))
+        counts = np.bincount(owner, minlength=len(new_ids))
+        has = counts > 0
+        table.weights[new_ids[has]] = sums[has] / counts[has, None]
+    table.flush()
+
+
+def _load_embeddings(path):
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode='r')
+    import torch
+    return torch.load(path, map_location='cpu').numpy()
+
+
+def update_embeddings(kg_dir, old_embedding_path, output_path, hops=1, epochs=3, walk_length=40, context_size=10,
+                      walks_per_node=10, batch_size=128, lr=0.05, num_workers=4, seed=0):
+    """
+    在 append_documents 之后热启动 DeepWalk embedding：旧实体沿用已有向量，只从受影响的节点
+    （新实体及其邻域）出发游走并只更新这些行，训练几个 epoch 即可，其余行保持不变。
+
+    output_path 以 .npy 结尾时直接写 memory-map 表；以 .pt 结尾时另存一个 tensor（hierVerb 读取的格式）。
+    """
+    import torch
+    from deepwalk import train_table_epoch
+    from mmap_embedding import MmapEmbeddingTable
+    from random_walk import CSRGraph, WalkLoader
+
+    with open(os.path.join(kg_dir, DELTA_FILENAME), 'r', encoding='utf-8') as f:
+        delta = json.load(f)
+    old_num_entities = delta["old_num_entities"]
+    new_triplets = np.load(os.path.join(kg_dir, "new_triplets.npy"))
+    old_embeddings = _load_embeddings(old_embedding_path)
+    if len(old_embeddings) != old_num_entities:
+        raise ValueError(f"'{old_embedding_path}' has {len(old_embeddings)} rows, but the KG had "
+                         f"{old_num_entities} entities before the last append.")
+
+    graph = CSRGraph.from_kg(kg_dir)
+    embedding_dim = old_embeddings.shape[1]
+    table_path = output_path if output_path.endswith(".npy") else os.path.splitext(output_path)[0] + ".npy"
+    if os.path.exists(table_path) and os.path.samefile(table_path, old_embedding_path):
+        raise ValueError("output_path must not overwrite the old embedding table it is initialized from.")
+    table = MmapEmbeddingTable(table_path, graph.num_nodes, embedding_dim, resume=False, seed=seed)
+    warm_start_table(table, old_embeddings, graph, old_num_entities)
+    del old_embeddings
+
+    trainable = affected_nodes(graph, old_num_entities, new_triplets, hops=hops)
+    start_nodes = np.flatnonzero(trainable)
+    print(f"Warm-start training {len(start_nodes)} of {graph.num_nodes} nodes "
+          f"({graph.num_nodes - old_num_entities} new) for {epochs} epochs.")
+    if len(start_nodes):
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        loader = WalkLoader(graph, walk_length, context_size, walks_per_node=walks_per_node, batch_size=batch_size,
+                            num_workers=num_workers, seed=seed, start_nodes=start_nodes)
+        for epoch in range(1, epochs + 1):
+            loss = train_table_epoch(table, loader, lr, embedding_dim, device, trainable=trainable)
+            print(f'Epoch: {epoch:02d}, Loss: {loss:.4f}')
+
+    if output_path.endswith(".pt"):
+        torch.save(torch.from_numpy(np.array(table.weights)), output_path)
+    print(f"Updated embeddings saved to {output_path}. Shape: {table.weights.shape}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Append newly ingested documents to an existing KG and warm-start its embeddings.")
+    parser.add_argument("--kg_dir", default="final_enriched_kg")
+    parser.add_argument("--input", required=True, help="New documents with neighbors (JSONL, as data_with_neighbors.jsonl).")
+    parser.add_argument("--embedding", default="deepwalk.pt", help="Embeddings trained on the KG before this append.")
+    parser.add_argument("--output_embedding", default="deepwalk.pt")
+    parser.add_argument("--hops", type=int, default=1)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--skip_embedding", action="store_true")
+    args = parser.parse_args()
+
+    append_documents(args.kg_dir, args.input)
+    if not args.skip_embedding:
+        update_embeddings(args.kg_dir, args.embedding, args.output_embedding, hops=args.hops, epochs=args.epochs,
+                          num_workers=args.num_workers)
@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import numpy as np
+
+STORE_DIRNAME = "store"
+STORE_FORMAT_VERSION = 1
+TEXT_FILES = ("entity2id.txt", "relation2id.txt", "train2id.txt")
+
+
+def _encode_names(names):
+    encoded = [name.encode('utf-8') for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets
+
+
+def write_kg_store(kg_dir, entity_names, relation_names, triplets_htr):
+    """
+    写出二进制 KG（与 entity2id.txt / relation2id.txt / train2id.txt 内容等价）。
+
+    目录 <kg_dir>/store/ 下:
+        meta.json            格式版本、规模、三元组 dtype
+        entity_names.bin     UTF-8 拼接的实体名，entity_offsets.npy 为其偏移（下标即实体 ID）
+        entity_sorted.npy    按名字字节序排列的实体 ID，用于不建字典的二分查找
+        relation_names.json  关系名（下标即关系 ID）
+        triplets.npy         (N, 3) 的 head, tail, relation，列顺序与 train2id.txt 相同
+
+    Args:
+        entity_names (list): 第 i 个元素是 ID 为 i 的实体名。
+        relation_names (list): 第 i 个元素是 ID 为 i 的关系名。
+        triplets_htr (np.ndarray): (N, 3) 整数数组，列为 head, tail, relation。
+    """
+    triplets_htr = np.asarray(triplets_htr).reshape(-1, 3)
+    max_id = max(len(entity_names), len(relation_names))
+    dtype = np.int32 if max_id < np.iinfo(np.int32).max else np.int64
+
+    store_dir = os.path.join(kg_dir, STORE_DIRNAME)
+    tmp_dir = store_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    blob, offsets = _encode_names(entity_names)
+    with open(os.path.join(tmp_dir, "entity_names.bin"), 'wb') as f:
+        f.write(blob)
+    np.save(os.path.join(tmp_dir, "entity_offsets.npy"), offsets)
+    order = sorted(range(len(entity_names)), key=lambda i: entity_names[i].encode('utf-8'))
+    np.save(os.path.join(tmp_dir, "entity_sorted.npy"), np.array(order, dtype=dtype))
+    with open(os.path.join(tmp_dir, "relation_names.json"), 'w', encoding='utf-8') as f:
+        json.dump(list(relation_names), f, ensure_ascii=False)
+    np.save(os.path.join(tmp_dir, "triplets.npy"), triplets_htr.astype(dtype, copy=False))
+    with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "format_version": STORE_FORMAT_VERSION,
+            "num_entities": len(entity_names),
+            "num_relations": len(relation_names),
+            "num_triplets": int(len(triplets_htr)),
+            "triplet_columns": ["head", "tail", "relation"],
+            "dtype": np.dtype(dtype).name,
+        }, f, indent=2)
+
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+
+
+def write_text_kg(kg_dir, entity_names, relation_names, triplets_htr):
+    """写出 entity2id.txt / relation2id.txt / train2id.txt（train2id 的列顺序为 head, tail, relation）。"""
+    os.makedirs(kg_dir, exist_ok=True)
+    with open(os.path.join(kg_dir, 'entity2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(entity_names)}\n")
+        for eid, name in enumerate(entity_names): f.write(f"{name}\t{eid}\n")
+    with open(os.path.join(kg_dir, 'relation2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(relation_names)}\n")
+        for rid, name in enumerate(relation_names): f.write(f"{name}\t{rid}\n")
+    with open(os.path.join(kg_dir, 'train2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(triplets_htr)}\n")
+        np.savetxt(f, np.asarray(triplets_htr).reshape(-1, 3), fmt='%d', delimiter='\t')
+
+
+def _read_id_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        count = int(f.readline().strip())
+        names = [None] * count
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            name, idx = line.rsplit('\t', 1)
+            names[int(idx)] = name
+    return names
+
+
+def read_text_triplets(path):
+    """解析 train2id.txt；比 np.loadtxt 快一个数量级（整块读入后一次性转换）。"""
+    with open(path, 'rb') as f:
+        f.readline()
+        data = f.read()
+    return np.array(data.split(), dtype=np.int64).reshape(-1, 3)
+
+
+def convert_text_kg(kg_dir):
+    """把已有的文本格式 KG 转换为二进制存储。"""
+    print(f"Converting text KG in '{kg_dir}' to binary store...")
+    entity_names = _read_id_file(os.path.join(kg_dir, "entity2id.txt"))
+    relation_path = os.path.join(kg_dir, "relation2id.txt")
+    relation_names = _read_id_file(relation_path) if os.path.exists(relation_path) else []
+    triplets = read_text_triplets(os.path.join(kg_dir, "train2id.txt"))
+    write_kg_store(kg_dir, entity_names, relation_names, triplets)
+
+
+class KGStore:
+    """二进制 KG 的只读视图；三元组和实体名都是 memory-map，打开开销与 KG 规模无关。"""
+
+    def __init__(self, kg_dir):
+        store_dir = os.path.join(kg_dir, STORE_DIRNAME)
+        with open(os.path.join(store_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"KG store at '{store_dir}' has format {self.meta.get('format_version')}, "
+                             f"expected {STORE_FORMAT_VERSION}. Rebuild it with convert_text_kg().")
+        with open(os.path.join(store_dir, "relation_names.json"), 'r', encoding='utf-8') as f:
+            self.relation_names = json.load(f)
+        self.kg_dir = kg_dir
+        self.num_entities = self.meta["num_entities"]
+        self.num_relations = self.meta["num_relations"]
+        self.entity_offsets = np.load(os.path.join(store_dir, "entity_offsets.npy"), mmap_mode='r')
+        self.entity_sorted = np.load(os.path.join(store_dir, "entity_sorted.npy"), mmap_mode='r')
+        self.triplets = np.load(os.path.join(store_dir, "triplets.npy"), mmap_mode='r')
+        names_path = os.path.join(store_dir, "entity_names.bin")
+        if os.path.getsize(names_path):
+            self._names = np.memmap(names_path, dtype=np.uint8, mode='r')
+        else:
+            self._names = np.zeros(0, dtype=np.uint8)
+
+    @property
+    def heads(self):
+        return self.triplets[:, 0]
+
+    @property
+    def tails(self):
+        return self.triplets[:, 1]
+
+    @property
+    def relations(self):
+        return self.triplets[:, 2]
+
+    def _name_bytes(self, entity_id):
+        return self._names[self.entity_offsets[entity_id]:self.entity_offsets[entity_id + 1]].tobytes()
+
+    def entity_name(self, entity_id):
+        return self._name_bytes(entity_id).decode('utf-8')
+
+    def entity_names(self):
+        blob = self._names.tobytes()
+        offsets = self.entity_offsets.tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.num_entities)]
+
+    def entity_to_id(self):
+        return {name: i for i, name in enumerate(self.entity_names())}
+
+    def entity_id(self, name, default=None):
+        """按名字二分查找实体 ID，不需要把整张词表读进字典。"""
+        key = name.encode('utf-8')
+        lo, hi = 0, self.num_entities
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_bytes(self.entity_sorted[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_entities and self._name_bytes(self.entity_sorted[lo]) == key:
+            return int(self.entity_sorted[lo])
+        return default
+
+
+class EntityIndex:
+    """名字 -> 实体 ID 的只读映射，用法同 entity_to_id() 返回的 dict，但每次查询都在 store 上二分查找，不建字典。"""
+
+    def __init__(self, kg):
+        self.kg = kg
+
+    def __getitem__(self, name):
+        entity_id = self.kg.entity_id(name)
+        if entity_id is None:
+            raise KeyError(name)
+        return entity_id
+
+    def __contains__(self, name):
+        return self.kg.entity_id(name) is not None
+
+    def get(self, name, default=None):
+        return self.kg.entity_id(name, default)
+
+    def __len__(self):
+        return self.kg.num_entities
+
+
+def _store_is_stale(kg_dir):
+    meta_path = os.path.join(kg_dir, STORE_DIRNAME, "meta.json")
+    if not os.path.exists(meta_path):
+        return True
+    store_mtime = os.path.getmtime(meta_path)
+    return any(os.path.exists(os.path.join(kg_dir, name)) and os.path.getmtime(os.path.join(kg_dir, name)) > store_mtime
+               for name in TEXT_FILES)
+
+
+def open_kg(kg_dir):
+    """打开 KG 的二进制存储；不存在或比文本文件旧时先从文本格式转换一次。"""
+    if _store_is_stale(kg_dir):
+        convert_text_kg(kg_dir)
+    return KGStore(kg_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser("Convert a text KG (entity2id/relation2id/train2id) to the binary store.")
+    parser.add_argument("kg_dirs", nargs="+")
+    args = parser.parse_args()
+    for kg_dir in args.kg_dirs:
+        convert_text_kg(kg_dir)
+        store = KGStore(kg_dir)
+        print(f"'{kg_dir}': {store.num_entities} entities, {store.num_relations} relations, "
+              f"{len(store.triplets)} triplets.")
@@ -0,0 +1,166 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def split_triplets(triplets_htr, valid_frac=0.01, test_frac=0.01, seed=0):
+    """按固定随机种子把三元组划分为 train / valid / test（同一 KG 与种子得到完全相同的划分）。"""
+    triplets_htr = np.asarray(triplets_htr, dtype=np.int64)
+    perm = np.random.default_rng(seed).permutation(len(triplets_htr))
+    num_valid = int(len(perm) * valid_frac)
+    num_test = int(len(perm) * test_frac)
+    valid = triplets_htr[np.sort(perm[:num_valid])]
+    test = triplets_htr[np.sort(perm[num_valid:num_valid + num_test])]
+    train = triplets_htr[np.sort(perm[num_valid + num_test:])]
+    return train, valid, test
+
+
+class AliasTable:
+    """Walker/Vose alias 表：O(n) 构建后每次采样 O(1)，批量采样完全向量化。"""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(weights)
+        prob = weights * n / weights.sum()
+        alias = np.zeros(n, dtype=np.int64)
+        small = list(np.flatnonzero(prob < 1.0))
+        large = list(np.flatnonzero(prob >= 1.0))
+        while small and large:
+            s, l = small.pop(), large.pop()
+            alias[s] = l
+            prob[l] -= 1.0 - prob[s]
+            (small if prob[l] < 1.0 else large).append(l)
+        # 剩余项的概率只因浮点误差偏离 1
+        prob[small] = 1.0
+        prob[large] = 1.0
+        self.prob = prob
+        self.alias = alias
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, size, rng):
+        idx = rng.integers(0, len(self.prob), size=size)
+        return np.where(rng.random(size) < self.prob[idx], idx, self.alias[idx])
+
+
+def degree_alias_table(num_entities, triplets_htr, power=1.0):
+    """按实体度数（出现在 head 或 tail 的次数）的 power 次方成比例采样；度数为 0 的实体计为 1。"""
+    triplets_htr = np.asarray(triplets_htr)
+    degree = np.bincount(triplets_htr[:, 0], minlength=num_entities) + np.bincount(triplets_htr[:, 1], minlength=num_entities)
+    return AliasTable(np.maximum(degree, 1).astype(np.float64) ** power)
+
+
+def rotate_loss(model, head_index, rel_type, tail_index, sampler=None, rng=None):
+    """
+    与 torch_geometric RotatE.loss 相同的 BCE loss（前一半换头、后一半换尾），
+    负样本实体由 sampler（AliasTable）按度数采样；sampler 为 None 时退回 PyG 的均匀采样。
+    """
+    if sampler is None:
+        return model.loss(head_index, rel_type, tail_index)
+    rng = rng if rng is not None else np.random.default_rng()
+    num_neg = head_index.numel() // 2
+    rnd_index = torch.from_numpy(sampler.sample(head_index.numel(), rng)).to(head_index.device)
+    neg_head, neg_tail = head_index.clone(), tail_index.clone()
+    neg_head[:num_neg] = rnd_index[:num_neg]
+    neg_tail[num_neg:] = rnd_index[num_neg:]
+    pos_score = model(head_index, rel_type, tail_index)
+    neg_score = model(neg_head, rel_type, neg_tail)
+    scores = torch.cat([pos_score, neg_score], dim=0)
+    target = torch.cat([torch.ones_like(pos_score), torch.zeros_like(neg_score)], dim=0)
+    return F.binary_cross_entropy_with_logits(scores, target)
+
+
+class FilterIndex:
+    """
+    已知三元组的有序整数键，用于 filtered 评估：
+    tail 方向键为 (h * R + r) * N + t，head 方向键为 (t * R + r) * N + h，
+    某个 (anchor, r) 的全部已知答案是有序数组中一段连续区间。
+    """
+
+    def __init__(self, triplets_htr, num_entities, num_relations):
+        triplets_htr = np.asarray(triplets_htr, dtype=np.int64)
+        self.num_entities = num_entities
+        self.num_relations = num_relations
+        h, t, r = triplets_htr[:, 0], triplets_htr[:, 1], triplets_htr[:, 2]
+        self.tail_keys = np.unique((h * num_relations + r) * num_entities + t)
+        self.head_keys = np.unique((t * num_relations + r) * num_entities + h)
+
+    def known(self, anchors, rels, predict="tail"):
+        """返回 (query 下标, 已知答案实体) 两个数组，覆盖 batch 中每个 (anchor, r) 的全部已知答案。"""
+        keys = self.tail_keys if predict == "tail" else self.head_keys
+        base = (np.asarray(anchors, dtype=np.int64) * self.num_relations + np.asarray(rels, dtype=np.int64)) * self.num_entities
+        lo = np.searchsorted(keys, base)
+        hi = np.searchsorted(keys, base + self.num_entities)
+        counts = hi - lo
+        query = np.repeat(np.arange(len(base)), counts)
+        offsets = np.cumsum(counts) - counts
+        positions = np.repeat(lo - offsets, counts) + np.arange(int(counts.sum()))
+        return query, keys[positions] - base[query]
+
+
+class RotatEEvaluator:
+    """
+    RotatE 的分块矩阵式 filtered 链接预测评估。
+
+    |r| = 1，所以 ||h∘r - t|| = ||t∘conj(r) - h||：两个方向都归结为查询向量与全部实体向量
+    之间的欧氏距离，按 (query 块) x (实体块) 用 torch.cdist 计算，显存占用与块大小成正比。
+    """
+
+    def __init__(self, model, filter_index, query_chunk=256, entity_chunk=65536):
+        self.model = model
+        self.filter_index = filter_index
+        self.query_chunk = query_chunk
+        self.entity_chunk = entity_chunk
+
+    def _queries(self, anchors, rels, predict):
+        re, im = self.model.node_emb(anchors), self.model.node_emb_im(anchors)
+        theta = self.model.rel_emb(rels)
+        rel_re, rel_im = torch.cos(theta), torch.sin(theta)
+        if predict == "head":
+            rel_im = -rel_im
+        return torch.cat([rel_re * re - rel_im * im, rel_re * im + rel_im * re], dim=1)
+
+    @torch.no_grad()
+    def ranks(self, triplets_htr, predict="tail"):
+        """返回每个三元组在 filtered 设定下正确实体的名次（1 为最好）。"""
+        device = self.model.node_emb.weight.device
+        entities = torch.cat([self.model.node_emb.weight, self.model.node_emb_im.weight], dim=1)
+        triplets_htr = np.asarray(triplets_htr, dtype=np.int64)
+        anchor_col, target_col = (0, 1) if predict == "tail" else (1, 0)
+        all_ranks = []
+        for start in range(0, len(triplets_htr), self.query_chunk):
+            chunk = triplets_htr[start:start + self.query_chunk]
+            anchors, targets, rels = chunk[:, anchor_col], chunk[:, target_col], chunk[:, 2]
+            queries = self._queries(torch.from_numpy(anchors).to(device), torch.from_numpy(rels).to(device), predict)
+            target_t = torch.from_numpy(targets).to(device)
+            target_dist = (queries - entities[target_t]).norm(dim=1)
+
+            # 过滤掉除目标外的其它已知正确答案
+            q_idx, known = self.filter_index.known(anchors, rels, predict)
+            keep = known != targets[q_idx]
+            q_idx, known = torch.from_numpy(q_idx[keep]).to(device), torch.from_numpy(known[keep]).to(device)
+
+            rows = torch.arange(len(chunk), device=device)
+            better = torch.zeros(len(chunk), dtype=torch.long, device=device)
+            for e_start in range(0, entities.size(0), self.entity_chunk):
+                e_end = min(e_start + self.entity_chunk, entities.size(0))
+                dist = torch.cdist(queries, entities[e_start:e_end])
+                in_block = (known >= e_start) & (known < e_end)
+                dist[q_idx[in_block], known[in_block] - e_start] = float('inf')
+                # cdist 在行数较多时走矩阵乘法公式，目标自身的距离可能略小于 target_dist，不能让它和自己比
+                target_in_block = (target_t >= e_start) & (target_t < e_end)
+                dist[rows[target_in_block], target_t[target_in_block] - e_start] = float('inf')
+                better += (dist < target_dist.unsqueeze(1)).sum(dim=1)
+            all_ranks.append((better + 1).cpu().numpy())
+        return np.concatenate(all_ranks) if all_ranks else np.zeros(0, dtype=np.int64)
+
+    def evaluate(self, triplets_htr, ks=(1, 3, 10)):
+        """head 与 tail 两个方向的 filtered MRR / Hits@k（两个方向的名次合并后取平均）。"""
+        ranks = np.concatenate([self.ranks(triplets_htr, "tail"), self.ranks(triplets_htr, "head")]).astype(np.float64)
+        if len(ranks) == 0:
+            return {"mrr": 0.0, **{f"hits@{k}": 0.0 for k in ks}}
+        metrics = {"mrr": float(np.mean(1.0 / ranks))}
+        for k in ks:
+            metrics[f"hits@{k}"] = float(np.mean(ranks <= k))
+        return metrics
@@ -0,0 +1,101 @@
+import json
+import sqlite3
+
+CACHE_SCHEMA_VERSION = 1
+
+
+def normalize_mention(text):
+    """缓存键：小写并压缩空白，使同一表面形式在不同文档中命中同一条记录。"""
+    return " ".join(text.lower().split())
+
+
+class LinkCache:
+    """
+    实体链接结果的持久化缓存（SQLite 单文件）。
+
+    键为 (链接器配置, 规范化后的实体文本)，值为链接结果的 JSON；链接失败也会缓存为 null，
+    避免对同一个无法链接的字符串反复跑两条 spaCy pipeline。不同数据集只要使用同一个缓存文件
+    和同一套链接器配置即可共享结果。
+    """
+
+    def __init__(self, path, config_key, commit_every=1000):
+        self.path = path
+        self.config_key = f"v{CACHE_SCHEMA_VERSION}:{config_key}"
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS links ("
+            "config TEXT NOT NULL, mention TEXT NOT NULL, result TEXT, "
+            "PRIMARY KEY (config, mention)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def get(self, text):
+        """
+        Returns:
+            (found, info): found 为 False 表示未缓存；info 为 None 表示缓存的是一次链接失败。
+        """
+        row = self.conn.execute(
+            "SELECT result FROM links WHERE config = ? AND mention = ?",
+            (self.config_key, normalize_mention(text))
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, json.loads(row[0]) if row[0] is not None else None
+
+    def get_many(self, texts, chunk_size=500):
+        """批量查询，返回 {规范化文本: info}，只包含已缓存的键；命中/未命中按去重后的键计数。"""
+        keys = list(dict.fromkeys(normalize_mention(t) for t in texts))
+        found = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT mention, result FROM links WHERE config = ? AND mention IN ({placeholders})",
+                [self.config_key] + chunk
+            ).fetchall()
+            for mention, result in rows:
+                found[mention] = json.loads(result) if result is not None else None
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, text, info):
+        self.put_many([(text, info)])
+
+    def put_many(self, items):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO links (config, mention, result) VALUES (?, ?, ?)",
+            [(self.config_key, normalize_mention(text), json.dumps(info, ensure_ascii=False) if info is not None else None)
+             for text, info in items]
+        )
+        self._uncommitted += len(items)
+        if self._uncommitted >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM links WHERE config = ?", (self.config_key,)).fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        self.flush()
+        self.conn.close()
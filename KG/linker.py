@@ -2,8 +2,17 @@ import spacy
 import scispacy
 from scispacy.linking import EntityLinker
 import spacy_entity_linker
+import argparse
 import json
 from tqdm import tqdm # 用于显示漂亮的进度条
+from link_cache import LinkCache, normalize_mention
+from stream_io import iter_jsonl, ResumableJsonlWriter
+
+WIKI_MODEL = "en_core_web_lg"
+SCI_MODEL = "en_core_sci_lg"
+UMLS_LINKER_NAME = "umls"
+# 缓存键的一部分：换模型或换知识库后旧的缓存结果自动失效
+LINKER_CONFIG = f"wiki={WIKI_MODEL}+entityLinker;sci={SCI_MODEL}+scispacy_linker:{UMLS_LINKER_NAME}"
 
 # --- 1. 模型加载 (这个过程比较慢，所以只在脚本开始时执行一次) ---
 
@@ -13,16 +22,16 @@ def load_models():
     
 
     print("加载模型1: Standard SpaCy + Wikidata Linker")
-    nlp_wikidata = spacy.load("en_core_web_lg")
+    nlp_wikidata = spacy.load(WIKI_MODEL)
     try:
         nlp_wikidata.add_pipe("entityLinker",last=True)
     except ValueError:
         print("警告: Wikidata 链接器已存在或加载失败，跳过添加。")
     # 加载模型 1: SciSpacy + MeSH/UMLS 链接器
     print("加载模型2: SciSpacy + umls Linker")
-    nlp_scispacy = spacy.load("en_core_sci_lg")
+    nlp_scispacy = spacy.load(SCI_MODEL)
     try:
-        nlp_scispacy.add_pipe("scispacy_linker", config={"linker_name": "umls"})
+        nlp_scispacy.add_pipe("scispacy_linker", config={"linker_name": UMLS_LINKER_NAME})
     except ValueError:
         print("警告: umls 链接器已存在或加载失败，跳过添加。")
 
@@ -31,12 +40,7 @@ def load_models():
 
 # --- 2. 核心的混合链接函数 (我们之前的逻辑) ---
 
-def get_hybrid_entity_info(entity_text, nlp_wiki, nlp_sci):
-    """
-    对单个实体文本进行混合链接，优先尝试Wikidata，然后是SciSpacy。
-    """
-    # 尝试使用Wikidata进行链接 (对通用和CS术语更好)
-    doc_wiki = nlp_wiki(entity_text)
+def wiki_entity_info(doc_wiki):
     if doc_wiki.ents and doc_wiki.ents[0]._.kb_ents:
         entity = doc_wiki.ents[0]
         return {
@@ -45,9 +49,10 @@ def get_hybrid_entity_info(entity_text, nlp_wiki, nlp_sci):
             "description": entity._.entity_desc_,
             "source": "Wikidata"
         }
-    
-    # 如果Wikidata失败，尝试使用SciSpacy
-    doc_sci = nlp_sci(entity_text)
+    return None
+
+
+def sci_entity_info(doc_sci, nlp_sci):
     if doc_sci.ents and doc_sci.ents[0]._.kb_ents:
         entity = doc_sci.ents[0]
         cui = entity._.kb_ents[0][0]
@@ -58,7 +63,38 @@ def get_hybrid_entity_info(entity_text, nlp_wiki, nlp_sci):
             "description": kb_entity.definition,
             "source": "MeSH/UMLS"
         }
-    
+    return None
+
+
+def link_entity(entity_text, nlp_wiki, nlp_sci):
+    """
+    对单个实体文本进行混合链接，优先尝试Wikidata，然后是SciSpacy；两者都失败时返回 None。
+    """
+    # 尝试使用Wikidata进行链接 (对通用和CS术语更好)
+    info = wiki_entity_info(nlp_wiki(entity_text))
+    if info is not None:
+        return info
+    # 如果Wikidata失败，尝试使用SciSpacy
+    return sci_entity_info(nlp_sci(entity_text), nlp_sci)
+
+
+def link_entities_batch(entity_texts, nlp_wiki, nlp_sci, batch_size=256):
+    """
+    link_entity 的批量版本：先用 nlp_wiki.pipe 链接全部文本，再把失败的交给 nlp_sci.pipe。
+
+    Returns:
+        dict: {entity_text: info 或 None}
+    """
+    results = {}
+    for text, doc in zip(entity_texts, nlp_wiki.pipe(entity_texts, batch_size=batch_size)):
+        results[text] = wiki_entity_info(doc)
+    remaining = [text for text in entity_texts if results[text] is None]
+    for text, doc in zip(remaining, nlp_sci.pipe(remaining, batch_size=batch_size)):
+        results[text] = sci_entity_info(doc, nlp_sci)
+    return results
+
+
+def fallback_entity_info(entity_text):
     # 如果全部失败，返回规范化文本
     return {
         "id": entity_text.lower().replace(" ", "_"),
@@ -68,50 +104,131 @@ def get_hybrid_entity_info(entity_text, nlp_wiki, nlp_sci):
     }
 
 
-def main():
-    input_filepath = "entity.json"
-    output_filepath = "output_linked_data.json"
+def get_hybrid_entity_info(entity_text, nlp_wiki, nlp_sci, cache=None):
+    """
+    对单个实体文本进行混合链接；提供 cache 时，每个规范化后的表面形式只真正链接一次。
+    """
+    if cache is not None:
+        found, info = cache.get(entity_text)
+        if not found:
+            info = link_entity(entity_text, nlp_wiki, nlp_sci)
+            cache.put(entity_text, info)
+    else:
+        info = link_entity(entity_text, nlp_wiki, nlp_sci)
+    return info if info is not None else fallback_entity_info(entity_text)
 
-    nlp_scispacy, nlp_wikidata = load_models()
 
+def iter_input_records(input_filepath, start_offset=0):
+    """
+    流式读取 extract.py 的输出。JSON Lines（--stream 模式）按字节偏移续跑；
+    旧版的 entity.json 是一个 JSON 数组，无法流式解析，此时偏移量按记录条数计。
+    """
+    with open(input_filepath, 'r', encoding='utf-8') as f:
+        head = f.read(4096).lstrip()
+    if not head.startswith('['):
+        yield from iter_jsonl(input_filepath, start_offset)
+        return
     with open(input_filepath, 'r', encoding='utf-8') as f:
         all_data = json.load(f)
-    print(f"共找到 {len(all_data)} 条数据待处理。")
+    for index in range(start_offset, len(all_data)):
+        yield index + 1, all_data[index]
 
-    processed_results = []
-    
-    for item in tqdm(all_data, desc="正在链接实体"):
-        original_entities = item.get('entities', [])
-        
+
+def link_documents(items, nlp_wikidata, nlp_scispacy, cache, pipe_batch_size=256, ngram_index=None, ngram_threshold=0.75):
+    """
+    链接一批文档中的全部实体：按规范化文本去重、先查缓存，未命中的一次性送入 pipe。
+
+    提供 ngram_index（ngram_index.NgramIndex）时，两个 spaCy 链接器都失败的提及再做一次
+    字符 n-gram 模糊匹配，得分不低于 ngram_threshold 的才采用，仍失败的才记为 Fallback。
+    模糊匹配的结果不写入缓存（缓存只对应 LINKER_CONFIG），换索引或阈值后无需清缓存。
+    """
+    mentions = [entity_text for item in items for entity_text, _ in item.get('entities', [])]
+    resolved = cache.get_many(mentions)
+    to_link = {}
+    for entity_text in mentions:
+        key = normalize_mention(entity_text)
+        if key not in resolved and key not in to_link:
+            to_link[key] = entity_text
+    if to_link:
+        linked = link_entities_batch(list(to_link.values()), nlp_wikidata, nlp_scispacy, batch_size=pipe_batch_size)
+        cache.put_many(linked.items())
+        for key, entity_text in to_link.items():
+            resolved[key] = linked[entity_text]
+    if ngram_index is not None:
+        unresolved = [key for key, info in resolved.items() if info is None]
+        for key, info in zip(unresolved, ngram_index.link(unresolved, ngram_threshold)):
+            resolved[key] = info
+
+    processed_items = []
+    for item in items:
         linked_entities_list = []
-        
-        for entity_text, entity_type in original_entities:
-            linked_info = get_hybrid_entity_info(entity_text, nlp_wikidata, nlp_scispacy)
-            
-            final_entity_data = {
+        for entity_text, entity_type in item.get('entities', []):
+            linked_info = resolved[normalize_mention(entity_text)] or fallback_entity_info(entity_text)
+            linked_entities_list.append({
                 "original_text": entity_text,
                 "original_type": entity_type,
                 "linked_id": linked_info["id"],
                 "linked_name": linked_info["name"],
                 "linked_description": linked_info["description"],
-                "link_source": linked_info["source"]
-            }
-            # print(final_entity_data)
-            linked_entities_list.append(final_entity_data)
-            
+                "link_source": linked_info["source"],
+                "link_score": linked_info.get("score", 0.0 if linked_info["source"] == "Fallback" else 1.0)
+            })
         # 创建一个新的item字典，包含所有原始信息和新链接的实体列表
-        processed_item = {
+        processed_items.append({
             "text": item["text"],
             "label_level_1": item["label_level_1"],
             "label_level_2": item["label_level_2"],
             "linked_entities": linked_entities_list # 使用新的键来存储
-        }
+        })
+    return processed_items
+
+
+def main():
+    parser = argparse.ArgumentParser("")
+    parser.add_argument("--input", default="entity.json", help="extract.py 的输出，JSON 数组或 JSON Lines")
+    parser.add_argument("--output", default="output_linked_data.json")
+    parser.add_argument("--cache", default="link_cache.sqlite", help="为空时只在本次运行内缓存")
+    parser.add_argument("--checkpoint", default=None, help="默认为 <output>.ckpt")
+    parser.add_argument("--doc_batch_size", default=64, type=int, help="每批文档数，也是 checkpoint 的粒度")
+    parser.add_argument("--pipe_batch_size", default=256, type=int)
+    parser.add_argument("--no_resume", action="store_true")
+    parser.add_argument("--ngram_index", default=None, help="ngram_index.py 构建的索引目录，spaCy 链接失败时做模糊匹配")
+    parser.add_argument("--ngram_threshold", default=0.75, type=float, help="模糊匹配的最低余弦得分")
+    args = parser.parse_args()
+
+    nlp_scispacy, nlp_wikidata = load_models()
+    ngram_index = None
+    if args.ngram_index:
+        from ngram_index import NgramIndex
+        ngram_index = NgramIndex(args.ngram_index)
+    cache = LinkCache(args.cache or ":memory:", LINKER_CONFIG)
+
+    # 单个输出句柄 + 每批提交一次 checkpoint；被抢占后重新运行会从上次提交处继续，不会重复写入
+    with ResumableJsonlWriter(args.input, args.output, args.checkpoint, resume=not args.no_resume) as writer:
+        if writer.finished:
+            print(f"'{args.output}' 已完成（{writer.records} 条），无需重新链接。")
+            return
+        batch = []
+        offset = writer.input_offset
+        for offset, item in tqdm(iter_input_records(args.input, writer.input_offset),
+                                 desc="正在链接实体", initial=writer.records):
+            batch.append(item)
+            if len(batch) >= args.doc_batch_size:
+                for processed_item in link_documents(batch, nlp_wikidata, nlp_scispacy, cache, args.pipe_batch_size,
+                                                     ngram_index, args.ngram_threshold):
+                    writer.write(processed_item)
+                cache.flush()
+                writer.commit(offset)
+                batch = []
+        for processed_item in link_documents(batch, nlp_wikidata, nlp_scispacy, cache, args.pipe_batch_size,
+                                             ngram_index, args.ngram_threshold):
+            writer.write(processed_item)
+        cache.flush()
+        writer.commit(offset, finished=True)
 
-        with open(output_filepath, 'a', encoding='utf-8') as f:
-            # indent=2 让JSON文件格式化，更易读
-            json.dump(processed_item, f, ensure_ascii=False)
-            f.write("\n")
-        
+    stats = cache.stats()
+    cache.close()
+    print(f"链接缓存: 命中 {stats['hits']}, 未命中 {stats['misses']}, 命中率 {stats['hit_rate']:.2%}, 共 {stats['entries']} 条")
     print("所有任务完成！")
 
 if __name__ == "__main__":
@@ -1,20 +1,157 @@
+import argparse
 import json
-with open("output_linked_data.json",'r') as f:
-    data=[json.loads(item) for item in f.readlines()]
-
-for index,item in enumerate(data):
-    clean_list=[]
-    for d in item['linked_entities']:
-        if d['link_source']=='MeSH/UMLS':
-            clean_list.append(d)
-    data[index]['linked_entities']=clean_list
-
-with open("data.json",'a') as f:
-    for _,item in enumerate(data):
-        item['doc_token']=item['text']
-        item.pop('text')
-        item['doc_label']=[item['label_level_1'],item['label_level_2']]
-        item.pop('label_level_1')
-        item.pop('label_level_2')
-        json.dump(item,f,ensure_ascii=False)
-        f.write("\n")
+import math
+import os
+from collections import Counter
+from tqdm import tqdm
+from link_cache import normalize_mention
+from stream_io import iter_jsonl
+
+KEEP_SOURCES = ("MeSH/UMLS",)
+
+
+def load_stop_list(path):
+    """每行一个实体文本、名称或 ID，# 开头为注释；按 normalize_mention 规范化。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {normalize_mention(line) for line in f if line.strip() and not line.lstrip().startswith('#')}
+
+
+class EntityFilter:
+    """
+    逐实体的过滤条件，按 来源 -> 链接得分 -> 类型 -> 停用表 的顺序检查；
+    被丢弃的实体只计入第一个命中的原因，计数在 counters 中累积。
+
+    Args:
+        keep_sources: 只保留这些 link_source；为空时不按来源过滤
+        min_score: link_score 低于它的丢弃（没有 link_score 字段的旧输出视为 1.0）
+        keep_types / drop_types: 按 original_type（spaCy 实体类型）保留 / 丢弃
+        stop_list: 规范化后的 original_text、linked_name 或 linked_id 命中即丢弃
+    """
+
+    def __init__(self, keep_sources=KEEP_SOURCES, min_score=0.0, keep_types=None, drop_types=None, stop_list=()):
+        self.keep_sources = set(keep_sources) if keep_sources else None
+        self.min_score = min_score
+        self.keep_types = set(keep_types) if keep_types else None
+        self.drop_types = set(drop_types) if drop_types else set()
+        self.stop_list = set(stop_list)
+        self.counters = Counter()
+
+    def reject_reason(self, entity):
+        if self.keep_sources is not None and entity.get('link_source') not in self.keep_sources:
+            return "source"
+        if entity.get('link_score', 1.0) < self.min_score:
+            return "score"
+        entity_type = entity.get('original_type')
+        if (self.keep_types is not None and entity_type not in self.keep_types) or entity_type in self.drop_types:
+            return "type"
+        if self.stop_list and any(normalize_mention(str(entity.get(key) or "")) in self.stop_list
+                                  for key in ('original_text', 'linked_name', 'linked_id')):
+            return "stop_list"
+        return None
+
+    def filter(self, entities):
+        kept = []
+        for entity in entities:
+            reason = self.reject_reason(entity)
+            if reason is None:
+                kept.append(entity)
+            else:
+                self.counters[f"dropped_{reason}"] += 1
+        self.counters["entities_in"] += len(entities)
+        return kept
+
+
+def cap_by_idf(entities, idf, max_entities):
+    """只保留 IDF 最高（在语料中最少见、最具区分度）的 max_entities 个实体，保持原有顺序；IDF 相同时先出现的优先。"""
+    if max_entities is None or len(entities) <= max_entities:
+        return entities
+    ranked = sorted(range(len(entities)), key=lambda i: (-idf.get(entities[i]['linked_id'], 0.0), i))
+    keep = sorted(ranked[:max_entities])
+    return [entities[i] for i in keep]
+
+
+def to_dataset_format(item):
+    """把字段改成数据集格式（doc_token / doc_label）。"""
+    item['doc_token'] = item.pop('text')
+    item['doc_label'] = [item.pop('label_level_1'), item.pop('label_level_2')]
+    return item
+
+
+def clean_item(item, keep_sources=KEEP_SOURCES, entity_filter=None):
+    """只保留 keep_sources 链接到的实体（或按 entity_filter 过滤），并把字段改成数据集格式。"""
+    entity_filter = entity_filter or EntityFilter(keep_sources)
+    item['linked_entities'] = entity_filter.filter(item['linked_entities'])
+    return to_dataset_format(item)
+
+
+def corpus_idf(input_path, entity_filter):
+    """
+    第一遍扫描：统计通过 entity_filter 的实体在多少篇文档中出现，返回 {linked_id: log(N / df)}。
+
+    只在内存中保留实体计数，与文档数无关。
+    """
+    probe = EntityFilter(entity_filter.keep_sources, entity_filter.min_score, entity_filter.keep_types,
+                         entity_filter.drop_types, entity_filter.stop_list)
+    df = Counter()
+    num_docs = 0
+    for _, item in tqdm(iter_jsonl(input_path), desc="Counting entity document frequency"):
+        num_docs += 1
+        df.update({entity['linked_id'] for entity in probe.filter(item.get('linked_entities', []))})
+    return {entity_id: math.log(num_docs / count) for entity_id, count in df.items()}
+
+
+def clean_file(input_path, output_path, entity_filter, max_entities=None, drop_empty=False):
+    """
+    流式清洗 linker.py 的输出：逐条过滤实体、按需按语料 IDF 截断每篇文档的实体数，写成数据集格式。
+
+    输出先写到 <output>.tmp，全部完成后原子替换，重复运行或中途失败都不会留下重复或半截的文件。
+    max_entities 需要先扫描一遍语料统计 IDF，其余条件只需一遍。
+
+    Returns:
+        Counter: 读入/写出的文档数与实体数，以及各原因丢弃的实体数
+    """
+    idf = corpus_idf(input_path, entity_filter) if max_entities is not None else None
+    counters = entity_filter.counters
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for _, item in tqdm(iter_jsonl(input_path), desc="Cleaning linked documents"):
+            counters["documents_in"] += 1
+            item = clean_item(item, entity_filter=entity_filter)
+            if idf is not None:
+                capped = cap_by_idf(item['linked_entities'], idf, max_entities)
+                counters["dropped_max_entities"] += len(item['linked_entities']) - len(capped)
+                item['linked_entities'] = capped
+            if drop_empty and not item['linked_entities']:
+                counters["dropped_documents_empty"] += 1
+                continue
+            counters["entities_out"] += len(item['linked_entities'])
+            counters["documents_out"] += 1
+            json.dump(item, f, ensure_ascii=False)
+            f.write("\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+
+    print(f"\nCleaned '{input_path}' -> '{output_path}':")
+    for key in ("documents_in", "documents_out", "dropped_documents_empty", "entities_in", "entities_out",
+                "dropped_source", "dropped_score", "dropped_type", "dropped_stop_list", "dropped_max_entities"):
+        print(f"    {key:<24}{counters[key]:>12}")
+    return counters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Filter linked entities and convert linker output to the dataset format, streaming.")
+    parser.add_argument("--input", default="output_linked_data.json")
+    parser.add_argument("--output", default="data.json")
+    parser.add_argument("--keep_sources", nargs="*", default=list(KEEP_SOURCES), help="为空时保留所有来源")
+    parser.add_argument("--min_score", default=0.0, type=float, help="link_score 的下限（模糊匹配的得分）")
+    parser.add_argument("--keep_types", nargs="*", default=None, help="只保留这些 original_type")
+    parser.add_argument("--drop_types", nargs="*", default=None)
+    parser.add_argument("--stop_list", default=None, help="停用实体表，每行一个文本、名称或 ID")
+    parser.add_argument("--max_entities", default=None, type=int, help="每篇文档最多保留的实体数，按语料 IDF 排序（需多扫描一遍）")
+    parser.add_argument("--drop_empty", action="store_true", help="丢弃过滤后没有实体的文档")
+    args = parser.parse_args()
+
+    entity_filter = EntityFilter(args.keep_sources, args.min_score, args.keep_types, args.drop_types,
+                                 load_stop_list(args.stop_list) if args.stop_list else ())
+    clean_file(args.input, args.output, entity_filter, args.max_entities, args.drop_empty)
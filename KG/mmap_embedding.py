@@ -0,0 +1,66 @@
+import json
+import os
+import numpy as np
+
+
+class MmapEmbeddingTable:
+    """
+    存放在 memory-map .npy 中的 embedding 表，配合逐行 Adagrad 做稀疏更新。
+
+    训练时每个 batch 只读入被访问到的行，梯度算完后只写回这些行；表本身就是最终产物，
+    不需要在训练结束时把整张表物化成一个 tensor。Adagrad 状态为每行一个标量（与
+    PyTorch-BigGraph 的 row-wise Adagrad 相同），保存在 <path>.adagrad.npy。
+    """
+
+    def __init__(self, path, num_rows, dim, dtype=np.float32, resume=True, seed=0, init=None, init_chunk_rows=65536):
+        self.path = path
+        self.state_path = path + ".adagrad.npy"
+        meta_path = path + ".meta.json"
+        existing = resume and os.path.exists(path) and os.path.exists(self.state_path) and os.path.exists(meta_path)
+        if existing:
+            self.weights = np.load(path, mmap_mode='r+')
+            self.state = np.load(self.state_path, mmap_mode='r+')
+            if self.weights.shape != (num_rows, dim):
+                raise ValueError(f"Embedding table at '{path}' has shape {self.weights.shape}, "
+                                 f"expected {(num_rows, dim)}. Pass resume=False to reinitialize it.")
+            print(f"Resuming embedding table from {path}.")
+        else:
+            self.weights = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(num_rows, dim))
+            self.state = np.lib.format.open_memmap(self.state_path, mode='w+', dtype=np.float32, shape=(num_rows,))
+            # 默认与 torch.nn.Embedding 相同的 N(0, 1) 初始化；init(rng, shape) 可替换。分块写入避免占用整表大小的内存
+            rng = np.random.default_rng(seed)
+            init = init or (lambda rng, shape: rng.standard_normal(shape, dtype=np.float32))
+            for start in range(0, num_rows, init_chunk_rows):
+                end = min(start + init_chunk_rows, num_rows)
+                self.weights[start:end] = init(rng, (end - start, dim))
+            self.state[:] = 0.0
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"num_rows": num_rows, "dim": dim, "dtype": np.dtype(dtype).name}, f)
+        self.num_rows, self.dim = self.weights.shape
+
+    @classmethod
+    def open(cls, path):
+        """打开已存在的表（不做形状检查和初始化），供多个进程各自 memory-map 同一份文件。"""
+        table = cls.__new__(cls)
+        table.path = path
+        table.state_path = path + ".adagrad.npy"
+        table.weights = np.load(path, mmap_mode='r+')
+        table.state = np.load(table.state_path, mmap_mode='r+')
+        table.num_rows, table.dim = table.weights.shape
+        return table
+
+    def gather(self, rows):
+        """读取若干行（rows 应已排序去重，按文件顺序访问页缓存）。"""
+        return np.asarray(self.weights[rows], dtype=np.float32)
+
+    def adagrad_update(self, rows, grads, lr, eps=1e-10):
+        """对 rows 做逐行 Adagrad：state += mean(g^2)，w -= lr * g / sqrt(state)。"""
+        grads = np.asarray(grads, dtype=np.float32)
+        state = self.state[rows] + np.mean(grads * grads, axis=1)
+        self.state[rows] = state
+        update = lr * grads / (np.sqrt(state)[:, None] + eps)
+        self.weights[rows] = self.gather(rows) - update
+
+    def flush(self):
+        self.weights.flush()
+        self.state.flush()
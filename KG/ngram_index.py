@@ -0,0 +1,324 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from scipy import sparse
+from dict_linker import iter_umls_aliases, iter_wikidata_aliases
+
+NGRAM_FORMAT_VERSION = 2
+NGRAM_SIZE = 3
+# 高频 n-gram 的判定下限：倒排长度不超过它的 n-gram 扫描代价很小，总是用于召回候选
+MIN_FREQUENT_DF = 1000
+
+
+def normalize_alias(text):
+    return " ".join(text.lower().split())
+
+
+def alias_key(text):
+    """规范化文本的 64 位哈希，用于精确匹配别名。"""
+    return int.from_bytes(hashlib.blake2b(normalize_alias(text).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    """规范化后首尾各补一个空格再切 n-gram，使词首词尾的 n-gram 与词中的区分开。"""
+    padded = f" {normalize_alias(text)} "
+    return [padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))]
+
+
+def _tfidf_rows(counts_per_row, idf, extra_sq=None):
+    """
+    counts_per_row 为 [(gram_ids, counts), ...]，返回逐行 L2 归一化后的 (indptr, indices, data)。
+    extra_sq 为每行额外计入范数的平方和（查询中词表外的 n-gram）。
+    """
+    lengths = np.array([len(ids) for ids, _ in counts_per_row], dtype=np.int64)
+    indptr = np.zeros(len(counts_per_row) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.concatenate([ids for ids, _ in counts_per_row]).astype(np.int64) if len(counts_per_row) else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate([c for _, c in counts_per_row]) if len(counts_per_row) else np.zeros(0, dtype=np.float32)
+    data = ((1.0 + np.log(counts)) * idf[indices]).astype(np.float32)
+    sq = np.bincount(np.repeat(np.arange(len(lengths)), lengths), weights=data.astype(np.float64) ** 2,
+                     minlength=len(lengths)).astype(np.float64)
+    if extra_sq is not None:
+        sq += extra_sq
+    data /= np.repeat(np.sqrt(np.maximum(sq, 1e-24)), lengths).astype(np.float32)
+    return indptr, indices, data
+
+
+def build_ngram_index(index_dir, mrconso_path=None, wikidata_aliases_path=None, umls_sources=None,
+                      min_alias_length=3, max_df=0.01):
+    """
+    为别名表建立字符 3-gram TF-IDF 索引，用于精确匹配失败后的模糊候选召回。
+
+    与 dict_linker 一样 Wikidata 先加载；同一规范化别名指向多个实体时保留先出现的，
+    除非后出现的是首选名而先出现的不是。
+    TF 取 1 + log(次数)，IDF 取平滑的 log((1 + N) / (1 + df)) + 1，每行 L2 归一化后内积即余弦相似度。
+    出现在超过 max_df 比例（且多于 MIN_FREQUENT_DF 个）别名中的 n-gram（如 " th"）记为高频：
+    查询时不沿它们的倒排召回候选，避免扫过大半个别名表；召回的候选再用完整 TF-IDF 余弦重新打分，
+    因此高频 n-gram 只影响召回范围，不影响得分。与查询规范化后完全相同的别名按哈希直接加入候选。
+
+    产物:
+        matrix.npz        (别名数, n-gram 数) 的 CSR 矩阵（scipy.sparse.save_npz）
+        ngrams.json       n-gram 词表，下标即列号
+        idf.npy           每个 n-gram 的 IDF
+        frequent.npy      每个 n-gram 是否为高频（不用于召回）
+        alias_entity.npy  每行别名对应的实体下标
+        alias_keys.npy    排序后的别名哈希（alias_key），alias_key_rows.npy 为对应的行号
+        entities.json     实体 [id, name, description, source]
+        meta.json         格式版本、规模与参数
+    """
+    entities, entity_index = [], {}
+    alias_owner = {}
+
+    def add(entity_id, name, description, source, alias, preferred):
+        alias = normalize_alias(alias)
+        if len(alias) < min_alias_length:
+            return
+        index = entity_index.get(entity_id)
+        if index is None:
+            index = entity_index[entity_id] = len(entities)
+            entities.append([entity_id, name, description, source])
+        elif preferred and name and entities[index][1] == entity_id:
+            entities[index][1] = name
+        owner = alias_owner.get(alias)
+        if owner is None or (preferred and not owner[1]):
+            alias_owner[alias] = (index, preferred)
+
+    if wikidata_aliases_path:
+        for qid, label, aliases, description in iter_wikidata_aliases(wikidata_aliases_path):
+            add(qid, label, description, "Wikidata", label, True)
+            for alias in aliases:
+                add(qid, label, description, "Wikidata", alias, False)
+    if mrconso_path:
+        for cui, text, preferred in iter_umls_aliases(mrconso_path, umls_sources):
+            add(cui, text if preferred else cui, "N/A", "MeSH/UMLS", text, preferred)
+
+    vocab = {}
+    rows = []
+    alias_entity = np.empty(len(alias_owner), dtype=np.int32)
+    alias_keys = np.fromiter((alias_key(alias) for alias in alias_owner), dtype=np.uint64, count=len(alias_owner))
+    for row, (alias, (index, _)) in enumerate(alias_owner.items()):
+        grams, counts = np.unique([vocab.setdefault(g, len(vocab)) for g in char_ngrams(alias)], return_counts=True)
+        rows.append((grams, counts.astype(np.float32)))
+        alias_entity[row] = index
+    num_aliases = len(rows)
+    del alias_owner
+
+    df = np.bincount(np.concatenate([g for g, _ in rows]) if rows else np.zeros(0, dtype=np.int64),
+                     minlength=len(vocab))
+    idf = (np.log((1.0 + num_aliases) / (1.0 + df)) + 1.0).astype(np.float32)
+    indptr, indices, data = _tfidf_rows(rows, idf)
+    del rows
+    frequent = df > max(max_df * num_aliases, MIN_FREQUENT_DF)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(num_aliases, len(vocab)), dtype=np.float32)
+
+    tmp_dir = index_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    sparse.save_npz(os.path.join(tmp_dir, "matrix.npz"), matrix, compressed=False)
+    with open(os.path.join(tmp_dir, "ngrams.json"), 'w', encoding='utf-8') as f:
+        json.dump(list(vocab), f, ensure_ascii=False)
+    np.save(os.path.join(tmp_dir, "idf.npy"), idf)
+    np.save(os.path.join(tmp_dir, "frequent.npy"), frequent)
+    np.save(os.path.join(tmp_dir, "alias_entity.npy"), alias_entity)
+    key_order = np.argsort(alias_keys, kind='stable')
+    np.save(os.path.join(tmp_dir, "alias_keys.npy"), alias_keys[key_order])
+    np.save(os.path.join(tmp_dir, "alias_key_rows.npy"), key_order.astype(np.int32))
+    with open(os.path.join(tmp_dir, "entities.json"), 'w', encoding='utf-8') as f:
+        json.dump(entities, f, ensure_ascii=False)
+    with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "format_version": NGRAM_FORMAT_VERSION,
+            "ngram_size": NGRAM_SIZE,
+            "num_aliases": int(num_aliases),
+            "num_entities": len(entities),
+            "num_ngrams": len(vocab),
+            "frequent_ngrams": int(frequent.sum()),
+            "nnz": int(matrix.nnz),
+            "min_alias_length": min_alias_length,
+            "max_df": max_df,
+            "umls_sources": list(umls_sources) if umls_sources else None,
+            "mrconso": os.path.abspath(mrconso_path) if mrconso_path else None,
+            "wikidata_aliases": os.path.abspath(wikidata_aliases_path) if wikidata_aliases_path else None,
+        }, f, indent=2)
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+    print(f"N-gram index built at '{index_dir}': {len(entities)} entities, {num_aliases} aliases, "
+          f"{len(vocab)} {NGRAM_SIZE}-grams ({int(frequent.sum())} frequent), {matrix.nnz} non-zeros.")
+
+
+class NgramIndex:
+    """
+    字符 n-gram TF-IDF 索引的只读视图。
+
+    查询按批构造稀疏矩阵：先只用非高频 n-gram 做一次稀疏乘法召回候选（只含高频 n-gram 的查询用其中最罕见的一个），
+    每个查询取召回得分最高的 shortlist 个别名并加上与它完全相同的别名，再用完整 TF-IDF 余弦重新打分。
+    """
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != NGRAM_FORMAT_VERSION:
+            raise ValueError(f"N-gram index at '{index_dir}' has format {self.meta.get('format_version')}, "
+                             f"expected {NGRAM_FORMAT_VERSION}. Rebuild it with build_ngram_index().")
+        with open(os.path.join(index_dir, "ngrams.json"), 'r', encoding='utf-8') as f:
+            self.vocab = {gram: i for i, gram in enumerate(json.load(f))}
+        with open(os.path.join(index_dir, "entities.json"), 'r', encoding='utf-8') as f:
+            self.entities = json.load(f)
+        self.idf = np.load(os.path.join(index_dir, "idf.npy"))
+        self.frequent = np.load(os.path.join(index_dir, "frequent.npy"))
+        self.alias_entity = np.load(os.path.join(index_dir, "alias_entity.npy"))
+        self.alias_keys = np.load(os.path.join(index_dir, "alias_keys.npy"))
+        self.alias_key_rows = np.load(os.path.join(index_dir, "alias_key_rows.npy"))
+        self.matrix = sparse.load_npz(os.path.join(index_dir, "matrix.npz")).tocsr()
+        # 召回用的倒排只含非高频 n-gram，且每行在这些 n-gram 上重新归一化：召回得分是只看非高频 n-gram 的余弦
+        rare = self.matrix.copy()
+        rare.data[self.frequent[rare.indices]] = 0.0
+        rare.eliminate_zeros()
+        norms = np.sqrt(np.asarray(rare.multiply(rare).sum(axis=1)).ravel())
+        rare = sparse.diags(1.0 / np.maximum(norms, 1e-12)).astype(np.float32) @ rare
+        # 查询矩阵 (Q, V) 乘以 (V, A)；预先转置为 CSR，避免每批都转换
+        self.recall_t = rare.T.tocsr()
+        # 高频 n-gram 的完整倒排，只给全由高频 n-gram 组成的查询使用
+        self.frequent_ids = np.flatnonzero(self.frequent)
+        self.frequent_t = self.matrix.T.tocsr()[self.frequent_ids]
+        # 词表外的 n-gram 按最大 IDF 计入查询范数：查询里陌生的部分越多，得分越低
+        self.unknown_idf = float(np.log(1.0 + self.meta["num_aliases"]) + 1.0)
+
+    def __len__(self):
+        return len(self.alias_entity)
+
+    def vectorize(self, mentions):
+        """把一批提及文本转成逐行 L2 归一化的 (Q, V) TF-IDF 稀疏矩阵。"""
+        rows = []
+        unknown_sq = np.zeros(len(mentions), dtype=np.float64)
+        for i, mention in enumerate(mentions):
+            grams, counts = np.unique(char_ngrams(mention), return_counts=True)
+            ids = np.array([self.vocab.get(g, -1) for g in grams], dtype=np.int64)
+            known = ids >= 0
+            unknown_sq[i] = (((1.0 + np.log(counts[~known])) * self.unknown_idf) ** 2).sum()
+            rows.append((ids[known], counts[known].astype(np.float32)))
+        indptr, indices, data = _tfidf_rows(rows, self.idf, unknown_sq)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(mentions), len(self.idf)), dtype=np.float32)
+
+    def exact_rows(self, mentions):
+        """每个提及规范化后完全相同的别名行号，没有时为 -1。"""
+        keys = np.fromiter((alias_key(m) for m in mentions), dtype=np.uint64, count=len(mentions))
+        if len(self.alias_keys) == 0:
+            return np.full(len(mentions), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.alias_keys, keys), len(self.alias_keys) - 1)
+        return np.where(self.alias_keys[pos] == keys, self.alias_key_rows[pos], -1).astype(np.int64)
+
+    def _shortlist(self, mentions, queries, shortlist):
+        """
+        每个查询的候选别名：沿非高频 n-gram 召回，取召回得分最高的 shortlist 个；
+        全由高频 n-gram 组成的查询取其中 IDF 最高（倒排最短）的 n-gram 的整条倒排。
+        召回得分相同的别名可能多于 shortlist，因此完全相同的别名总是另外加入。
+        """
+        exact = self.exact_rows(mentions)
+        rare = queries.copy()
+        rare.data[self.frequent[rare.indices]] = 0.0
+        rare.eliminate_zeros()
+        recalled = (rare @ self.recall_t).tocsr()
+        candidates = []
+        for i in range(queries.shape[0]):
+            row = slice(recalled.indptr[i], recalled.indptr[i + 1])
+            aliases, partial = recalled.indices[row], recalled.data[row]
+            if rare.indptr[i + 1] == rare.indptr[i] and queries.indptr[i + 1] > queries.indptr[i]:
+                grams = queries.indices[queries.indptr[i]:queries.indptr[i + 1]]
+                gram = grams[np.argmax(self.idf[grams])]
+                posting = np.searchsorted(self.frequent_ids, gram)
+                aliases = self.frequent_t.indices[self.frequent_t.indptr[posting]:self.frequent_t.indptr[posting + 1]]
+            elif len(aliases) > shortlist:
+                aliases = aliases[np.argpartition(-partial, shortlist - 1)[:shortlist]]
+            if exact[i] >= 0 and exact[i] not in aliases:
+                aliases = np.append(aliases, exact[i])
+            candidates.append(aliases)
+        return candidates
+
+    def search(self, mentions, k=5, threshold=0.0, batch_size=256, shortlist=64):
+        """
+        批量查询每个提及最相似的 k 个实体（同一实体的多个别名只保留得分最高的一个）。
+
+        Returns:
+            list，与 mentions 对齐，每项为按得分降序的 [(实体下标, 余弦得分), ...]，只含得分 >= threshold 的候选
+        """
+        results = []
+        # 别名去重到实体前先多取一些，保证去重后仍尽量有 k 个
+        shortlist = max(shortlist, 4 * k)
+        for start in range(0, len(mentions), batch_size):
+            batch = mentions[start:start + batch_size]
+            queries = self.vectorize(batch)
+            shortlisted = self._shortlist(batch, queries, shortlist)
+            # 整批一起用完整 TF-IDF 向量重新打分：逐对取查询行与别名行的内积，即余弦相似度
+            pair_query = np.repeat(np.arange(len(shortlisted)), [len(a) for a in shortlisted])
+            pair_alias = np.concatenate(shortlisted) if shortlisted else np.zeros(0, dtype=np.int64)
+            pair_sims = np.asarray(queries[pair_query].multiply(self.matrix[pair_alias]).sum(axis=1)).ravel()
+            offset = 0
+            for aliases in shortlisted:
+                sims = pair_sims[offset:offset + len(aliases)]
+                offset += len(aliases)
+                keep = sims >= threshold
+                aliases, sims = aliases[keep], sims[keep]
+                order = np.argsort(-sims, kind='stable')
+                candidates, seen = [], set()
+                for alias, sim in zip(aliases[order], sims[order]):
+                    entity = int(self.alias_entity[alias])
+                    if entity not in seen:
+                        seen.add(entity)
+                        candidates.append((entity, float(sim)))
+                        if len(candidates) == k:
+                            break
+                results.append(candidates)
+        return results
+
+    def entity_info(self, entity, score):
+        entity_id, name, description, source = self.entities[entity]
+        return {"id": entity_id, "name": name, "description": description, "source": source, "score": score}
+
+    def link(self, mentions, threshold=0.75, batch_size=256):
+        """每个提及取得分最高且不低于 threshold 的实体，返回与 linker 相同格式的 info（另带 score），否则为 None。"""
+        return [self.entity_info(*candidates[0]) if candidates else None
+                for candidates in self.search(mentions, k=1, threshold=threshold, batch_size=batch_size)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Build or query a char-3-gram TF-IDF candidate index over UMLS/Wikidata aliases.")
+    parser.add_argument("--index_dir", default="./ngram_index")
+    parser.add_argument("--mrconso", default=None)
+    parser.add_argument("--umls_sources", nargs="*", default=None, help="只使用这些 SAB 词表，如 MSH")
+    parser.add_argument("--wikidata_aliases", default=None, help="QID<TAB>label<TAB>aliases(|分隔)<TAB>description")
+    parser.add_argument("--min_alias_length", default=3, type=int)
+    parser.add_argument("--max_df", default=0.01, type=float, help="出现在更多比例别名中的 n-gram 不用于召回候选（仍参与打分）")
+    parser.add_argument("--query", nargs="*", default=None, help="给出时查询索引并打印候选")
+    parser.add_argument("--query_file", default=None, help="每行一个提及，批量查询并报告吞吐")
+    parser.add_argument("--k", default=5, type=int)
+    parser.add_argument("--threshold", default=0.0, type=float)
+    args = parser.parse_args()
+
+    if args.query is None and args.query_file is None:
+        if not args.mrconso and not args.wikidata_aliases:
+            parser.error("at least one of --mrconso / --wikidata_aliases is required to build the index")
+        build_ngram_index(args.index_dir, args.mrconso, args.wikidata_aliases, args.umls_sources,
+                          args.min_alias_length, args.max_df)
+    else:
+        index = NgramIndex(args.index_dir)
+        if args.query:
+            for mention, candidates in zip(args.query, index.search(args.query, args.k, args.threshold)):
+                print(mention)
+                for entity, score in candidates:
+                    entity_id, name, _, source = index.entities[entity]
+                    print(f"    {score:.3f}  {entity_id:<12} {source:<10} {name}")
+        if args.query_file:
+            with open(args.query_file, 'r', encoding='utf-8') as f:
+                mentions = [line.strip() for line in f if line.strip()]
+            start = time.time()
+            linked = index.search(mentions, args.k, args.threshold)
+            elapsed = time.time() - start
+            print(f"Queried {len(mentions)} mentions in {elapsed:.2f}s ({len(mentions) / max(elapsed, 1e-9):.0f} mentions/s), "
+                  f"{sum(1 for c in linked if c)} with candidates >= {args.threshold}.")
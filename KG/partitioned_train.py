@@ -0,0 +1,471 @@
+import argparse
+import json
+import os
+import queue
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from tqdm import tqdm
+from kg_store import open_kg
+from mmap_embedding import MmapEmbeddingTable
+from random_walk import CSRGraph, context_windows, random_walks, skipgram_pairs
+
+MARGIN = 1.0  # 与 torch_geometric RotatE 的默认 margin 相同
+
+
+def partition_of(entity_ids, num_partitions):
+    """实体 i 属于第 i % P 个分区，分区内下标为 i // P。"""
+    entity_ids = np.asarray(entity_ids, dtype=np.int64)
+    return entity_ids % num_partitions, entity_ids // num_partitions
+
+
+def partition_sizes(num_entities, num_partitions):
+    return [(num_entities - p + num_partitions - 1) // num_partitions for p in range(num_partitions)]
+
+
+def bucket_edges(triplets_htr, num_partitions, work_dir):
+    """
+    把三元组按 (head 分区, tail 分区) 切成 P x P 个桶，写成一个按桶排序的数组加偏移表：
+        buckets.npy         (N, 3)，列为分区内 head 下标、relation、分区内 tail 下标
+        bucket_offsets.npy  第 b 个桶（b = head 分区 * P + tail 分区）为 [offsets[b], offsets[b + 1])
+    """
+    triplets_htr = np.asarray(triplets_htr, dtype=np.int64)
+    head_part, head_local = partition_of(triplets_htr[:, 0], num_partitions)
+    tail_part, tail_local = partition_of(triplets_htr[:, 1], num_partitions)
+    bucket = head_part * num_partitions + tail_part
+    order = np.argsort(bucket, kind='stable')
+    edges = np.stack([head_local, triplets_htr[:, 2], tail_local], axis=1)[order]
+    offsets = np.zeros(num_partitions * num_partitions + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bucket, minlength=num_partitions * num_partitions), out=offsets[1:])
+    np.save(os.path.join(work_dir, "buckets.npy"), edges)
+    np.save(os.path.join(work_dir, "bucket_offsets.npy"), offsets)
+    return offsets
+
+
+def bucket_pairs(u, v, num_partitions, work_dir):
+    """
+    与 bucket_edges 相同，把 skip-gram 正样本对 (u, v) 按 (u 分区, v 分区) 切成 P x P 个桶：
+        pairs.npy         (N, 2)，列为分区内 u 下标、分区内 v 下标
+        pair_offsets.npy  第 b 个桶（b = u 分区 * P + v 分区）为 [offsets[b], offsets[b + 1])
+    """
+    u_part, u_local = partition_of(u, num_partitions)
+    v_part, v_local = partition_of(v, num_partitions)
+    bucket = u_part * num_partitions + v_part
+    order = np.argsort(bucket, kind='stable')
+    pairs = np.stack([u_local, v_local], axis=1)[order]
+    offsets = np.zeros(num_partitions * num_partitions + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bucket, minlength=num_partitions * num_partitions), out=offsets[1:])
+    np.save(os.path.join(work_dir, "pairs.npy"), pairs)
+    np.save(os.path.join(work_dir, "pair_offsets.npy"), offsets)
+    return offsets
+
+
+def partition_path(work_dir, partition):
+    return os.path.join(work_dir, f"entities_part{partition}.npy")
+
+
+class BucketLockServer:
+    """
+    分区所有权的锁服务：同一时刻每个实体分区至多被一个 worker 持有，
+    因此并发训练的桶两两不共享实体 embedding，可以各自直接写 memory-map 而无需加锁。
+    与 PyTorch-BigGraph 一样，优先分配与 worker 上一个桶共享分区的桶，减少换页。
+    """
+
+    def __init__(self, num_partitions, ctx):
+        self.num_partitions = num_partitions
+        self.lock = ctx.Lock()
+        self.partition_busy = ctx.Array('b', num_partitions, lock=False)
+        # 0: 待训练, 1: 训练中, 2: 已完成
+        self.bucket_state = ctx.Array('b', num_partitions * num_partitions, lock=False)
+
+    def new_epoch(self, bucket_sizes):
+        with self.lock:
+            for p in range(self.num_partitions):
+                self.partition_busy[p] = 0
+            for b, size in enumerate(bucket_sizes):
+                self.bucket_state[b] = 0 if size else 2
+
+    def acquire(self, prev_bucket=None, poll_interval=0.01):
+        """返回一个可训练的桶编号；所有桶都已完成时返回 None，暂时没有可用的桶时等待。"""
+        P = self.num_partitions
+        while True:
+            with self.lock:
+                pending = [b for b in range(P * P) if self.bucket_state[b] != 2]
+                if not pending:
+                    return None
+                free = [b for b in pending if self.bucket_state[b] == 0
+                        and not self.partition_busy[b // P] and not self.partition_busy[b % P]]
+                if free:
+                    if prev_bucket is not None:
+                        prev = {prev_bucket // P, prev_bucket % P}
+                        free.sort(key=lambda b: -len(prev & {b // P, b % P}))
+                    bucket = free[0]
+                    self.bucket_state[bucket] = 1
+                    self.partition_busy[bucket // P] = 1
+                    self.partition_busy[bucket % P] = 1
+                    return bucket
+            time.sleep(poll_interval)
+
+    def release(self, bucket):
+        with self.lock:
+            self.bucket_state[bucket] = 2
+            self.partition_busy[bucket // self.num_partitions] = 0
+            self.partition_busy[bucket % self.num_partitions] = 0
+
+
+def _collect_results(workers, result_queue, epoch, poll_interval=1.0):
+    """
+    等待每个 worker 的结果。某个 worker 异常退出时它持有的桶停留在“训练中”，其它 worker 会在 acquire 中一直等待，
+    因此一旦发现非零退出码就终止全部 worker 并报错，而不是无限阻塞。
+    """
+    results = []
+    while len(results) < len(workers):
+        try:
+            results.append(result_queue.get(timeout=poll_interval))
+            continue
+        except queue.Empty:
+            pass
+        failed = [w for w in workers if w.exitcode not in (None, 0)]
+        if failed or all(w.exitcode is not None for w in workers):
+            for w in workers:
+                if w.is_alive():
+                    w.terminate()
+                w.join()
+            code = failed[0].exitcode if failed else 0
+            raise RuntimeError(f"Training worker exited with code {code} in epoch {epoch} "
+                               f"({len(results)} of {len(workers)} workers reported results).")
+    return results
+
+
+def _run_buckets(ctx, server, bucket_sizes, num_workers, target, worker_args, epoch):
+    """启动 num_workers 个进程训练一轮桶，worker_args(rank, result_queue) 返回第 rank 个 worker 的参数。"""
+    server.new_epoch(bucket_sizes.tolist())
+    result_queue = ctx.Queue()
+    workers = [ctx.Process(target=target, args=worker_args(rank, result_queue)) for rank in range(num_workers)]
+    for w in workers:
+        w.start()
+    results = _collect_results(workers, result_queue, epoch)
+    for w in workers:
+        w.join()
+        if w.exitcode != 0:
+            raise RuntimeError(f"Training worker exited with code {w.exitcode} in epoch {epoch}.")
+    return results
+
+
+def _check_work_dir(work_dir, meta, resume):
+    """resume 时 work_dir 必须是由同一 KG 和配置创建的；返回是否真的从 work_dir 继续。"""
+    meta_path = os.path.join(work_dir, "meta.json")
+    if not (resume and os.path.exists(meta_path)):
+        return False
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        if json.load(f) != meta:
+            raise ValueError(f"'{work_dir}' was created for a different KG or configuration; "
+                             f"pass resume=False or use another work_dir.")
+    print(f"Resuming partitioned training from '{work_dir}'.")
+    return True
+
+
+def rotate_score(head, rel_theta, tail, hidden):
+    """与 torch_geometric RotatE.forward 相同；实体向量前一半为实部、后一半为虚部。"""
+    head_re, head_im = head[:, :hidden], head[:, hidden:]
+    tail_re, tail_im = tail[:, :hidden], tail[:, hidden:]
+    rel_re, rel_im = torch.cos(rel_theta), torch.sin(rel_theta)
+    re_score = (rel_re * head_re - rel_im * head_im) - tail_re
+    im_score = (rel_re * head_im + rel_im * head_re) - tail_im
+    score = torch.linalg.vector_norm(torch.stack([re_score, im_score], dim=2), dim=(1, 2))
+    return MARGIN - score
+
+
+def _gather_rows(table, ids):
+    rows, inverse = np.unique(ids, return_inverse=True)
+    return rows, torch.from_numpy(inverse.reshape(-1)), torch.from_numpy(table.gather(rows)).requires_grad_()
+
+
+def _train_batch(batch, head_table, tail_table, rel_emb, rel_state, hidden, lr, rng):
+    """一个 batch：按 PyG RotatE.loss 的方式前一半换头、后一半换尾构造负样本（在本桶的分区内采样）。"""
+    heads, rels, tails = batch[:, 0], batch[:, 1], batch[:, 2]
+    num_neg = len(batch) // 2
+    neg_heads, neg_tails = heads.copy(), tails.copy()
+    neg_heads[:num_neg] = rng.integers(0, head_table.num_rows, num_neg)
+    neg_tails[num_neg:] = rng.integers(0, tail_table.num_rows, len(batch) - num_neg)
+    head_ids, tail_ids = np.concatenate([heads, neg_heads]), np.concatenate([tails, neg_tails])
+
+    if head_table is tail_table:
+        rows, inverse, emb = _gather_rows(head_table, np.concatenate([head_ids, tail_ids]))
+        head_emb, tail_emb = emb[inverse[:len(head_ids)]], emb[inverse[len(head_ids):]]
+        updates = [(head_table, rows, emb)]
+    else:
+        head_rows, head_inv, head_weights = _gather_rows(head_table, head_ids)
+        tail_rows, tail_inv, tail_weights = _gather_rows(tail_table, tail_ids)
+        head_emb, tail_emb = head_weights[head_inv], tail_weights[tail_inv]
+        updates = [(head_table, head_rows, head_weights), (tail_table, tail_rows, tail_weights)]
+
+    rel_rows, rel_inv = np.unique(np.concatenate([rels, rels]), return_inverse=True)
+    rel_rows = torch.from_numpy(rel_rows)
+    rel_theta = rel_emb[rel_rows].clone().requires_grad_()
+    score = rotate_score(head_emb, rel_theta[torch.from_numpy(rel_inv.reshape(-1))], tail_emb, hidden)
+    target = torch.cat([torch.ones(len(batch)), torch.zeros(len(batch))])
+    loss = F.binary_cross_entropy_with_logits(score, target)
+    loss.backward()
+
+    for table, rows, weights in updates:
+        table.adagrad_update(rows, weights.grad.numpy(), lr)
+    # 关系 embedding 在共享内存中被所有 worker 无锁更新（Hogwild），同样使用逐行 Adagrad
+    grad = rel_theta.grad
+    rel_state[rel_rows] += grad.pow(2).mean(dim=1)
+    rel_emb[rel_rows] -= lr * grad / (rel_state[rel_rows].sqrt().unsqueeze(1) + 1e-10)
+    return loss.item()
+
+
+def _train_worker(rank, work_dir, num_partitions, hidden, lr, batch_size, seed, server, rel_emb, rel_state,
+                  result_queue, threads_per_worker):
+    torch.set_num_threads(threads_per_worker)
+    rng = np.random.default_rng(seed)
+    edges = np.load(os.path.join(work_dir, "buckets.npy"), mmap_mode='r')
+    offsets = np.load(os.path.join(work_dir, "bucket_offsets.npy"))
+    total_loss, num_batches, num_buckets = 0.0, 0, 0
+    bucket = None
+    while True:
+        bucket = server.acquire(bucket)
+        if bucket is None:
+            break
+        head_part, tail_part = divmod(bucket, num_partitions)
+        head_table = MmapEmbeddingTable.open(partition_path(work_dir, head_part))
+        tail_table = head_table if head_part == tail_part else MmapEmbeddingTable.open(partition_path(work_dir, tail_part))
+        bucket_triplets = np.asarray(edges[offsets[bucket]:offsets[bucket + 1]])
+        bucket_triplets = bucket_triplets[rng.permutation(len(bucket_triplets))]
+        for start in range(0, len(bucket_triplets), batch_size):
+            total_loss += _train_batch(bucket_triplets[start:start + batch_size], head_table, tail_table,
+                                       rel_emb, rel_state, hidden, lr, rng)
+            num_batches += 1
+        head_table.flush()
+        tail_table.flush()
+        server.release(bucket)
+        num_buckets += 1
+    result_queue.put((rank, total_loss, num_batches, num_buckets))
+
+
+def train_partitioned_rotate(data_dir, work_dir="./rotate_partitions", num_partitions=8, num_workers=4,
+                             embedding_dim=768, epochs=50, lr=0.1, batch_size=1024, seed=0, resume=True,
+                             output_prefix="."):
+    """
+    PyTorch-BigGraph 式的分区并行 RotatE 训练（CPU 多进程）。
+
+    实体分成 P 个分区，每个分区的 embedding 是 work_dir 下的一个 memory-map 表；三元组按
+    (head 分区, tail 分区) 分成 P x P 个桶。每个 epoch 启动 num_workers 个进程，通过
+    BucketLockServer 领取互不共享分区的桶并发训练。P 至少取 2 * num_workers 才能让所有 worker 同时工作。
+
+    输出与 create_embedding.train_embeddings_with_pyg 相同：entity_embeddings_rotate.pt（实体向量实部）
+    和 relation_embeddings_rotate.pt，另写一份 memory-map 的 entity_embeddings_rotate.npy。
+    """
+    kg = open_kg(data_dir)
+    num_entities, num_relations = kg.num_entities, kg.num_relations
+    hidden = embedding_dim // 2
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"Loaded {num_entities} entities, {num_relations} relations, and {len(kg.triplets)} triplets.")
+
+    meta_path = os.path.join(work_dir, "meta.json")
+    meta = {"num_entities": num_entities, "num_relations": num_relations, "num_triplets": int(len(kg.triplets)),
+            "num_partitions": num_partitions, "embedding_dim": embedding_dim}
+    resume = _check_work_dir(work_dir, meta, resume)
+    if resume:
+        offsets = np.load(os.path.join(work_dir, "bucket_offsets.npy"))
+    else:
+        offsets = bucket_edges(kg.triplets, num_partitions, work_dir)
+
+    # 与 RotatE.reset_parameters 相同：实体实部/虚部 xavier_uniform，关系相位 U(0, 2*pi)
+    bound = np.sqrt(6.0 / (num_entities + hidden))
+    init = lambda rng, shape: rng.uniform(-bound, bound, size=shape).astype(np.float32)
+    for p, size in enumerate(partition_sizes(num_entities, num_partitions)):
+        MmapEmbeddingTable(partition_path(work_dir, p), size, 2 * hidden, resume=resume, seed=seed + p, init=init)
+
+    relation_path = os.path.join(work_dir, "relations.pt")
+    if resume and os.path.exists(relation_path):
+        rel_emb, rel_state = torch.load(relation_path)
+    else:
+        generator = torch.Generator().manual_seed(seed)
+        rel_emb = torch.rand(num_relations, hidden, generator=generator) * (2 * np.pi)
+        rel_state = torch.zeros(num_relations)
+    rel_emb.share_memory_()
+    rel_state.share_memory_()
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    ctx = mp.get_context()
+    server = BucketLockServer(num_partitions, ctx)
+    bucket_sizes = np.diff(offsets)
+    threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+    print(f"Training with {num_workers} workers over {num_partitions} partitions "
+          f"({int((bucket_sizes > 0).sum())} non-empty buckets).")
+
+    for epoch in range(1, epochs + 1):
+        start_time = time.time()
+        results = _run_buckets(ctx, server, bucket_sizes, num_workers, _train_worker, lambda rank, result_queue: (
+            rank, work_dir, num_partitions, hidden, lr, batch_size, seed + epoch * num_workers + rank, server,
+            rel_emb, rel_state, result_queue, threads_per_worker), epoch)
+        torch.save((rel_emb, rel_state), relation_path)
+        total_loss = sum(r[1] for r in results)
+        num_batches = sum(r[2] for r in results)
+        print(f"Epoch {epoch}/{epochs}, Average Loss: {total_loss / max(num_batches, 1):.4f}, "
+              f"time: {time.time() - start_time:.1f}s")
+
+    entity_npy = os.path.join(output_prefix, "entity_embeddings_rotate.npy")
+    out = np.lib.format.open_memmap(entity_npy, mode='w+', dtype=np.float32, shape=(num_entities, hidden))
+    for p in range(num_partitions):
+        table = MmapEmbeddingTable.open(partition_path(work_dir, p))
+        out[p::num_partitions] = table.weights[:, :hidden]
+    out.flush()
+    del out
+    entity_embeddings = torch.from_numpy(np.load(entity_npy))
+    torch.save(entity_embeddings, os.path.join(output_prefix, "entity_embeddings_rotate.pt"))
+    torch.save(rel_emb.clone(), os.path.join(output_prefix, "relation_embeddings_rotate.pt"))
+    print(f"Entity embeddings saved to entity_embeddings_rotate.pt. Shape: {entity_embeddings.shape}")
+
+
+def _train_pair_batch(batch, u_table, v_table, lr, rng):
+    """一个 batch 的 skip-gram（负采样）loss：每个正样本对配一个在 v 分区内均匀采样的负样本，与 walk_loss 相同。"""
+    us, vs = batch[:, 0], batch[:, 1]
+    negs = rng.integers(0, v_table.num_rows, len(batch))
+    if u_table is v_table:
+        rows, inverse, emb = _gather_rows(u_table, np.concatenate([us, vs, negs]))
+        u_emb, v_emb, neg_emb = emb[inverse].view(3, len(batch), -1)
+        updates = [(u_table, rows, emb)]
+    else:
+        u_rows, u_inv, u_weights = _gather_rows(u_table, us)
+        v_rows, v_inv, v_weights = _gather_rows(v_table, np.concatenate([vs, negs]))
+        u_emb = u_weights[u_inv]
+        v_emb, neg_emb = v_weights[v_inv].view(2, len(batch), -1)
+        updates = [(u_table, u_rows, u_weights), (v_table, v_rows, v_weights)]
+
+    loss = (-F.logsigmoid((u_emb * v_emb).sum(dim=-1)).mean()
+            - F.logsigmoid(-(u_emb * neg_emb).sum(dim=-1)).mean())
+    loss.backward()
+    for table, rows, weights in updates:
+        table.adagrad_update(rows, weights.grad.numpy(), lr)
+    return loss.item()
+
+
+def _train_pair_worker(rank, work_dir, num_partitions, lr, batch_size, seed, server, result_queue,
+                       threads_per_worker):
+    torch.set_num_threads(threads_per_worker)
+    rng = np.random.default_rng(seed)
+    pairs = np.load(os.path.join(work_dir, "pairs.npy"), mmap_mode='r')
+    offsets = np.load(os.path.join(work_dir, "pair_offsets.npy"))
+    total_loss, num_batches, num_buckets = 0.0, 0, 0
+    bucket = None
+    while True:
+        bucket = server.acquire(bucket)
+        if bucket is None:
+            break
+        u_part, v_part = divmod(bucket, num_partitions)
+        u_table = MmapEmbeddingTable.open(partition_path(work_dir, u_part))
+        v_table = u_table if u_part == v_part else MmapEmbeddingTable.open(partition_path(work_dir, v_part))
+        chunk = np.asarray(pairs[offsets[bucket]:offsets[bucket + 1]])
+        chunk = chunk[rng.permutation(len(chunk))]
+        for start in range(0, len(chunk), batch_size):
+            total_loss += _train_pair_batch(chunk[start:start + batch_size], u_table, v_table, lr, rng)
+            num_batches += 1
+        u_table.flush()
+        v_table.flush()
+        server.release(bucket)
+        num_buckets += 1
+    result_queue.put((rank, total_loss, num_batches, num_buckets))
+
+
+def train_partitioned_deepwalk(data_dir, work_dir="./deepwalk_partitions", num_partitions=8, num_workers=4,
+                               embedding_dim=768, walk_length=80, context_size=10, walks_per_node=10, p=1.0, q=1.0,
+                               epochs=5, lr=0.1, batch_size=4096, nodes_per_round=4096, seed=0, resume=True,
+                               output_prefix="."):
+    """
+    分区并行的 DeepWalk / node2vec（skip-gram 负采样）训练，与 train_partitioned_rotate 共用 BucketLockServer。
+
+    每个 epoch 打乱起点，每轮取 nodes_per_round 个起点生成游走（random_walk.random_walks），切成 context 窗口后
+    按窗口起点与其余节点展开为正样本对 (u, v)，再按 (u 分区, v 分区) 分桶交给 worker 并发训练；
+    负样本在 v 所在分区内均匀采样，各桶合起来即在全部节点上均匀采样。一轮的正样本对约为
+    nodes_per_round * walks_per_node * (walk_length + 2 - context_size) * (context_size - 1) 个，按内存调整。
+
+    输出与 deepwalk.train_with_deepwalk 相同的 deepwalk.pt，另写一份 memory-map 的 deepwalk.npy。
+    """
+    graph = CSRGraph.from_kg(data_dir)
+    num_nodes = graph.num_nodes
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"Total number of nodes (entities): {num_nodes}, CSR edges (bidirectional): {len(graph.indices)}")
+
+    meta = {"model": "deepwalk", "num_nodes": num_nodes, "num_edges": int(len(graph.indices)),
+            "num_partitions": num_partitions, "embedding_dim": embedding_dim}
+    resume = _check_work_dir(work_dir, meta, resume)
+    # 与 SkipGram 相同的 N(0, 1) 初始化（MmapEmbeddingTable 的默认值）
+    for part, size in enumerate(partition_sizes(num_nodes, num_partitions)):
+        MmapEmbeddingTable(partition_path(work_dir, part), size, embedding_dim, resume=resume, seed=seed + part)
+    with open(os.path.join(work_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    ctx = mp.get_context()
+    server = BucketLockServer(num_partitions, ctx)
+    threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+    rng = np.random.default_rng(seed)
+    num_rounds = (num_nodes + nodes_per_round - 1) // nodes_per_round
+    print(f"Training with {num_workers} workers over {num_partitions} partitions, {num_rounds} rounds per epoch.")
+
+    for epoch in range(1, epochs + 1):
+        start_time = time.time()
+        nodes = rng.permutation(num_nodes)
+        total_loss, num_batches = 0.0, 0
+        for round_index, round_start in enumerate(tqdm(range(0, num_nodes, nodes_per_round), desc=f"Epoch {epoch}")):
+            starts = np.tile(nodes[round_start:round_start + nodes_per_round], walks_per_node)
+            windows = context_windows(random_walks(graph, starts, walk_length, p, q, rng), context_size)
+            offsets = bucket_pairs(*skipgram_pairs(windows), num_partitions, work_dir)
+            del windows
+            round_seed = seed + (epoch * num_rounds + round_index) * num_workers
+            results = _run_buckets(ctx, server, np.diff(offsets), num_workers, _train_pair_worker,
+                                   lambda rank, result_queue: (rank, work_dir, num_partitions, lr, batch_size,
+                                                               round_seed + rank, server, result_queue,
+                                                               threads_per_worker), epoch)
+            total_loss += sum(r[1] for r in results)
+            num_batches += sum(r[2] for r in results)
+        print(f"Epoch {epoch}/{epochs}, Average Loss: {total_loss / max(num_batches, 1):.4f}, "
+              f"time: {time.time() - start_time:.1f}s")
+
+    output_npy = os.path.join(output_prefix, "deepwalk.npy")
+    out = np.lib.format.open_memmap(output_npy, mode='w+', dtype=np.float32, shape=(num_nodes, embedding_dim))
+    for part in range(num_partitions):
+        out[part::num_partitions] = MmapEmbeddingTable.open(partition_path(work_dir, part)).weights
+    out.flush()
+    del out
+    embeddings = torch.from_numpy(np.load(output_npy))
+    torch.save(embeddings, os.path.join(output_prefix, "deepwalk.pt"))
+    print(f"Node embeddings saved to deepwalk.pt. Shape: {embeddings.shape}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Partition-parallel RotatE / DeepWalk training on CPU (PyTorch-BigGraph style).")
+    parser.add_argument("--model", choices=["rotate", "deepwalk"], default="rotate")
+    parser.add_argument("--data_dir", default="./final_enriched_kg")
+    parser.add_argument("--work_dir", default=None, help="默认 ./rotate_partitions 或 ./deepwalk_partitions")
+    parser.add_argument("--num_partitions", type=int, default=8)
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--embedding_dim", type=int, default=768)
+    parser.add_argument("--epochs", type=int, default=None, help="默认 rotate 50、deepwalk 5")
+    parser.add_argument("--lr", type=float, default=0.1)
+    parser.add_argument("--batch_size", type=int, default=None, help="默认 rotate 1024、deepwalk 4096")
+    parser.add_argument("--walk_length", type=int, default=80)
+    parser.add_argument("--context_size", type=int, default=10)
+    parser.add_argument("--walks_per_node", type=int, default=10)
+    parser.add_argument("--p", type=float, default=1.0)
+    parser.add_argument("--q", type=float, default=1.0)
+    parser.add_argument("--nodes_per_round", type=int, default=4096, help="deepwalk 每轮生成游走的起点数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no_resume", action="store_true")
+    args = parser.parse_args()
+    if args.model == "rotate":
+        train_partitioned_rotate(args.data_dir, args.work_dir or "./rotate_partitions", args.num_partitions,
+                                 args.num_workers, args.embedding_dim, args.epochs or 50, args.lr,
+                                 args.batch_size or 1024, args.seed, resume=not args.no_resume)
+    else:
+        train_partitioned_deepwalk(args.data_dir, args.work_dir or "./deepwalk_partitions", args.num_partitions,
+                                   args.num_workers, args.embedding_dim, args.walk_length, args.context_size,
+                                   args.walks_per_node, args.p, args.q, args.epochs or 5, args.lr,
+                                   args.batch_size or 4096, args.nodes_per_round, args.seed,
+                                   resume=not args.no_resume)
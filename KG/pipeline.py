@@ -0,0 +1,238 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KG_DIR = os.path.join(REPO_ROOT, "KG")
+STATE_PATH = os.path.join(KG_DIR, ".pipeline_state.json")
+HASH_CACHE_PATH = os.path.join(KG_DIR, ".pipeline_hashes.json")
+
+
+class Stage:
+    """
+    流水线中的一个阶段：以 cwd 为工作目录运行 script args，读 inputs、写 outputs。
+
+    路径均相对仓库根目录。deps 为脚本依赖的其它源码文件，与脚本本身一起计入指纹，
+    因此改动某个脚本只会重跑它以及下游受影响的阶段。
+    clean: 运行前删除已有输出（用于以追加方式写文件的脚本）。
+    clean_paths: 运行前一并删除的缓存文件（不是输出、但依赖输入内容的中间结果，如预生成的游走）。
+    rerun_args: 指纹与上次成功运行不同时追加的参数（如关闭断点续跑）。
+    optional_inputs: 不存在也不报错的输入（如 MRREL.RRF），是否存在同样计入指纹。
+    """
+
+    def __init__(self, name, script, args=(), inputs=(), outputs=(), params=None, deps=(), cwd=".",
+                 clean=False, rerun_args=(), optional_inputs=(), clean_paths=()):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.deps = list(deps)
+        self.cwd = cwd
+        self.clean = clean
+        self.rerun_args = list(rerun_args)
+        self.optional_inputs = list(optional_inputs)
+        self.clean_paths = list(clean_paths)
+
+    def command(self, rerun=False):
+        args = list(self.args)
+        for key, value in self.params.items():
+            args += [f"--{key}", str(value)]
+        if rerun:
+            args += self.rerun_args
+        return [sys.executable, os.path.relpath(os.path.join(REPO_ROOT, self.script), os.path.join(REPO_ROOT, self.cwd))] + args
+
+
+PIPELINE = [
+    Stage("extract", "extract.py",
+          args=["--input", "dataset/WebOfScience/wos_total.json", "--output", "KG/entity.json"],
+          inputs=["dataset/WebOfScience/wos_total.json"], outputs=["KG/entity.json"],
+          params={"model": "en_core_sci_lg", "batch_size": 64, "n_process": 1},
+          deps=["KG/stream_io.py"]),
+    Stage("link", "KG/linker.py", cwd="KG",
+          args=["--input", "entity.json", "--output", "output_linked_data.json"],
+          inputs=["KG/entity.json"], outputs=["KG/output_linked_data.json"],
+          params={"doc_batch_size": 64, "pipe_batch_size": 256},
+          deps=["KG/link_cache.py", "KG/stream_io.py"], rerun_args=["--no_resume"]),
+    Stage("clean", "KG/linker_clean.py", cwd="KG",
+          inputs=["KG/output_linked_data.json"], outputs=["KG/data.json"],
+          deps=["KG/link_cache.py", "KG/stream_io.py"]),
+    Stage("neighbors", "KG/add_neighbor.py", cwd="KG",
+          inputs=["KG/data.json"], optional_inputs=["KG/MRREL.RRF"], outputs=["KG/data_with_neighbors.jsonl"],
+          deps=["KG/umls_index.py", "KG/wikidata_fetch.py"]),
+    Stage("build_kg", "KG/build_final_kg.py", cwd="KG",
+          inputs=["KG/data_with_neighbors.jsonl"],
+          outputs=["KG/final_enriched_kg/entity2id.txt", "KG/final_enriched_kg/relation2id.txt",
+                   "KG/final_enriched_kg/train2id.txt"],
+          deps=["KG/kg_store.py"]),
+    Stage("deepwalk", "KG/deepwalk.py", cwd="KG",
+          inputs=["KG/final_enriched_kg/entity2id.txt", "KG/final_enriched_kg/relation2id.txt",
+                  "KG/final_enriched_kg/train2id.txt"],
+          outputs=["KG/deepwalk.pt"],
+          deps=["KG/kg_store.py", "KG/random_walk.py", "KG/mmap_embedding.py"],
+          clean_paths=["KG/final_enriched_kg/walks.npy", "KG/final_enriched_kg/walks.meta.json"]),
+]
+
+
+class HashCache:
+    """文件内容的 sha256 缓存，以 (大小, mtime) 判断文件是否变化，未变化的大文件不会重新读取。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.entries[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def fingerprint(stage, hashes):
+    """阶段指纹：命令、参数、脚本及依赖源码、全部输入文件内容的 sha256。"""
+    missing = [p for p in stage.inputs if not os.path.exists(os.path.join(REPO_ROOT, p))]
+    if missing:
+        raise FileNotFoundError(f"Stage '{stage.name}' is missing inputs: {', '.join(missing)}")
+    payload = {
+        "name": stage.name,
+        "command": stage.command()[1:],
+        "cwd": stage.cwd,
+        "code": {p: hashes.file_hash(os.path.join(REPO_ROOT, p)) for p in [stage.script] + stage.deps},
+        "inputs": {p: hashes.file_hash(os.path.join(REPO_ROOT, p)) for p in stage.inputs + stage.optional_inputs},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def output_hashes(stage, hashes):
+    return {p: hashes.file_hash(os.path.join(REPO_ROOT, p)) for p in stage.outputs}
+
+
+def load_state():
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    tmp_path = STATE_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def run_pipeline(stages=PIPELINE, only=None, until=None, force=(), dry_run=False):
+    """
+    依次运行各阶段；指纹与上次成功运行相同、且输出文件未被改动或删除的阶段直接跳过（make 式）。
+    上游阶段重跑后输出内容若未变化，下游阶段的指纹也不变，同样会被跳过。
+
+    Returns:
+        list of (stage, status, seconds)
+    """
+    state = load_state()
+    hashes = HashCache(HASH_CACHE_PATH)
+    report = []
+    pending = set()
+    for stage in stages:
+        if only and stage.name not in only:
+            continue
+        start = time.time()
+        if dry_run and any(p in pending or not os.path.exists(os.path.join(REPO_ROOT, p)) for p in stage.inputs):
+            # 上游将要重跑，输出内容是否变化要等实际运行后才知道
+            report.append((stage.name, "would run (inputs pending)", 0.0))
+            pending.update(stage.outputs)
+            if until == stage.name:
+                break
+            continue
+        fp = fingerprint(stage, hashes)
+        previous = state.get(stage.name, {})
+        up_to_date = (previous.get("fingerprint") == fp
+                      and previous.get("outputs") == output_hashes(stage, hashes)
+                      and all(os.path.exists(os.path.join(REPO_ROOT, p)) for p in stage.outputs))
+        if up_to_date and stage.name not in force:
+            report.append((stage.name, "skipped", time.time() - start))
+        elif dry_run:
+            report.append((stage.name, "would run", time.time() - start))
+            pending.update(stage.outputs)
+        else:
+            for p in (stage.outputs if stage.clean else []) + stage.clean_paths:
+                if os.path.exists(os.path.join(REPO_ROOT, p)):
+                    os.remove(os.path.join(REPO_ROOT, p))
+            rerun = "fingerprint" in previous and previous["fingerprint"] != fp
+            command = stage.command(rerun=rerun)
+            print(f"\n=== [{stage.name}] {' '.join(command)} (cwd: {stage.cwd}) ===", flush=True)
+            env = dict(os.environ)
+            env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, KG_DIR, env.get("PYTHONPATH")]))
+            result = subprocess.run(command, cwd=os.path.join(REPO_ROOT, stage.cwd), env=env)
+            elapsed = time.time() - start
+            if result.returncode != 0:
+                report.append((stage.name, f"failed ({result.returncode})", elapsed))
+                state.pop(stage.name, None)
+                save_state(state)
+                hashes.save()
+                print_report(report)
+                raise SystemExit(f"Stage '{stage.name}' failed with exit code {result.returncode}.")
+            missing = [p for p in stage.outputs if not os.path.exists(os.path.join(REPO_ROOT, p))]
+            if missing:
+                raise SystemExit(f"Stage '{stage.name}' did not produce: {', '.join(missing)}")
+            state[stage.name] = {
+                "fingerprint": fp,
+                "outputs": output_hashes(stage, hashes),
+                "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "seconds": round(elapsed, 2),
+            }
+            save_state(state)
+            report.append((stage.name, "ran", elapsed))
+        hashes.save()
+        if until == stage.name:
+            break
+    print_report(report)
+    return report
+
+
+def print_report(report):
+    print("\nStage report:")
+    width = max((len(name) for name, _, _ in report), default=5)
+    for name, status, seconds in report:
+        print(f"  {name:<{width}}  {status:<28} {seconds:10.1f}s")
+    print(f"  {'total':<{width}}  {'':<28} {sum(s for _, _, s in report):10.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Run the KG build pipeline, skipping stages whose inputs, code and parameters are unchanged.")
+    parser.add_argument("--only", nargs="+", default=None, help="Run only these stages.")
+    parser.add_argument("--until", default=None, help="Stop after this stage.")
+    parser.add_argument("--force", nargs="+", default=[], help="Rerun these stages even if up to date.")
+    parser.add_argument("--dry_run", action="store_true", help="Only report which stages would run.")
+    parser.add_argument("--list", action="store_true", help="List the stages and exit.")
+    args = parser.parse_args()
+    if args.list:
+        for stage in PIPELINE:
+            print(f"{stage.name}: {' '.join(stage.command())}  (cwd: {stage.cwd})")
+            print(f"    inputs:  {', '.join(stage.inputs + stage.optional_inputs)}")
+            print(f"    outputs: {', '.join(stage.outputs)}")
+    else:
+        run_pipeline(only=args.only, until=args.until, force=set(args.force), dry_run=args.dry_run)
@@ -0,0 +1,272 @@
+import json
+import os
+import shutil
+from multiprocessing import Pool
+import numpy as np
+from kg_store import STORE_DIRNAME, open_kg
+
+CSR_DIRNAME = "csr_undirected"
+
+
+def build_csr(num_nodes, heads, tails, symmetric=True):
+    """由边表构建 CSR 邻接（每行邻居按编号有序）；symmetric 时加入反向边，与 load_edge_index 一致。"""
+    heads = np.asarray(heads, dtype=np.int64)
+    tails = np.asarray(tails, dtype=np.int64)
+    rows = np.concatenate([heads, tails]) if symmetric else heads
+    cols = np.concatenate([tails, heads]) if symmetric else tails
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+    index_dtype = np.int32 if num_nodes < np.iinfo(np.int32).max else np.int64
+    return indptr, cols[order].astype(index_dtype)
+
+
+class CSRGraph:
+    """随机游走用的只读 CSR 图；edge_keys = row * num_nodes + col 全局有序，用于向量化的邻接判断。"""
+
+    def __init__(self, indptr, indices, csr_dir=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.num_nodes = len(indptr) - 1
+        self.csr_dir = csr_dir
+        self._edge_keys = None
+
+    @property
+    def edge_keys(self):
+        if self._edge_keys is None:
+            if self.csr_dir and os.path.exists(os.path.join(self.csr_dir, "edge_keys.npy")):
+                self._edge_keys = np.load(os.path.join(self.csr_dir, "edge_keys.npy"), mmap_mode='r')
+            else:
+                rows = np.repeat(np.arange(self.num_nodes, dtype=np.int64), np.diff(self.indptr))
+                self._edge_keys = rows * self.num_nodes + self.indices
+        return self._edge_keys
+
+    def save(self, csr_dir):
+        tmp_dir = csr_dir + ".tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "indptr.npy"), self.indptr)
+        np.save(os.path.join(tmp_dir, "indices.npy"), self.indices)
+        np.save(os.path.join(tmp_dir, "edge_keys.npy"), np.asarray(self.edge_keys))
+        with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"num_nodes": self.num_nodes, "num_edges": int(len(self.indices))}, f)
+        if os.path.exists(csr_dir):
+            shutil.rmtree(csr_dir)
+        os.replace(tmp_dir, csr_dir)
+        self.csr_dir = csr_dir
+
+    @classmethod
+    def load(cls, csr_dir):
+        indptr = np.load(os.path.join(csr_dir, "indptr.npy"), mmap_mode='r')
+        indices = np.load(os.path.join(csr_dir, "indices.npy"), mmap_mode='r')
+        return cls(indptr, indices, csr_dir)
+
+    @classmethod
+    def from_kg(cls, kg_dir):
+        """打开 KG 的无向 CSR；首次调用时由二进制 KG 构建并缓存在 store/ 目录下（KG 重建时随之失效）。"""
+        kg = open_kg(kg_dir)
+        csr_dir = os.path.join(kg_dir, STORE_DIRNAME, CSR_DIRNAME)
+        if not os.path.exists(os.path.join(csr_dir, "meta.json")):
+            indptr, indices = build_csr(kg.num_entities, kg.heads, kg.tails)
+            cls(indptr, indices).save(csr_dir)
+        return cls.load(csr_dir)
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+
+def random_walks(graph, starts, walk_length, p=1.0, q=1.0, rng=None):
+    """
+    从 starts 出发批量生成长度为 walk_length 的游走，返回 (len(starts), walk_length + 1)：第 0 列为起点，之后每列走一步。
+    与 torch-cluster random_walk 返回的 rw 同形（Node2Vec.pos_sample 在 rw 上切窗口），不是 walk_length 列。
+
+    p = q = 1 时为 DeepWalk 的均匀游走；否则按 node2vec 的二阶转移概率做向量化拒绝采样：
+    候选 x 的接受概率为 1/p（回到上一节点）、1（x 与上一节点相邻）或 1/q（其它），除以三者最大值。
+    无邻居的节点原地停留，与 torch-cluster 的行为一致。
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    starts = np.asarray(starts, dtype=np.int64)
+    walks = np.empty((len(starts), walk_length + 1), dtype=np.int64)
+    walks[:, 0] = starts
+    if walk_length == 0 or len(starts) == 0:
+        return walks
+    indptr, indices = graph.indptr, graph.indices
+    biased = p != 1.0 or q != 1.0
+    max_prob = max(1.0 / p, 1.0, 1.0 / q)
+
+    def propose(nodes):
+        deg = indptr[nodes + 1] - indptr[nodes]
+        if len(indices) == 0:
+            return nodes.copy(), deg > 0
+        offset = (rng.random(len(nodes)) * deg).astype(np.int64)
+        return np.where(deg > 0, indices[np.minimum(indptr[nodes] + offset, len(indices) - 1)], nodes), deg > 0
+
+    walks[:, 1], _ = propose(starts)
+    for step in range(2, walk_length + 1):
+        cur, prev = walks[:, step - 1], walks[:, step - 2]
+        nxt, has_neighbors = propose(cur)
+        if biased:
+            pending = np.flatnonzero(has_neighbors)
+            while len(pending):
+                x = nxt[pending]
+                prev_p = prev[pending]
+                keys = prev_p * graph.num_nodes + x
+                pos = np.minimum(np.searchsorted(graph.edge_keys, keys), len(graph.edge_keys) - 1)
+                connected = graph.edge_keys[pos] == keys
+                prob = np.where(x == prev_p, 1.0 / p, np.where(connected, 1.0, 1.0 / q))
+                accepted = rng.random(len(pending)) * max_prob < prob
+                pending = pending[~accepted]
+                if len(pending):
+                    nxt[pending], _ = propose(cur[pending])
+        walks[:, step] = nxt
+    return walks
+
+
+def context_windows(walks, context_size):
+    """
+    与 torch_geometric Node2Vec.pos_sample 相同：把每条游走切成长度为 context_size 的滑动窗口。
+    L 列的游走切出 L - context_size + 1 个窗口；L = walk_length + 1 时即 PyG 的 1 + walk_length + 1 - context_size。
+    """
+    num_windows = walks.shape[1] - context_size + 1
+    return np.concatenate([walks[:, j:j + context_size] for j in range(num_windows)], axis=0)
+
+
+def skipgram_pairs(windows):
+    """每个窗口的起点与其余节点组成 (u, v) 正样本对，与 walk_loss 对窗口的打分方式相同。"""
+    context = windows.shape[1] - 1
+    return np.repeat(windows[:, 0], context), windows[:, 1:].reshape(-1)
+
+
+def negative_walks(starts, num_nodes, walk_length, rng):
+    """
+    与 Node2Vec.neg_sample 相同：起点后接 walk_length 个均匀随机节点，共 walk_length + 1 列，
+    与 random_walks 的正样本游走同宽，切出的窗口数也相同。
+    """
+    rw = rng.integers(0, num_nodes, size=(len(starts), walk_length), dtype=np.int64)
+    return np.concatenate([np.asarray(starts, dtype=np.int64).reshape(-1, 1), rw], axis=1)
+
+
+_worker_graph = None
+
+
+def _init_walk_worker(csr_dir):
+    global _worker_graph
+    _worker_graph = CSRGraph.load(csr_dir)
+
+
+def _skipgram_batch(task):
+    batch, walk_length, context_size, walks_per_node, num_negative_samples, p, q, seed = task
+    rng = np.random.default_rng(seed)
+    starts = np.tile(batch, walks_per_node)
+    pos = context_windows(random_walks(_worker_graph, starts, walk_length, p, q, rng), context_size)
+    neg_starts = np.tile(batch, walks_per_node * num_negative_samples)
+    neg = context_windows(negative_walks(neg_starts, _worker_graph.num_nodes, walk_length, rng), context_size)
+    return pos, neg
+
+
+def _walk_batch(task):
+    starts, walk_length, p, q, seed = task
+    return random_walks(_worker_graph, starts, walk_length, p, q, np.random.default_rng(seed))
+
+
+class WalkLoader:
+    """
+    多进程游走生成器，按批产出 (pos_rw, neg_rw)，格式与 Node2Vec.loader() 相同，可直接喂给 loss。
+
+    每个 epoch 打乱起点，分批交给进程池，主进程边训练边接收（imap 有界预取），不会一次性生成全部游走。
+    """
+
+    def __init__(self, graph, walk_length, context_size, walks_per_node=1, num_negative_samples=1, p=1.0, q=1.0,
+                 batch_size=128, shuffle=True, num_workers=4, seed=0, start_nodes=None):
+        if graph.csr_dir is None:
+            raise ValueError("WalkLoader needs a CSRGraph saved on disk so that workers can memory-map it.")
+        if context_size > walk_length + 1:
+            raise ValueError(f"context_size ({context_size}) must not exceed walk_length + 1 ({walk_length + 1}).")
+        self.graph = graph
+        self.walk_length = walk_length
+        self.context_size = context_size
+        self.walks_per_node = walks_per_node
+        self.num_negative_samples = num_negative_samples
+        self.p = p
+        self.q = q
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.num_workers = num_workers
+        self.seed_sequence = np.random.SeedSequence(seed)
+        # 默认从每个节点出发；增量训练时只从需要更新的节点出发
+        self.start_nodes = np.arange(graph.num_nodes) if start_nodes is None else np.asarray(start_nodes, dtype=np.int64)
+
+    def __len__(self):
+        return (len(self.start_nodes) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        import torch
+        epoch_seed = self.seed_sequence.spawn(1)[0]
+        rng = np.random.default_rng(epoch_seed)
+        nodes = rng.permutation(self.start_nodes) if self.shuffle else self.start_nodes
+        batches = [nodes[i:i + self.batch_size] for i in range(0, len(nodes), self.batch_size)]
+        seeds = epoch_seed.spawn(len(batches))
+        tasks = ((batch, self.walk_length, self.context_size, self.walks_per_node, self.num_negative_samples,
+                  self.p, self.q, s) for batch, s in zip(batches, seeds))
+        with Pool(self.num_workers, initializer=_init_walk_worker, initargs=(self.graph.csr_dir,)) as pool:
+            for pos, neg in pool.imap(_skipgram_batch, tasks, chunksize=4):
+                yield torch.from_numpy(pos), torch.from_numpy(neg)
+
+
+def precompute_walks(graph, output_path, walk_length, walks_per_node=10, p=1.0, q=1.0, batch_size=4096,
+                     num_workers=4, seed=0):
+    """
+    预先生成全部游走写入 memory-map 的 .npy（形状 [walks_per_node * num_nodes, walk_length + 1]，
+    第 r * num_nodes + v 行是节点 v 的第 r 条游走），多次训练可复用同一份游走。
+    """
+    dtype = np.int32 if graph.num_nodes < np.iinfo(np.int32).max else np.int64
+    out = np.lib.format.open_memmap(output_path + ".tmp", mode='w+', dtype=dtype,
+                                    shape=(walks_per_node * graph.num_nodes, walk_length + 1))
+    starts = np.tile(np.arange(graph.num_nodes, dtype=np.int64), walks_per_node)
+    chunks = [(i, starts[i:i + batch_size]) for i in range(0, len(starts), batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = ((chunk, walk_length, p, q, s) for (_, chunk), s in zip(chunks, seeds))
+    with Pool(num_workers, initializer=_init_walk_worker, initargs=(graph.csr_dir,)) as pool:
+        for (row, _), walks in zip(chunks, pool.imap(_walk_batch, tasks, chunksize=2)):
+            out[row:row + len(walks)] = walks
+    out.flush()
+    del out
+    os.replace(output_path + ".tmp", output_path)
+    return output_path
+
+
+class PrecomputedWalkLoader:
+    """从 precompute_walks 的结果按批读取游走，产出 (pos_rw, neg_rw)；负样本每次在线生成。"""
+
+    def __init__(self, walks_path, num_nodes, context_size, num_negative_samples=1, batch_size=128, shuffle=True,
+                 seed=0):
+        self.walks = np.load(walks_path, mmap_mode='r')
+        self.num_nodes = num_nodes
+        self.walks_per_node = len(self.walks) // num_nodes
+        self.walk_length = self.walks.shape[1] - 1
+        if context_size > self.walk_length + 1:
+            raise ValueError(f"context_size ({context_size}) must not exceed walk_length + 1 ({self.walk_length + 1}).")
+        self.context_size = context_size
+        self.num_negative_samples = num_negative_samples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return (self.num_nodes + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        import torch
+        nodes = self.rng.permutation(self.num_nodes) if self.shuffle else np.arange(self.num_nodes)
+        for i in range(0, len(nodes), self.batch_size):
+            batch = nodes[i:i + self.batch_size]
+            rows = (np.arange(self.walks_per_node)[:, None] * self.num_nodes + batch[None, :]).reshape(-1)
+            order = np.argsort(rows)
+            walks = np.empty((len(rows), self.walks.shape[1]), dtype=np.int64)
+            walks[order] = self.walks[rows[order]]
+            pos = context_windows(walks, self.context_size)
+            neg_starts = np.tile(batch, self.walks_per_node * self.num_negative_samples)
+            neg = context_windows(negative_walks(neg_starts, self.num_nodes, self.walk_length, self.rng),
+                                  self.context_size)
+            yield torch.from_numpy(pos), torch.from_numpy(neg)
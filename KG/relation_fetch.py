@@ -1,9 +1,15 @@
 import json
 from itertools import combinations
 import os
+import shutil
+from array import array
+from multiprocessing import Pool
+import numpy as np
 from tqdm import tqdm
+from umls_index import UMLSIndex, load_umls_index
+from kg_store import convert_text_kg, write_kg_store
 
-def build_graph_from_linked_data(linked_data_path, mrrel_path, output_kg_dir):
+def build_graph_from_linked_data(linked_data_path, mrrel_path, output_kg_dir, umls_index_dir="./umls_index"):
     """
     从已经完成实体链接的数据中提取关系，构建知识图谱。
 
@@ -11,31 +17,15 @@ def build_graph_from_linked_data(linked_data_path, mrrel_path, output_kg_dir):
         linked_data_path (str): 包含 'linked_entities' 的 JSON Lines 文件路径。
         mrrel_path (str): UMLS 的 MRREL.RRF 文件路径。
         output_kg_dir (str): 输出 KG 文件的目录。
+        umls_index_dir (str): MRREL 整数索引目录，不存在时由 mrrel_path 构建。
     """
     
-    # --- 1. 预加载 UMLS 关系数据 ---
-    print("Step 1: Pre-loading UMLS relationships from MRREL.RRF...")
-    # 创建一个字典来高效地存储和查询关系: {cui1: {cui2: [rel1, rel2, ...]}}
-    relations_kb = {}
-    if os.path.exists(mrrel_path):
-        with open(mrrel_path, 'r', encoding='utf-8') as f:
-            # 使用tqdm来显示加载进度
-            for line in tqdm(f, desc="Loading MRREL.RRF"):
-                # MRREL.RRF 文件列由'|'分隔
-                parts = line.strip().split('|')
-                if len(parts) > 4:
-                    cui1, rel, cui2 = parts[0], parts[3], parts[4]
-                    
-                    # 初始化内部字典
-                    if cui1 not in relations_kb:
-                        relations_kb[cui1] = {}
-                    if cui2 not in relations_kb[cui1]:
-                        relations_kb[cui1][cui2] = set() # 使用set避免重复关系
-                    
-                    relations_kb[cui1][cui2].add(rel)
-        print("UMLS relationships loaded successfully.")
-    else:
-        print(f"Warning: MRREL.RRF not found at '{mrrel_path}'. The script will only generate co-occurrence relationships.")
+    # --- 1. 打开 UMLS 关系索引 ---
+    print("Step 1: Opening the memory-mapped UMLS relation index...")
+    # 首次运行时从 MRREL.RRF 构建整数编码的 CSR 索引，之后直接 memory-map，启动只需毫秒级
+    relations_kb = load_umls_index(mrrel_path, umls_index_dir)
+    if relations_kb is None:
+        print("The script will only generate co-occurrence relationships.")
         
     # --- 2. 遍历链接好的数据，提取三元组 ---
     print("\nStep 2: Extracting triplets from linked data...")
@@ -62,21 +52,25 @@ def build_graph_from_linked_data(linked_data_path, mrrel_path, output_kg_dir):
             if len(entity_ids_in_doc) < 2:
                 continue
 
+            # 文档内实体一次性映射为索引中的整数 ID（不在 UMLS 中的为 -1）
+            if relations_kb is not None:
+                index_ids = dict(zip(entity_ids_in_doc, relations_kb.cui_ids(entity_ids_in_doc).tolist()))
+            else:
+                index_ids = dict.fromkeys(entity_ids_in_doc, -1)
+
             # 遍历文档中所有的实体对 (cui1, cui2)
             for cui1, cui2 in combinations(entity_ids_in_doc, 2):
                 found_explicit_relation = False
-                
-                # 检查正向关系: cui1 -> cui2
-                if cui1 in relations_kb and cui2 in relations_kb.get(cui1, {}):
-                    for rel in relations_kb[cui1][cui2]:
+                id1, id2 = index_ids[cui1], index_ids[cui2]
+                if id1 >= 0 and id2 >= 0:
+                    # 检查正向关系: cui1 -> cui2
+                    for rel in relations_kb.relations_between(id1, id2):
                         all_triplets.add((cui1, rel, cui2))
-                    found_explicit_relation = True
-                
-                # 检查反向关系: cui2 -> cui1
-                if cui2 in relations_kb and cui1 in relations_kb.get(cui2, {}):
-                    for rel in relations_kb[cui2][cui1]:
+                        found_explicit_relation = True
+                    # 检查反向关系: cui2 -> cui1
+                    for rel in relations_kb.relations_between(id2, id1):
                         all_triplets.add((cui2, rel, cui1))
-                    found_explicit_relation = True
+                        found_explicit_relation = True
                 
                 # 如果没有找到任何显式关系，则添加共现关系
                 if not found_explicit_relation:
@@ -119,10 +113,187 @@ def build_graph_from_linked_data(linked_data_path, mrrel_path, output_kg_dir):
                 tid = entity_to_id[t]
                 # PyKE/PyG 格式: head_id, tail_id, relation_id
                 f.write(f"{hid}\t{tid}\t{rid}\n")
+    convert_text_kg(output_kg_dir)
 
     print(f"\nKnowledge graph files have been successfully saved to the '{output_kg_dir}' directory.")
     print("You can now use this directory to train your KGE model (e.g., RotatE).")
 
+def _shard_ranges(path, num_shards):
+    """按字节把 JSON Lines 文件切成 num_shards 段，每段边界对齐到行首。"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, num_shards):
+            f.seek(max(size * i // num_shards, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+_worker_index = None
+
+
+def _init_shard_worker(umls_index_dir):
+    # 每个 worker 只 memory-map 同一份只读索引，物理内存由页缓存共享
+    global _worker_index
+    _worker_index = UMLSIndex(umls_index_dir) if umls_index_dir else None
+
+
+def _extract_shard(args):
+    """
+    处理一个分片，输出整数 ID 三元组。
+
+    实体 ID: UMLS 索引内的实体直接用索引 ID；其余实体用 num_cuis + 分片内局部编号，
+    合并阶段再统一重映射。关系 ID: 索引关系 ID，共现关系为 num_relations。
+    """
+    shard_id, linked_data_path, start, end, shard_dir = args
+    index = _worker_index
+    num_cuis = len(index) if index is not None else 0
+    co_occurrence = len(index.relation_names) if index is not None else 0
+    extra_ids = {}
+    seen = set()
+    heads, rels, tails = array('q'), array('q'), array('q')
+
+    with open(linked_data_path, 'rb') as f:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # 按名字排序，共现三元组的方向与分片方式无关，结果可复现
+            names = sorted(set(
+                entity['linked_id']
+                for entity in item.get('linked_entities', [])
+                if entity.get('link_source') != 'Fallback'
+            ))
+            if not names:
+                continue
+            ids = index.cui_ids(names) if index is not None else np.full(len(names), -1, dtype=np.int64)
+            for i in np.flatnonzero(ids < 0):
+                ids[i] = num_cuis + extra_ids.setdefault(names[i], len(extra_ids))
+            seen.update(ids.tolist())
+            if len(ids) < 2:
+                continue
+
+            # 显式关系: 对文档内每个 UMLS 实体，在它的正向邻接行里找文档内的其它实体
+            explicit = set()
+            in_index = ids[ids < num_cuis]
+            for head in in_index:
+                row_start, row_end = index.fwd_indptr[head], index.fwd_indptr[head + 1]
+                row = index.fwd_targets[row_start:row_end]
+                hit = np.flatnonzero(np.isin(row, in_index) & (row != head))
+                if len(hit) == 0:
+                    continue
+                heads.extend([int(head)] * len(hit))
+                tails.extend(row[hit].tolist())
+                rels.extend(index.fwd_rels[row_start + hit].tolist())
+                explicit.update((min(int(head), int(t)), max(int(head), int(t))) for t in row[hit])
+
+            # 其余实体对添加共现关系
+            left, right = np.triu_indices(len(ids), k=1)
+            for h, t in zip(ids[left].tolist(), ids[right].tolist()):
+                if (min(h, t), max(h, t)) not in explicit:
+                    heads.append(h)
+                    rels.append(co_occurrence)
+                    tails.append(t)
+
+    triplets = np.stack([np.frombuffer(heads, dtype=np.int64),
+                         np.frombuffer(rels, dtype=np.int64),
+                         np.frombuffer(tails, dtype=np.int64)], axis=1)
+    triplets = np.unique(triplets, axis=0) if len(triplets) else triplets.reshape(0, 3)
+    np.save(os.path.join(shard_dir, f"shard_{shard_id}.npy"), triplets)
+    np.save(os.path.join(shard_dir, f"shard_{shard_id}_seen.npy"), np.array(sorted(seen), dtype=np.int64))
+    with open(os.path.join(shard_dir, f"shard_{shard_id}_extra.json"), 'w', encoding='utf-8') as f:
+        json.dump(list(extra_ids), f, ensure_ascii=False)
+    return shard_id
+
+
+def build_graph_sharded(linked_data_path, mrrel_path, output_kg_dir, umls_index_dir="./umls_index",
+                        num_workers=os.cpu_count(), shards_per_worker=4):
+    """
+    build_graph_from_linked_data 的多进程分片版本，输出的 KG 文件格式相同。
+
+    把 JSON Lines 按字节切成分片交给进程池，各 worker 基于共享的只读 UMLS 索引产出整数三元组，
+    最后统一重映射 ID 并用排序去重合并，避免在内存里维护字符串元组的大集合。
+    """
+    print("Step 1: Opening the memory-mapped UMLS relation index...")
+    index = load_umls_index(mrrel_path, umls_index_dir)
+    if index is None:
+        print("The script will only generate co-occurrence relationships.")
+    num_cuis = len(index) if index is not None else 0
+    relation_names = list(index.relation_names) if index is not None else []
+    relation_names.append("co_occurrence")
+
+    print(f"\nStep 2: Extracting triplets with {num_workers} worker processes...")
+    shard_dir = os.path.join(output_kg_dir, "_shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    ranges = _shard_ranges(linked_data_path, max(1, num_workers * shards_per_worker))
+    tasks = [(i, linked_data_path, start, end, shard_dir) for i, (start, end) in enumerate(ranges)]
+    with Pool(num_workers, initializer=_init_shard_worker,
+              initargs=(umls_index_dir if index is not None else None,)) as pool:
+        for _ in tqdm(pool.imap_unordered(_extract_shard, tasks), total=len(tasks), desc="Processing shards"):
+            pass
+
+    # --- 3. 合并: 统一实体 ID（按名字排序，与串行版本一致）并排序去重 ---
+    print("\nStep 3: Merging shards...")
+    seen_cuis = set()
+    shard_extras = []
+    for i in range(len(tasks)):
+        seen = np.load(os.path.join(shard_dir, f"shard_{i}_seen.npy"))
+        seen_cuis.update(seen[seen < num_cuis].tolist())
+        with open(os.path.join(shard_dir, f"shard_{i}_extra.json"), 'r', encoding='utf-8') as f:
+            shard_extras.append(json.load(f))
+    entity_names = {index.cui(c): c for c in seen_cuis} if index is not None else {}
+    for extras in shard_extras:
+        entity_names.update((name, None) for name in extras)
+    entity_list = sorted(entity_names)
+    entity_to_id = {name: i for i, name in enumerate(entity_list)}
+    cui_to_final = {c: entity_to_id[name] for name, c in entity_names.items() if c is not None}
+
+    merged = []
+    for i, extras in enumerate(shard_extras):
+        triplets = np.load(os.path.join(shard_dir, f"shard_{i}.npy"))
+        if len(triplets) == 0:
+            continue
+        # 分片局部 ID -> 全局 ID 的查表数组
+        local_ids = np.unique(triplets[:, [0, 2]])
+        lookup = np.array([cui_to_final[x] if x < num_cuis else entity_to_id[extras[x - num_cuis]]
+                           for x in local_ids.tolist()], dtype=np.int64)
+        triplets[:, 0] = lookup[np.searchsorted(local_ids, triplets[:, 0])]
+        triplets[:, 2] = lookup[np.searchsorted(local_ids, triplets[:, 2])]
+        merged.append(triplets)
+    triplets = np.unique(np.concatenate(merged), axis=0) if merged else np.zeros((0, 3), dtype=np.int64)
+    shutil.rmtree(shard_dir)
+
+    used_relations = np.unique(triplets[:, 1])
+    relation_list = sorted(relation_names[r] for r in used_relations.tolist())
+    relation_remap = np.zeros(len(relation_names), dtype=np.int64)
+    relation_remap[used_relations] = [relation_list.index(relation_names[r]) for r in used_relations.tolist()]
+    triplets[:, 1] = relation_remap[triplets[:, 1]]
+    print(f"Extraction complete. Found {len(entity_list)} unique entities and {len(triplets)} unique triplets.")
+
+    print("\nStep 4: Writing knowledge graph files...")
+    with open(os.path.join(output_kg_dir, 'entity2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(entity_list)}\n")
+        for eid, name in enumerate(entity_list):
+            f.write(f"{name}\t{eid}\n")
+    with open(os.path.join(output_kg_dir, 'relation2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(relation_list)}\n")
+        for rid, name in enumerate(relation_list):
+            f.write(f"{name}\t{rid}\n")
+    with open(os.path.join(output_kg_dir, 'train2id.txt'), 'w', encoding='utf-8') as f:
+        f.write(f"{len(triplets)}\n")
+        # PyKE/PyG 格式: head_id, tail_id, relation_id
+        np.savetxt(f, triplets[:, [0, 2, 1]], fmt='%d', delimiter='\t')
+    write_kg_store(output_kg_dir, entity_list, relation_list, triplets[:, [0, 2, 1]])
+
+    print(f"\nKnowledge graph files have been successfully saved to the '{output_kg_dir}' directory.")
+
 if __name__ == "__main__":
     LINKED_DATA_FILE = "data.json"
 
@@ -133,10 +304,21 @@ if __name__ == "__main__":
 
     # 3. 输出目录: 存放最终图谱文件的文件夹名称
     OUTPUT_KG_FOLDER = "final_enriched_kg"
+
+    # 4. 并行进程数: 大于 1 时使用分片多进程版本
+    NUM_WORKERS = os.cpu_count()
     
     # --- 执行主函数 ---
-    build_graph_from_linked_data(
-        linked_data_path=LINKED_DATA_FILE,
-        mrrel_path=MRREL_FILE_PATH,
-        output_kg_dir=OUTPUT_KG_FOLDER
-    )
\ No newline at end of file
+    if NUM_WORKERS > 1:
+        build_graph_sharded(
+            linked_data_path=LINKED_DATA_FILE,
+            mrrel_path=MRREL_FILE_PATH,
+            output_kg_dir=OUTPUT_KG_FOLDER,
+            num_workers=NUM_WORKERS
+        )
+    else:
+        build_graph_from_linked_data(
+            linked_data_path=LINKED_DATA_FILE,
+            mrrel_path=MRREL_FILE_PATH,
+            output_kg_dir=OUTPUT_KG_FOLDER
+        )
\ No newline at end of file
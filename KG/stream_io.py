@@ -0,0 +1,112 @@
+import json
+import os
+
+
+def iter_jsonl(path, start_offset=0):
+    """
+    逐行流式读取 JSON Lines 文件，不把整个语料读入内存。
+
+    Yields:
+        (next_offset, record): next_offset 是该行之后的字节偏移，可直接作为断点续跑的起点。
+    """
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        for line in f:
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping malformed JSON line ending at byte {offset}")
+                continue
+            yield offset, record
+
+
+def load_checkpoint(checkpoint_path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_path, state):
+    # 先写临时文件再原子替换，进程在任意时刻被杀掉都不会留下半个 checkpoint
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+class ResumableJsonlWriter:
+    """
+    带断点的 JSON Lines 输出。
+
+    checkpoint 记录输入文件的字节偏移和输出文件的字节偏移；重启时把输出截断到上次提交的位置，
+    再从对应的输入偏移继续读，因此不会出现重复或半行记录。
+    """
+
+    def __init__(self, input_path, output_path, checkpoint_path=None, resume=True):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or output_path + ".ckpt"
+
+        state = load_checkpoint(self.checkpoint_path) if resume else {}
+        if state and state.get("input_path") != os.path.abspath(input_path):
+            raise ValueError(
+                f"Checkpoint '{self.checkpoint_path}' belongs to '{state.get('input_path')}', not '{input_path}'. "
+                "Remove it or pass resume=False to start over."
+            )
+        if state and (not os.path.exists(output_path) or os.path.getsize(output_path) < state.get("output_offset", 0)):
+            # checkpoint 之前的记录已不在输出文件里，按 checkpoint 续跑会丢掉它们，只能从头开始
+            print(f"Warning: '{output_path}' is missing or shorter than recorded in '{self.checkpoint_path}'; "
+                  f"starting over.")
+            state = {}
+        self.input_offset = state.get("input_offset", 0)
+        self.records = state.get("records", 0)
+        self.finished = state.get("finished", False)
+        self.pending = 0
+
+        if state and os.path.exists(output_path):
+            self.f = open(output_path, 'r+b')
+            self.f.truncate(state.get("output_offset", 0))
+            self.f.seek(0, os.SEEK_END)
+        else:
+            self.f = open(output_path, 'wb')
+        if self.records:
+            print(f"Resuming from checkpoint: {self.records} records already written.")
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self.f.write(line.encode('utf-8'))
+        self.records += 1
+        self.pending += 1
+
+    def commit(self, input_offset, finished=False, **extra):
+        """把已写入的记录落盘，并记录下一次应从哪个输入偏移继续。"""
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.input_offset = input_offset
+        self.finished = finished
+        self.pending = 0
+        state = {
+            "input_path": os.path.abspath(self.input_path),
+            "input_offset": input_offset,
+            "output_offset": self.f.tell(),
+            "records": self.records,
+            "finished": finished,
+        }
+        state.update(extra)
+        save_checkpoint(self.checkpoint_path, state)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from stream_io import iter_jsonl
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COUNTER_FIELDS = ("items", "batches", "busy", "wait_in", "wait_out")
+
+
+class StageCounter:
+    """跨进程共享的阶段计数器：处理的文档数/批数，以及忙碌、等待输入、等待输出（被下游反压）的累计秒数。"""
+
+    def __init__(self, name, num_workers, ctx):
+        self.name = name
+        self.num_workers = num_workers
+        self.values = ctx.Array('d', len(COUNTER_FIELDS))
+
+    def add(self, **kwargs):
+        with self.values.get_lock():
+            for key, value in kwargs.items():
+                self.values[COUNTER_FIELDS.index(key)] += value
+
+    def snapshot(self):
+        with self.values.get_lock():
+            return dict(zip(COUNTER_FIELDS, self.values[:]))
+
+
+class Stage:
+    """
+    流式流水线的一个阶段。
+
+    setup(*args) 在工作进程内调用一次（加载模型、打开缓存等），返回 (process, close)：
+    kind="process" 时 process(items) -> items，由 num_workers 个进程并行消费同一个输入队列（CPU 密集型阶段）；
+    kind="async" 时 process 为协程函数，单个进程内用 asyncio 同时处理至多 max_inflight 批（网络密集型阶段）。
+    setup 必须是模块级函数，以便传给子进程。
+    """
+
+    def __init__(self, name, setup, args=(), num_workers=1, kind="process", max_inflight=4):
+        self.name = name
+        self.setup = setup
+        self.args = tuple(args)
+        self.num_workers = num_workers if kind == "process" else 1
+        self.kind = kind
+        self.max_inflight = max_inflight
+
+
+def _timed_get(in_queue, counter):
+    start = time.perf_counter()
+    message = in_queue.get()
+    counter.add(wait_in=time.perf_counter() - start)
+    return message
+
+
+def _timed_put(out_queue, message, counter):
+    # 队列有界：下游处理不过来时 put 阻塞，上游自然减速（反压）
+    start = time.perf_counter()
+    out_queue.put(message)
+    counter.add(wait_out=time.perf_counter() - start)
+
+
+def _finish(done, num_workers, out_queue, num_consumers):
+    """本阶段最后一个退出的工作进程负责给下游每个消费者发结束标记。"""
+    with done.get_lock():
+        done.value += 1
+        last = done.value == num_workers
+    if last:
+        for _ in range(num_consumers):
+            out_queue.put(None)
+
+
+def _source_worker(input_path, batch_size, out_queue, counter, num_consumers, num_batches):
+    batch, seq = [], 0
+    start = time.perf_counter()
+    for _, record in iter_jsonl(input_path):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            counter.add(items=len(batch), batches=1, busy=time.perf_counter() - start)
+            _timed_put(out_queue, (seq, batch), counter)
+            batch, seq = [], seq + 1
+            start = time.perf_counter()
+    if batch:
+        counter.add(items=len(batch), batches=1, busy=time.perf_counter() - start)
+        _timed_put(out_queue, (seq, batch), counter)
+        seq += 1
+    # 写出端据此确认每一批都已到达，防止某个阶段丢批后仍把截断的输出当作成功
+    num_batches.value = seq
+    for _ in range(num_consumers):
+        out_queue.put(None)
+
+
+def _process_worker(stage, in_queue, out_queue, counter, done, num_consumers):
+    process, close = stage.setup(*stage.args)
+    while True:
+        message = _timed_get(in_queue, counter)
+        if message is None:
+            break
+        seq, items = message
+        start = time.perf_counter()
+        items = process(items)
+        counter.add(items=len(items), batches=1, busy=time.perf_counter() - start)
+        _timed_put(out_queue, (seq, items), counter)
+    if close is not None:
+        close()
+    _finish(done, stage.num_workers, out_queue, num_consumers)
+
+
+async def _async_loop(stage, in_queue, out_queue, counter):
+    process, close = stage.setup(*stage.args)
+    inflight = set()
+
+    async def handle(seq, items):
+        start = time.perf_counter()
+        items = await process(items)
+        counter.add(items=len(items), batches=1, busy=time.perf_counter() - start)
+        await asyncio.to_thread(_timed_put, out_queue, (seq, items), counter)
+
+    while True:
+        message = await asyncio.to_thread(_timed_get, in_queue, counter)
+        if message is None:
+            break
+        while len(inflight) >= stage.max_inflight:
+            finished, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                # 有批次处理失败时在这里抛出，工作进程以非零状态退出，不再发送结束标记
+                task.result()
+        inflight.add(asyncio.create_task(handle(*message)))
+    for task in inflight:
+        await task
+    if close is not None:
+        close()
+
+
+def _async_worker(stage, in_queue, out_queue, counter, done, num_consumers):
+    asyncio.run(_async_loop(stage, in_queue, out_queue, counter))
+    _finish(done, 1, out_queue, num_consumers)
+
+
+def _format_counters(counters, elapsed):
+    lines = []
+    for counter in counters:
+        snap = counter.snapshot()
+        worker_seconds = max(elapsed * counter.num_workers, 1e-9)
+        lines.append(f"  {counter.name:<10} {int(snap['items']):>9} docs {snap['items'] / max(elapsed, 1e-9):9.1f} docs/s  "
+                     f"busy {100 * snap['busy'] / worker_seconds:5.1f}%  "
+                     f"starved {100 * snap['wait_in'] / worker_seconds:5.1f}%  "
+                     f"blocked {100 * snap['wait_out'] / worker_seconds:5.1f}%")
+    return "\n".join(lines)
+
+
+def run_stream(input_path, output_path, stages, batch_size=64, queue_size=8, report_every=30.0):
+    """
+    把 stages 串成并发执行的流水线：读入 -> stages[0] -> ... -> stages[-1] -> 写出，相邻阶段之间是
+    容量为 queue_size 批的有界队列。各阶段同时工作，总耗时接近最慢的阶段，而不是各阶段之和。
+
+    批次带序号，多个工作进程乱序完成的批次在写出前重新排好，输出顺序与输入一致。
+    输出先写到临时文件，全部完成后原子替换。每 report_every 秒打印一次各阶段吞吐：
+    busy 为处理时间占比（异步阶段多批并发，可超过 100%），starved 为等待上游的占比，blocked 为被下游反压阻塞的占比。
+    """
+    ctx = mp.get_context()
+    counters = [StageCounter("read", 1, ctx)] + [StageCounter(s.name, s.num_workers, ctx) for s in stages] \
+        + [StageCounter("write", 1, ctx)]
+    queues = [ctx.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    num_batches = ctx.Value('i', -1)
+    processes = [ctx.Process(target=_source_worker, name="read", daemon=True,
+                             args=(input_path, batch_size, queues[0], counters[0], stages[0].num_workers,
+                                   num_batches))]
+    for i, stage in enumerate(stages):
+        done = ctx.Value('i', 0)
+        num_consumers = stages[i + 1].num_workers if i + 1 < len(stages) else 1
+        if stage.kind == "async":
+            processes.append(ctx.Process(target=_async_worker, name=stage.name, daemon=True,
+                                         args=(stage, queues[i], queues[i + 1], counters[i + 1], done,
+                                               num_consumers)))
+        else:
+            for w in range(stage.num_workers):
+                processes.append(ctx.Process(target=_process_worker, name=f"{stage.name}-{w}", daemon=True,
+                                             args=(stage, queues[i], queues[i + 1], counters[i + 1], done,
+                                                   num_consumers)))
+    for p in processes:
+        p.start()
+
+    writer_counter = counters[-1]
+    start_time = last_report = time.time()
+    pending = {}
+    next_seq = 0
+    tmp_path = output_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f_out:
+            while True:
+                wait_start = time.perf_counter()
+                try:
+                    message = queues[-1].get(timeout=1.0)
+                except queue.Empty:
+                    writer_counter.add(wait_in=time.perf_counter() - wait_start)
+                    failed = [p for p in processes if p.exitcode not in (None, 0)]
+                    if failed:
+                        raise RuntimeError(f"Stage worker '{failed[0].name}' exited with code {failed[0].exitcode}.")
+                    message = False
+                else:
+                    writer_counter.add(wait_in=time.perf_counter() - wait_start)
+                if message is None:
+                    break
+                if message:
+                    pending[message[0]] = message[1]
+                    write_start = time.perf_counter()
+                    while next_seq in pending:
+                        items = pending.pop(next_seq)
+                        for item in items:
+                            json.dump(item, f_out, ensure_ascii=False)
+                            f_out.write('\n')
+                        writer_counter.add(items=len(items), batches=1)
+                        next_seq += 1
+                    writer_counter.add(busy=time.perf_counter() - write_start)
+                if report_every and time.time() - last_report >= report_every:
+                    last_report = time.time()
+                    print(f"[{last_report - start_time:8.0f}s]\n{_format_counters(counters, last_report - start_time)}",
+                          flush=True)
+        for p in processes:
+            p.join()
+        failed = [p for p in processes if p.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"Stage worker '{failed[0].name}' exited with code {failed[0].exitcode}.")
+        if pending or next_seq != num_batches.value:
+            raise RuntimeError(f"Stream ended after {next_seq} of {num_batches.value} batches "
+                               f"({len(pending)} out of order); the output is incomplete.")
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        raise
+    elapsed = time.time() - start_time
+    print(f"\nStreamed {int(writer_counter.snapshot()['items'])} documents to '{output_path}' in {elapsed:.1f}s:\n"
+          f"{_format_counters(counters, elapsed)}")
+    return {c.name: c.snapshot() for c in counters}
+
+
+def setup_extract(model_name, batch_size):
+    sys.path.insert(0, REPO_ROOT)
+    from extract import build_record, entities_from_doc, load_nlp
+    nlp = load_nlp(model_name)
+
+    def process(items):
+        docs = nlp.pipe((item['doc_token'] for item in items), batch_size=batch_size)
+        return [build_record(item, entities_from_doc(doc)) for item, doc in zip(items, docs)]
+
+    return process, None
+
+
+def setup_link(cache_path, pipe_batch_size, ngram_index_dir=None, ngram_threshold=0.75):
+    from link_cache import LinkCache
+    from linker import LINKER_CONFIG, link_documents, load_models
+    nlp_scispacy, nlp_wikidata = load_models()
+    cache = LinkCache(cache_path or ":memory:", LINKER_CONFIG)
+    ngram_index = None
+    if ngram_index_dir:
+        from ngram_index import NgramIndex
+        ngram_index = NgramIndex(ngram_index_dir)
+
+    def process(items):
+        linked = link_documents(items, nlp_wikidata, nlp_scispacy, cache, pipe_batch_size, ngram_index, ngram_threshold)
+        cache.flush()
+        return linked
+
+    return process, cache.close
+
+
+def setup_expand(keep_sources, mrrel_path, umls_index_dir, wikidata_cache_path, max_neighbors, seed,
+                 min_score=0.0, stop_list_path=None):
+    """
+    清洗（linker_clean.clean_item）与邻居扩展合并为一个异步阶段：UMLS 在本地索引上采样，Wikidata 异步批量抓取。
+
+    流式模式只有一遍，linker_clean 中需要语料 IDF 的 max_entities 截断在这里不可用。
+    """
+    import numpy as np
+    from add_neighbor import expand_item, wikidata_ids_of
+    from linker_clean import EntityFilter, clean_item, load_stop_list
+    from umls_index import load_umls_index
+    from wikidata_fetch import RateLimiter, WikidataNeighborFetcher
+
+    umls_index = load_umls_index(mrrel_path, umls_index_dir)
+    fetcher = WikidataNeighborFetcher(cache_path=wikidata_cache_path, limit=max_neighbors)
+    rng = np.random.default_rng(seed)
+    entity_filter = EntityFilter(keep_sources, min_score, stop_list=load_stop_list(stop_list_path) if stop_list_path else ())
+    limits = {}
+
+    async def process(items):
+        items = [clean_item(item, entity_filter=entity_filter) for item in items]
+        qids = set().union(*(wikidata_ids_of(item) for item in items))
+        neighbors = {}
+        if qids:
+            if not limits:
+                limits["semaphore"] = asyncio.Semaphore(fetcher.max_concurrency)
+                limits["limiter"] = RateLimiter(fetcher.requests_per_second)
+            neighbors = await fetcher.fetch(sorted(qids), progress=False, **limits)
+        return [expand_item(item, umls_index, neighbors, max_neighbors, rng) for item in items]
+
+    def close():
+        print(f"Wikidata neighbor fetch stats: {fetcher.stats}")
+        print(f"Entity filter stats: {dict(entity_filter.counters)}")
+        fetcher.close()
+
+    return process, close
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Stream documents through extraction, linking, cleaning and neighbor expansion "
+                                     "concurrently, without writing the intermediate files.")
+    parser.add_argument("--input", default="../dataset/WebOfScience/wos_total.json")
+    parser.add_argument("--output", default="data_with_neighbors.jsonl")
+    parser.add_argument("--model", default="en_core_sci_lg")
+    parser.add_argument("--extract_workers", default=1, type=int)
+    parser.add_argument("--link_workers", default=1, type=int)
+    parser.add_argument("--batch_size", default=64, type=int, help="每批文档数，阶段之间以批为单位传递")
+    parser.add_argument("--queue_size", default=8, type=int, help="相邻阶段之间最多缓冲的批数")
+    parser.add_argument("--pipe_batch_size", default=256, type=int)
+    parser.add_argument("--cache", default="link_cache.sqlite")
+    parser.add_argument("--ngram_index", default=None, help="ngram_index.py 构建的索引目录，spaCy 链接失败时做模糊匹配")
+    parser.add_argument("--ngram_threshold", default=0.75, type=float)
+    parser.add_argument("--keep_sources", nargs="+", default=["MeSH/UMLS"])
+    parser.add_argument("--min_score", default=0.0, type=float, help="丢弃 link_score 更低的实体")
+    parser.add_argument("--stop_list", default=None, help="停用实体表，每行一个文本、名称或 ID")
+    parser.add_argument("--mrrel", default="./MRREL.RRF")
+    parser.add_argument("--umls_index_dir", default="./umls_index")
+    parser.add_argument("--wikidata_cache", default="wikidata_cache.sqlite")
+    parser.add_argument("--max_neighbors", default=10, type=int)
+    parser.add_argument("--max_inflight", default=4, type=int, help="邻居扩展阶段同时处理的批数")
+    parser.add_argument("--report_every", default=30.0, type=float)
+    parser.add_argument("--seed", default=None, type=int)
+    args = parser.parse_args()
+
+    run_stream(args.input, args.output, [
+        Stage("extract", setup_extract, (args.model, args.batch_size), num_workers=args.extract_workers),
+        Stage("link", setup_link, (args.cache, args.pipe_batch_size, args.ngram_index, args.ngram_threshold),
+              num_workers=args.link_workers),
+        Stage("expand", setup_expand, (tuple(args.keep_sources), args.mrrel, args.umls_index_dir,
+                                       args.wikidata_cache, args.max_neighbors, args.seed,
+                                       args.min_score, args.stop_list),
+              kind="async", max_inflight=args.max_inflight),
+    ], batch_size=args.batch_size, queue_size=args.queue_size, report_every=args.report_every)
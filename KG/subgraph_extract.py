@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import shutil
+from array import array
+import numpy as np
+from tqdm import tqdm
+
+SUBGRAPH_FORMAT_VERSION = 1
+INCIDENT_DIRNAME = "csr_incident"
+SPLITS = ("train", "val", "test")
+
+
+def build_incident_csr(kg, csr_dir):
+    """节点 -> 关联三元组（作为 head 或 tail）的 CSR，邻居和三元组编号一并存放，缓存在 store/ 下。"""
+    heads = np.asarray(kg.heads, dtype=np.int64)
+    tails = np.asarray(kg.tails, dtype=np.int64)
+    edge_ids = np.arange(len(heads), dtype=np.int64)
+    owners = np.concatenate([heads, tails])
+    neighbors = np.concatenate([tails, heads])
+    edges = np.concatenate([edge_ids, edge_ids])
+    order = np.lexsort((edges, owners))
+    indptr = np.zeros(kg.num_entities + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owners, minlength=kg.num_entities), out=indptr[1:])
+    tmp_dir = csr_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "indptr.npy"), indptr)
+    np.save(os.path.join(tmp_dir, "neighbors.npy"), neighbors[order].astype(np.int32))
+    np.save(os.path.join(tmp_dir, "edges.npy"), edges[order])
+    os.replace(tmp_dir, csr_dir)
+
+
+def sample_khop(indptr, neighbors, edges, seeds, hops, fanout, max_nodes, rng):
+    """
+    从种子节点出发做 hops 跳扩展；每个节点至多无放回采样 fanout 条关联边，总节点数不超过 max_nodes。
+
+    Returns:
+        nodes: 全局节点 ID，种子在前、按发现顺序排列
+        edge_ids: 采样到的三元组编号（去重、有序）
+    """
+    nodes = list(dict.fromkeys(int(s) for s in seeds))[:max_nodes]
+    seen = set(nodes)
+    sampled_edges = []
+    frontier = nodes
+    for _ in range(hops):
+        next_frontier = []
+        for node in frontier:
+            start, end = indptr[node], indptr[node + 1]
+            degree = end - start
+            if degree == 0:
+                continue
+            picks = np.arange(start, end) if degree <= fanout else np.sort(rng.choice(np.arange(start, end), fanout, replace=False))
+            for pos in picks:
+                neighbor = int(neighbors[pos])
+                if neighbor not in seen:
+                    if len(nodes) >= max_nodes:
+                        continue
+                    seen.add(neighbor)
+                    nodes.append(neighbor)
+                    next_frontier.append(neighbor)
+                sampled_edges.append(int(edges[pos]))
+        frontier = next_frontier
+        if not frontier:
+            break
+    return np.array(nodes, dtype=np.int64), np.unique(np.array(sampled_edges, dtype=np.int64))
+
+
+def iter_split_documents(path):
+    """与 dataset/KGWebOfScience/my_dataset.process_data 相同的行顺序，第 i 个非空行即第 i 个样本。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield [item['linked_id'] for item in json.loads(line).get('linked_entities', [])]
+
+
+def extract_subgraphs(kg_dir, data_dir, output_dir, splits=SPLITS, hops=2, fanout=10, max_nodes=128, seed=0,
+                      file_pattern="wos_{split}.json"):
+    """
+    为每个划分中的每篇文档预先抽取有界的 k 跳子图，写成按偏移索引的紧凑文件，训练时只需按下标读取切片。
+
+    <output_dir>/<split>/ 下:
+        nodes.bin         int32，每篇文档的全局节点 ID 依次拼接（种子实体在前）
+        node_offsets.npy  第 i 篇文档的节点为 nodes[node_offsets[i]:node_offsets[i + 1]]
+        edges.bin         int32 (E, 3)，每条边为 (局部 head 下标, 局部 tail 下标, relation ID)
+        edge_offsets.npy  第 i 篇文档的边为 edges[edge_offsets[i]:edge_offsets[i + 1]]
+        num_seeds.npy     每篇文档在 KG 中找到的种子实体个数
+        meta.json         格式版本与抽取参数
+
+    采样由 (seed, 文档下标) 决定，同一 KG 与参数下重复运行结果完全一致。
+    """
+    from kg_store import STORE_DIRNAME, open_kg
+
+    kg = open_kg(kg_dir)
+    csr_dir = os.path.join(kg_dir, STORE_DIRNAME, INCIDENT_DIRNAME)
+    if not os.path.exists(csr_dir):
+        build_incident_csr(kg, csr_dir)
+    indptr = np.load(os.path.join(csr_dir, "indptr.npy"), mmap_mode='r')
+    neighbors = np.load(os.path.join(csr_dir, "neighbors.npy"), mmap_mode='r')
+    edges = np.load(os.path.join(csr_dir, "edges.npy"), mmap_mode='r')
+    entity_to_id = kg.entity_to_id()
+
+    for split in splits:
+        input_path = os.path.join(data_dir, file_pattern.format(split=split))
+        if not os.path.exists(input_path):
+            print(f"Warning: '{input_path}' not found, skipping split '{split}'.")
+            continue
+        split_dir = os.path.join(output_dir, split)
+        tmp_dir = split_dir + ".tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        node_offsets, edge_offsets, num_seeds = array('q', [0]), array('q', [0]), array('i')
+        missing = 0
+        with open(os.path.join(tmp_dir, "nodes.bin"), 'wb') as node_file, \
+                open(os.path.join(tmp_dir, "edges.bin"), 'wb') as edge_file:
+            for doc_index, linked_ids in enumerate(tqdm(iter_split_documents(input_path), desc=f"Subgraphs ({split})")):
+                seeds = [entity_to_id[e] for e in linked_ids if e in entity_to_id]
+                missing += len(linked_ids) - len(seeds)
+                rng = np.random.default_rng([seed, doc_index])
+                nodes, edge_ids = sample_khop(indptr, neighbors, edges, seeds, hops, fanout, max_nodes, rng)
+
+                triplets = np.asarray(kg.triplets[edge_ids], dtype=np.int64).reshape(-1, 3)
+                order = np.argsort(nodes)
+                local = np.stack([order[np.searchsorted(nodes[order], triplets[:, 0])],
+                                  order[np.searchsorted(nodes[order], triplets[:, 1])],
+                                  triplets[:, 2]], axis=1) if len(triplets) else np.zeros((0, 3), dtype=np.int64)
+
+                node_file.write(nodes.astype(np.int32).tobytes())
+                edge_file.write(local.astype(np.int32).tobytes())
+                node_offsets.append(node_offsets[-1] + len(nodes))
+                edge_offsets.append(edge_offsets[-1] + len(local))
+                num_seeds.append(min(len(set(seeds)), max_nodes))
+
+        np.save(os.path.join(tmp_dir, "node_offsets.npy"), np.frombuffer(node_offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "edge_offsets.npy"), np.frombuffer(edge_offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "num_seeds.npy"), np.frombuffer(num_seeds, dtype=np.int32))
+        with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "format_version": SUBGRAPH_FORMAT_VERSION,
+                "kg_dir": os.path.abspath(kg_dir),
+                "num_entities": kg.num_entities,
+                "num_documents": len(num_seeds),
+                "hops": hops, "fanout": fanout, "max_nodes": max_nodes, "seed": seed,
+            }, f, indent=2)
+        if os.path.exists(split_dir):
+            shutil.rmtree(split_dir)
+        os.replace(tmp_dir, split_dir)
+        print(f"'{split}': {len(num_seeds)} documents, {node_offsets[-1]} nodes, {edge_offsets[-1]} edges; "
+              f"{missing} linked entities not found in the KG.")
+
+
+class SubgraphStore:
+    """读取 extract_subgraphs 的结果；所有数组均为 memory-map，按文档下标取切片。"""
+
+    def __init__(self, output_dir, split):
+        split_dir = os.path.join(output_dir, split)
+        with open(os.path.join(split_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != SUBGRAPH_FORMAT_VERSION:
+            raise ValueError(f"Subgraphs at '{split_dir}' have format {self.meta.get('format_version')}, "
+                             f"expected {SUBGRAPH_FORMAT_VERSION}. Rerun extract_subgraphs().")
+        self.node_offsets = np.load(os.path.join(split_dir, "node_offsets.npy"))
+        self.edge_offsets = np.load(os.path.join(split_dir, "edge_offsets.npy"))
+        self.num_seeds = np.load(os.path.join(split_dir, "num_seeds.npy"))
+
+        def memmap(name, shape):
+            path = os.path.join(split_dir, name)
+            if os.path.getsize(path) == 0:
+                return np.zeros(shape, dtype=np.int32)
+            return np.memmap(path, dtype=np.int32, mode='r').reshape(shape)
+
+        self.nodes = memmap("nodes.bin", (-1,))
+        self.edges = memmap("edges.bin", (-1, 3))
+
+    def __len__(self):
+        return len(self.num_seeds)
+
+    def __getitem__(self, index):
+        """
+        Returns:
+            dict: nodes (全局实体 ID，前 num_seeds 个为文档的链接实体), edge_index (2, E，局部下标),
+                  edge_type (E,)
+        """
+        nodes = np.asarray(self.nodes[self.node_offsets[index]:self.node_offsets[index + 1]], dtype=np.int64)
+        edges = np.asarray(self.edges[self.edge_offsets[index]:self.edge_offsets[index + 1]], dtype=np.int64)
+        return {
+            "nodes": nodes,
+            "num_seeds": int(self.num_seeds[index]),
+            "edge_index": edges[:, :2].T,
+            "edge_type": edges[:, 2],
+        }
+
+    def batch(self, indices):
+        """把若干文档的子图拼成一个不相交并图（与 PyG Batch 相同的约定，batch[i] 为节点所属样本）。"""
+        graphs = [self[i] for i in indices]
+        sizes = np.array([len(g["nodes"]) for g in graphs], dtype=np.int64)
+        shifts = np.cumsum(sizes) - sizes
+        return {
+            "nodes": np.concatenate([g["nodes"] for g in graphs]) if graphs else np.zeros(0, dtype=np.int64),
+            "edge_index": np.concatenate([g["edge_index"] + s for g, s in zip(graphs, shifts)], axis=1)
+            if graphs else np.zeros((2, 0), dtype=np.int64),
+            "edge_type": np.concatenate([g["edge_type"] for g in graphs]) if graphs else np.zeros(0, dtype=np.int64),
+            "batch": np.repeat(np.arange(len(graphs)), sizes),
+            "num_seeds": np.array([g["num_seeds"] for g in graphs], dtype=np.int64),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Precompute bounded k-hop KG subgraphs for every document in the dataset splits.")
+    parser.add_argument("--kg_dir", default="./final_enriched_kg")
+    parser.add_argument("--data_dir", default="../dataset/KGWebOfScience")
+    parser.add_argument("--output_dir", default="./subgraphs")
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS))
+    parser.add_argument("--hops", type=int, default=2)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--max_nodes", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    extract_subgraphs(args.kg_dir, args.data_dir, args.output_dir, args.splits, args.hops, args.fanout,
+                      args.max_nodes, args.seed)
@@ -0,0 +1,46 @@
+import itertools
+import pytest
+from ngram_index import build_ngram_index, NgramIndex
+
+WORDS = ["alpha", "beta", "gamma", "delta", "omega", "sigma", "kappa", "theta"]
+
+
+def write_aliases(path, entities):
+    with open(path, 'w', encoding='utf-8') as f:
+        for qid, label, aliases in entities:
+            f.write(f"{qid}\t{label}\t{'|'.join(aliases)}\tdesc\n")
+
+
+def build(tmp_path, entities):
+    tsv = str(tmp_path / "aliases.tsv")
+    write_aliases(tsv, entities)
+    build_ngram_index(str(tmp_path / "index"), wikidata_aliases_path=tsv)
+    return NgramIndex(str(tmp_path / "index"))
+
+
+def test_exact_alias_scores_one_on_small_table(tmp_path):
+    index = build(tmp_path, [("Q1", "aspirin", ["acetylsalicylic acid"]),
+                             ("Q2", "ibuprofen", []),
+                             ("Q3", "paracetamol", ["acetaminophen"])])
+    for mention, qid in [("aspirin", "Q1"), ("Acetylsalicylic  Acid", "Q1"), ("acetaminophen", "Q3")]:
+        (entity, score), = index.search([mention], k=1)[0]
+        assert index.entities[entity][0] == qid
+        assert score == pytest.approx(1.0, abs=1e-3)
+
+
+def test_exact_alias_scores_one_with_frequent_ngrams(tmp_path):
+    # 8 个词的全部 4 词组合使几乎所有 n-gram 都超过高频阈值；后 200 个别名只共享同一组非高频 n-gram（"a x", "xqz" 等），
+    # 召回得分全部并列，多于 shortlist
+    filler = [" ".join(words) for words in itertools.product(WORDS, repeat=4)]
+    tied = [" ".join(words) + " xqz" for words in itertools.product(WORDS, repeat=3)][:200]
+    index = build(tmp_path, [(f"Q{i}", alias, []) for i, alias in enumerate(filler + tied)])
+    assert index.meta["frequent_ngrams"] > 0
+    for alias, candidates in zip(tied, index.search(tied, k=1)):
+        assert candidates[0][1] == pytest.approx(1.0, abs=1e-3), alias
+
+
+def test_typo_finds_entity(tmp_path):
+    index = build(tmp_path, [("Q1", "aspirin", []), ("Q2", "ibuprofen", []), ("Q3", "paracetamol", [])])
+    (entity, score), = index.search(["paracetamoll"], k=1)[0]
+    assert index.entities[entity][0] == "Q3"
+    assert 0.5 < score < 1.0
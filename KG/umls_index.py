@@ -0,0 +1,191 @@
+import json
+import os
+from array import array
+import numpy as np
+from tqdm import tqdm
+
+INDEX_FORMAT_VERSION = 1
+
+
+def _concat_ranges(starts, lengths):
+    """把若干 [start, start+length) 区间拼接成一个下标数组（全向量化）。"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(np.asarray(starts, dtype=np.int64) - offsets, lengths) + np.arange(total, dtype=np.int64)
+
+
+def _write_csr(index_dir, prefix, rows, cols, rels, num_nodes):
+    # 按 (row, col, rel) 排序后，每一行的邻居按 col 有序，可以直接二分查找
+    order = np.lexsort((rels, cols, rows))
+    rows, cols, rels = rows[order], cols[order], rels[order]
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+    np.save(os.path.join(index_dir, f"{prefix}_indptr.npy"), indptr)
+    np.save(os.path.join(index_dir, f"{prefix}_targets.npy"), cols)
+    np.save(os.path.join(index_dir, f"{prefix}_rels.npy"), rels)
+
+
+def build_umls_index(mrrel_path, index_dir):
+    """
+    一次性把 MRREL.RRF 转成整数编码的 CSR 邻接表，之后所有脚本只需 memory-map 打开。
+
+    产物:
+        cuis.npy              排好序的定长 CUI 字节串，下标即整数 ID（二分查找）
+        relations.json        关系名词表
+        fwd_{indptr,targets,rels}.npy   CUI1 -> CUI2 的正向邻接
+        rev_{indptr,targets,rels}.npy   CUI2 -> CUI1 的反向邻接（对应 inverse_ 关系）
+        meta.json             格式版本、规模与源文件信息
+    """
+    cui_ids = {}
+    rel_ids = {}
+    heads, rels, tails = array('i'), array('i'), array('i')
+    with open(mrrel_path, 'r', encoding='utf-8') as f:
+        for line in tqdm(f, desc="Indexing MRREL.RRF"):
+            parts = line.strip().split('|')
+            if len(parts) > 4:
+                cui1, rel, cui2 = parts[0], parts[3], parts[4]
+                heads.append(cui_ids.setdefault(cui1, len(cui_ids)))
+                rels.append(rel_ids.setdefault(rel, len(rel_ids)))
+                tails.append(cui_ids.setdefault(cui2, len(cui_ids)))
+
+    # 把按出现顺序分配的临时 ID 重映射为按字典序排序的 ID（dict 保序，第 k 个键即临时 ID k）
+    width = max((len(c) for c in cui_ids), default=1)
+    cui_keys = np.array(list(cui_ids), dtype=f"S{width}")
+    del cui_ids
+    order = np.argsort(cui_keys, kind='stable')
+    cuis_sorted = cui_keys[order]
+    cui_remap = np.empty(len(order), dtype=np.int32)
+    cui_remap[order] = np.arange(len(order), dtype=np.int32)
+    rel_list = sorted(rel_ids)
+    rel_remap = np.array([rel_list.index(r) for r in rel_ids], dtype=np.int16)
+
+    heads = cui_remap[np.frombuffer(heads, dtype=np.int32)]
+    tails = cui_remap[np.frombuffer(tails, dtype=np.int32)]
+    rels = rel_remap[np.frombuffer(rels, dtype=np.int32)]
+
+    # MRREL 中同一关系会因来源词表不同而重复出现，这里去重
+    keys = np.unique(np.stack([heads.astype(np.int64), tails, rels]), axis=1)
+    heads, tails, rels = keys[0].astype(np.int32), keys[1].astype(np.int32), keys[2].astype(np.int16)
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "cuis.npy"), cuis_sorted)
+    with open(os.path.join(index_dir, "relations.json"), 'w', encoding='utf-8') as f:
+        json.dump(rel_list, f)
+    _write_csr(index_dir, "fwd", heads, tails, rels, len(cuis_sorted))
+    _write_csr(index_dir, "rev", tails, heads, rels, len(cuis_sorted))
+    stat = os.stat(mrrel_path)
+    with open(os.path.join(index_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "format_version": INDEX_FORMAT_VERSION,
+            "num_cuis": len(cuis_sorted),
+            "num_relations": len(rel_list),
+            "num_edges": int(len(heads)),
+            "source": os.path.abspath(mrrel_path),
+            "source_size": stat.st_size,
+            "source_mtime": stat.st_mtime,
+        }, f, indent=2)
+    print(f"UMLS index built at '{index_dir}': {len(cuis_sorted)} CUIs, {len(rel_list)} relations, {len(heads)} edges.")
+
+
+class UMLSIndex:
+    """MRREL 的只读 CSR 索引；所有数组均为 memory-map，多个进程打开同一份索引时共享页缓存。"""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"UMLS index at '{index_dir}' has format {self.meta.get('format_version')}, "
+                             f"expected {INDEX_FORMAT_VERSION}. Rebuild it with build_umls_index().")
+        with open(os.path.join(index_dir, "relations.json"), 'r', encoding='utf-8') as f:
+            self.relation_names = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+
+        self.cuis = load("cuis.npy")
+        self.fwd_indptr, self.fwd_targets, self.fwd_rels = load("fwd_indptr.npy"), load("fwd_targets.npy"), load("fwd_rels.npy")
+        self.rev_indptr, self.rev_targets, self.rev_rels = load("rev_indptr.npy"), load("rev_targets.npy"), load("rev_rels.npy")
+
+    def __len__(self):
+        return len(self.cuis)
+
+    def __contains__(self, cui):
+        return self.cui_id(cui) >= 0
+
+    def cui_ids(self, cuis):
+        """批量把 CUI 字符串映射为整数 ID，不在索引中的返回 -1。"""
+        if len(self.cuis) == 0:
+            return np.full(len(cuis), -1, dtype=np.int64)
+        encoded = [c.encode('utf-8') for c in cuis]
+        # 转成定长 S{width} 时更长的字符串会被截断，可能与共享前缀的 CUI 误匹配，直接记为 -1
+        too_long = np.array([len(e) > self.cuis.dtype.itemsize for e in encoded], dtype=bool)
+        query = np.array(encoded, dtype=self.cuis.dtype)
+        pos = np.minimum(np.searchsorted(self.cuis, query), len(self.cuis) - 1)
+        return np.where((self.cuis[pos] == query) & ~too_long, pos, -1)
+
+    def cui_id(self, cui):
+        return int(self.cui_ids([cui])[0])
+
+    def cui(self, cui_id):
+        return self.cuis[cui_id].decode('utf-8')
+
+    def relations_between(self, head_id, tail_id):
+        """返回 head -> tail 的所有关系名（正向）。"""
+        start, end = self.fwd_indptr[head_id], self.fwd_indptr[head_id + 1]
+        row = self.fwd_targets[start:end]
+        lo = np.searchsorted(row, tail_id, side='left')
+        hi = np.searchsorted(row, tail_id, side='right')
+        return [self.relation_names[r] for r in self.fwd_rels[start + lo:start + hi]]
+
+    def sample_neighbors(self, cui_ids, limit=10, rng=None):
+        """
+        批量邻居采样：对每个 CUI 从正向和反向邻居中无放回地均匀采样至多 limit 个。
+
+        Returns:
+            list，与 cui_ids 对齐，每项为 [{"relation_name", "neighbor_id"}, ...]
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        cui_ids = np.asarray(cui_ids, dtype=np.int64)
+        result = [[] for _ in range(len(cui_ids))]
+        valid = np.flatnonzero(cui_ids >= 0)
+        if len(valid) == 0:
+            return result
+        ids = cui_ids[valid]
+        fwd_deg = self.fwd_indptr[ids + 1] - self.fwd_indptr[ids]
+        rev_deg = self.rev_indptr[ids + 1] - self.rev_indptr[ids]
+        fwd_pos = _concat_ranges(self.fwd_indptr[ids], fwd_deg)
+        rev_pos = _concat_ranges(self.rev_indptr[ids], rev_deg)
+        owner = np.concatenate([np.repeat(np.arange(len(ids)), fwd_deg), np.repeat(np.arange(len(ids)), rev_deg)])
+        targets = np.concatenate([self.fwd_targets[fwd_pos], self.rev_targets[rev_pos]])
+        rels = np.concatenate([self.fwd_rels[fwd_pos], self.rev_rels[rev_pos]])
+        inverse = np.concatenate([np.zeros(len(fwd_pos), dtype=bool), np.ones(len(rev_pos), dtype=bool)])
+
+        # 每个候选赋一个随机键，组内按随机键排序后取前 limit 个即为无放回均匀采样
+        order = np.lexsort((rng.random(len(owner)), owner))
+        sorted_owner = owner[order]
+        group_start = np.searchsorted(sorted_owner, np.arange(len(ids)))
+        keep = order[np.arange(len(order)) - group_start[sorted_owner] < limit]
+        for i, t, r, inv in zip(owner[keep], targets[keep], rels[keep], inverse[keep]):
+            name = self.relation_names[r]
+            result[valid[i]].append({
+                "relation_name": f"inverse_{name}" if inv else name,
+                "neighbor_id": self.cui(t),
+            })
+        return result
+
+
+def load_umls_index(mrrel_path, index_dir):
+    """打开 UMLS 索引；索引不存在时从 MRREL.RRF 构建一次。两者都不存在时返回 None。"""
+    if not os.path.exists(os.path.join(index_dir, "meta.json")):
+        if not os.path.exists(mrrel_path):
+            print(f"Warning: neither a UMLS index at '{index_dir}' nor MRREL.RRF at '{mrrel_path}' was found.")
+            return None
+        build_umls_index(mrrel_path, index_dir)
+    index = UMLSIndex(index_dir)
+    if os.path.exists(mrrel_path) and os.path.getsize(mrrel_path) != index.meta.get("source_size"):
+        print(f"Warning: '{mrrel_path}' differs from the file the UMLS index was built from; "
+              f"delete '{index_dir}' to rebuild it.")
+    return index
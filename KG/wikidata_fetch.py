@@ -0,0 +1,228 @@
+import asyncio
+import json
+import random
+import re
+import sqlite3
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from tqdm import tqdm
+
+DEFAULT_ENDPOINT = "https://query.wikidata.org/sparql"
+DEFAULT_USER_AGENT = "SCHK-HTC-KG-builder/1.0 (neighbor expansion)"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+QID_PATTERN = re.compile(r"Q[0-9]+")
+ENTITY_FILTER = 'FILTER(isIRI(?neighbor) && STRSTARTS(STR(?neighbor), "http://www.wikidata.org/entity/Q"))'
+
+
+def normalize_qid(entity_id):
+    entity_id = entity_id.strip()
+    if entity_id.startswith('Q') and entity_id.endswith('_'):
+        entity_id = entity_id[:-1]
+    return entity_id
+
+
+def is_valid_qid(qid):
+    """只有形如 Q123 的 ID 可以拼进 SPARQL；其它 ID 会让整条批量查询返回 HTTP 400。"""
+    return QID_PATTERN.fullmatch(qid) is not None
+
+
+def build_batch_query(qids, limit):
+    """
+    把多个 QID 合进一条 SPARQL 查询。
+
+    每个 QID 一个带 LIMIT 的子查询（通过 VALUES 绑定 ?item），再 UNION 起来：
+    如果只在外层用一个 VALUES 加总 LIMIT，热门实体（如 Q5）的入边会挤掉其它实体的结果。
+    """
+    invalid = [qid for qid in qids if not is_valid_qid(qid)]
+    if invalid:
+        raise ValueError(f"Invalid Wikidata QIDs: {invalid[:5]}")
+    subqueries = []
+    for qid in qids:
+        subqueries.append(f"""
+      {{
+        SELECT ?item ?prop ?neighbor WHERE {{
+          VALUES ?item {{ wd:{qid} }}
+          {{ ?item ?prop ?neighbor. {ENTITY_FILTER} }}
+          UNION
+          {{ ?neighbor ?prop ?item. {ENTITY_FILTER} }}
+        }}
+        LIMIT {limit}
+      }}""")
+    return f"""
+    SELECT ?item ?prop ?propLabel ?neighbor ?neighborLabel WHERE {{
+      {" UNION ".join(subqueries)}
+      SERVICE wikibase:label {{ bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }}
+    }}
+    """
+
+
+def parse_bindings(results, qids):
+    neighbors = {qid: [] for qid in qids}
+    for result in results["results"]["bindings"]:
+        qid = result.get("item", {}).get("value", "").split('/')[-1]
+        if qid not in neighbors:
+            continue
+        prop_url = result.get("prop", {}).get("value", "")
+        neighbor_url = result.get("neighbor", {}).get("value", "")
+        neighbors[qid].append({
+            "relation_id": prop_url.split('/')[-1],
+            "relation_name": result.get("propLabel", {}).get("value", "N/A"),
+            "neighbor_id": neighbor_url.split('/')[-1],
+            "neighbor_name": result.get("neighborLabel", {}).get("value", "N/A"),
+        })
+    return neighbors
+
+
+class ResponseCache:
+    """按 (endpoint, QID, limit) 缓存邻居查询结果的 SQLite 文件，重跑时不会重复查询。"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS neighbors ("
+            "endpoint TEXT NOT NULL, qid TEXT NOT NULL, lim INTEGER NOT NULL, result TEXT NOT NULL, "
+            "PRIMARY KEY (endpoint, qid, lim)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def get_many(self, endpoint, qids, limit, chunk_size=500):
+        found = {}
+        for i in range(0, len(qids), chunk_size):
+            chunk = qids[i:i + chunk_size]
+            rows = self.conn.execute(
+                f"SELECT qid, result FROM neighbors WHERE endpoint = ? AND lim = ? "
+                f"AND qid IN ({','.join('?' * len(chunk))})",
+                [endpoint, limit] + chunk
+            ).fetchall()
+            found.update((qid, json.loads(result)) for qid, result in rows)
+        return found
+
+    def put_many(self, endpoint, limit, neighbors):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO neighbors (endpoint, qid, lim, result) VALUES (?, ?, ?, ?)",
+            [(endpoint, qid, limit, json.dumps(value, ensure_ascii=False)) for qid, value in neighbors.items()]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class RateLimiter:
+    """限制请求发起速率（每秒至多 rate 次），与并发上限相互独立。"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class WikidataNeighborFetcher:
+    """
+    基于 asyncio 的批量 Wikidata 邻居抓取器。
+
+    多个 QID 合并成一次查询，并发数和请求速率都有上限，可重试错误按指数退避重试，
+    结果写入本地缓存。endpoint 可替换，便于在本地 stub HTTP 服务上测试。
+    """
+
+    def __init__(self, endpoint=DEFAULT_ENDPOINT, cache_path="wikidata_cache.sqlite", limit=10, batch_size=50,
+                 max_concurrency=4, requests_per_second=2.0, max_retries=5, backoff_base=2.0, timeout=60,
+                 user_agent=DEFAULT_USER_AGENT):
+        self.endpoint = endpoint
+        self.cache = ResponseCache(cache_path)
+        self.limit = limit
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.stats = {"cached": 0, "fetched": 0, "failed": 0, "invalid": 0, "requests": 0, "retries": 0}
+
+    def _post(self, query):
+        data = urllib.parse.urlencode({"query": query, "format": "json"}).encode('utf-8')
+        request = urllib.request.Request(self.endpoint, data=data, headers={
+            "Accept": "application/sparql-results+json",
+            "User-Agent": self.user_agent,
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    async def _fetch_batch(self, qids, semaphore, limiter):
+        query = build_batch_query(qids, self.limit)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with semaphore:
+                await limiter.wait()
+                self.stats["requests"] += 1
+                try:
+                    results = await asyncio.to_thread(self._post, query)
+                    return parse_bindings(results, qids)
+                except urllib.error.HTTPError as e:
+                    if e.code not in RETRYABLE_STATUS:
+                        print(f"Warning: Wikidata SPARQL query failed for {len(qids)} entities. Error: {e}")
+                        return None
+                    retry_after = e.headers.get("Retry-After") if e.headers else None
+                    error = e
+                except (urllib.error.URLError, TimeoutError, ConnectionError, json.JSONDecodeError) as e:
+                    error = e
+            if attempt == self.max_retries:
+                break
+            self.stats["retries"] += 1
+            delay = self.backoff_base ** attempt + random.random()
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+        print(f"Warning: Wikidata SPARQL query failed for {len(qids)} entities after {self.max_retries} retries. "
+              f"Error: {error}")
+        return None
+
+    async def fetch(self, entity_ids, semaphore=None, limiter=None, progress=True):
+        """
+        多个 fetch 并发执行时（如流式流水线中每批文档各调一次），应传入共享的 semaphore 和 limiter，
+        使并发数和请求速率的上限对所有调用整体生效。
+
+        Returns:
+            dict: {QID: [neighbor, ...]}。失败的批次返回空列表且不写缓存，下次运行会重新查询；
+            不是 Q 加数字的 ID 不查询，直接返回空列表并计入 stats["invalid"]。
+        """
+        qids = list(dict.fromkeys(normalize_qid(e) for e in entity_ids))
+        valid = [qid for qid in qids if is_valid_qid(qid)]
+        self.stats["invalid"] += len(qids) - len(valid)
+        results = self.cache.get_many(self.endpoint, valid, self.limit)
+        self.stats["cached"] += len(results)
+        missing = [qid for qid in valid if qid not in results]
+        if missing:
+            semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+            limiter = limiter or RateLimiter(self.requests_per_second)
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            tasks = [asyncio.create_task(self._fetch_batch(batch, semaphore, limiter)) for batch in batches]
+            for batch, task in tqdm(zip(batches, tasks), total=len(tasks), desc="Fetching Wikidata neighbors",
+                                   disable=not progress):
+                neighbors = await task
+                if neighbors is None:
+                    self.stats["failed"] += len(batch)
+                    continue
+                self.cache.put_many(self.endpoint, self.limit, neighbors)
+                self.stats["fetched"] += len(batch)
+                results.update(neighbors)
+        return {qid: results.get(qid, []) for qid in qids}
+
+    def fetch_all(self, entity_ids):
+        return asyncio.run(self.fetch(entity_ids))
+
+    def close(self):
+        self.cache.close()
@@ -1,36 +1,95 @@
+import argparse
+import json
 import spacy
 import scispacy
-from datasets import load_dataset
 from tqdm.auto import tqdm
-import json
-nlp = spacy.load("en_core_sci_lg")
+from KG.stream_io import iter_jsonl, ResumableJsonlWriter
+
+nlp = None
+
+
+def load_nlp(model_name="en_core_sci_lg"):
+    global nlp
+    if nlp is None:
+        nlp = spacy.load(model_name)
+    return nlp
+
+
+def entities_from_doc(doc):
+    return [(ent.text, ent.label_) for ent in doc.ents]
+
 
 def extract_entities_from_text(text):
-    doc = nlp(text)
-    entities = []
-    for ent in doc.ents:
-        entities.append((ent.text, ent.label_))
-    return entities
-sample_index = 10 
-with open("dataset/WebOfScience/wos_total.json",'r') as f:
-    data=f.readlines()
-    data=[json.loads(item) for item in data]
-
-all_extracted_data = []
-
-for i in tqdm(range(len(data))):
-    text = data[i]['doc_token']
-    
-    entities = extract_entities_from_text(text)
-    
-    all_extracted_data.append({
-        'text': text,
-        'label_level_1': data[i]['doc_label'][0],
-        'label_level_2': data[i]['doc_label'][1],
+    return entities_from_doc(load_nlp()(text))
+
+
+def build_record(item, entities):
+    return {
+        'text': item['doc_token'],
+        'label_level_1': item['doc_label'][0],
+        'label_level_2': item['doc_label'][1],
         'entities': entities
-    })
+    }
+
+
+def extract_all(input_path, output_path, batch_size=64, n_process=1):
+    """原始模式：全部抽取完后一次性写出 entity.json（JSON 数组）。"""
+    load_nlp()
+    records = (item for _, item in iter_jsonl(input_path))
+    all_extracted_data = []
+    for doc, item in tqdm(nlp.pipe(((item['doc_token'], item) for item in records),
+                                   as_tuples=True, batch_size=batch_size, n_process=n_process)):
+        all_extracted_data.append(build_record(item, entities_from_doc(doc)))
+
+    print("\n批量提取完成！")
+
+    with open(output_path, 'w') as f:
+        json.dump(all_extracted_data, f, ensure_ascii=False, indent=2)
+
+
+def extract_streaming(input_path, output_path, checkpoint_path=None, batch_size=64, n_process=1,
+                      commit_every=1000, resume=True):
+    """
+    流式模式：按行惰性读取语料，用 nlp.pipe 批量/多进程抽取，结果逐条写入 JSON Lines。
+
+    每 commit_every 条记录做一次 checkpoint，中断后重新运行会从上次提交的位置继续。
+    """
+    load_nlp()
+    with ResumableJsonlWriter(input_path, output_path, checkpoint_path, resume=resume) as writer:
+        if writer.finished:
+            print(f"'{output_path}' is already complete ({writer.records} records).")
+            return
+        records = iter_jsonl(input_path, writer.input_offset)
+        texts = ((item['doc_token'], (offset, item)) for offset, item in records)
+        offset = writer.input_offset
+        for doc, (offset, item) in tqdm(nlp.pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process),
+                                        initial=writer.records):
+            writer.write(build_record(item, entities_from_doc(doc)))
+            if writer.pending >= commit_every:
+                writer.commit(offset)
+        writer.commit(offset, finished=True)
+
+    print(f"\n批量提取完成！共 {writer.records} 条，已写入 {output_path}")
+
 
-print("\n批量提取完成！")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("")
+    parser.add_argument("--input", default="dataset/WebOfScience/wos_total.json")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--model", default="en_core_sci_lg")
+    parser.add_argument("--stream", default=0, type=int, help="write JSON Lines incrementally with a checkpoint")
+    parser.add_argument("--batch_size", default=64, type=int)
+    parser.add_argument("--n_process", default=1, type=int)
+    parser.add_argument("--commit_every", default=1000, type=int)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--no_resume", action="store_true")
+    args = parser.parse_args()
 
-with open("entity.json",'w') as f:
-    json.dump(all_extracted_data,f,ensure_ascii=False,indent=2)
\ No newline at end of file
+    load_nlp(args.model)
+    if args.stream:
+        extract_streaming(args.input, args.output or "entity.jsonl", args.checkpoint,
+                          batch_size=args.batch_size, n_process=args.n_process,
+                          commit_every=args.commit_every, resume=not args.no_resume)
+    else:
+        extract_all(args.input, args.output or "entity.json",
+                    batch_size=args.batch_size, n_process=args.n_process)
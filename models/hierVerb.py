@@ -14,6 +14,9 @@ import torch.nn.functional as F
 import json
 from .loss import ZLPRLoss
 from transformers import BertModel,BertTokenizer
+from KG.kg_store import EntityIndex, open_kg
+from util.knowledge_table import load_knowledge_table
+import os
 
 class HierVerbPromptForClassification(PromptForClassification):
     def __init__(self,
@@ -37,8 +40,14 @@ class HierVerbPromptForClassification(PromptForClassification):
         self.label_emb=[]
         self.args = args
         if self.args.KG:
-            self.node2vec=torch.load("KG/deepwalk.pt").to("cuda")
-            self.linkedid2node=self.load_linkedid("KG/final_enriched_kg/entity2id.txt")
+            # 实体表可按 fp16/bf16/int8 常驻，注入时经 linkedid2node 取行号、按行反量化（不预先按实体名展开成 fp32）；
+            # knowledge_mmap 时只从磁盘读取用到的行
+            self.knowledge_mmap=bool(getattr(self.args, "knowledge_mmap", 0))
+            self.node2vec=load_knowledge_table(self.args.knowledge_emb_path, getattr(self.args, "knowledge_table", None),
+                                               device="cuda" if torch.cuda.is_available() else "cpu",
+                                               mmap=self.knowledge_mmap,
+                                               cache_rows=getattr(self.args, "knowledge_cache_rows", 4096))
+            self.linkedid2node=self.load_linkedid(self.args.knowledge_dir, lazy=self.knowledge_mmap)
             self.KG_model=BertModel.from_pretrained("bert-base-uncased")
             self.KG_tokenizer=BertTokenizer.from_pretrained("bert-base-uncased")
         for idx, verbalizer in enumerate(self.verbalizer_list):
@@ -59,26 +68,12 @@ class HierVerbPromptForClassification(PromptForClassification):
         self.count3=0
         self.count4=0
         self.false_sibling_count=0
-        if self.args.KG:
-            self.build_knowledge_emb()
-
-
-    def build_knowledge_emb(self):
-        emb=torch.load(self.args.knowledge_emb_path)
-        with open(self.args.knowledge_dir,'r') as f:
-            lines=f.readlines()
-        self.knowlege_emb={}
-        for i in range(len(lines))[1:]:
-            self.knowlege_emb[lines[i].split('\t')[0]]=emb[i-1]
-    
-    def load_linkedid(self,file_path):
-        linked2node={}
-        with open(file_path,"r") as f:
-            data=f.readlines()
-        for item in data[1:]:
-            linked_id,node_id=item.strip().split("\t")
-            linked2node[linked_id]=int(node_id)
-        return linked2node
+
+
+    def load_linkedid(self,file_path,lazy=False):
+        kg=open_kg(os.path.dirname(file_path))
+        # lazy 时每次查询在 KG store 上二分查找，不把全部实体名读进字典
+        return EntityIndex(kg) if lazy else kg.entity_to_id()
 
     def build_label_emb(self):
         with open(self.args.description,"r")as f:
@@ -1,8 +1,25 @@
-import requests
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+from array import array
+import numpy as np
+from tqdm import tqdm
+
+INDEX_FORMAT_VERSION = 1
+
+
+def normalize_entity(entity):
+    return "_".join(entity.lower().strip().split())  # 变成 conceptnet API 格式
+
 
 def query_conceptnet(entity, language="en", max_results=10):
-    entity_norm = "_".join(entity.lower().strip().split())  # 变成 conceptnet API 格式
-    url = f"http://api.conceptnet.io/c/{language}/increased demand"
+    """在线查询 api.conceptnet.io（每个实体一次 HTTP 请求）。"""
+    import requests
+    entity_norm = normalize_entity(entity)
+    url = f"http://api.conceptnet.io/c/{language}/{entity_norm}"
 
     try:
         obj = requests.get(url).json()
@@ -21,18 +38,201 @@ def query_conceptnet(entity, language="en", max_results=10):
         print(f"Error fetching {entity}: {e}")
         return []
 
-from tqdm import tqdm
-entity_knowledge = {}
-with open("output_entities.txt",'r') as f:
-    data = f.readlines()
-    all_entities=[item.strip() for item in data]
 
-for entity in tqdm(sorted(all_entities)):
-    triples = query_conceptnet(entity)
-    print(triples)
-    if triples:
-        entity_knowledge[entity] = triples
+def _concept_term(uri, language):
+    # /c/en/increased_demand/n/... -> increased_demand
+    parts = uri.split('/')
+    if len(parts) < 4 or parts[1] != 'c' or parts[2] != language:
+        return None
+    return parts[3]
 
-import json
-with open("entity_conceptnet_knowledge.json", "w", encoding="utf-8") as fw:
-    json.dump(entity_knowledge, fw, ensure_ascii=False, indent=2)
+
+def build_conceptnet_index(assertions_path, index_dir, language="en"):
+    """
+    把 ConceptNet assertions 导出文件（conceptnet-assertions-5.x.csv[.gz]，制表符分隔）一次性转成本地索引。
+
+    只保留两端都是 language 概念的边；同一概念的不同词性/义项合并为一个概念（与 API 的 /c/en/<term> 一致），
+    重复的 (start, rel, end) 只保留权重最大的一条。
+
+    产物:
+        terms.bin / term_offsets.npy   按字节序排好的概念名（下标即概念 ID），用于二分查找
+        relations.json                 关系名（如 IsA、RelatedTo）
+        edges.npy                      (E, 3) 的 start, relation, end 概念 ID
+        weights.npy                    边权重
+        concept_indptr.npy / concept_edges.npy
+                                       概念 -> 边的偏移表（作为起点或终点），每个概念的边按权重降序
+        meta.json                      格式版本与规模
+    """
+    term_ids = {}
+    rel_ids = {}
+    starts, rels, ends = array('i'), array('i'), array('i')
+    weights = array('f')
+    opener = gzip.open if assertions_path.endswith('.gz') else open
+    csv.field_size_limit(sys.maxsize)
+    with opener(assertions_path, 'rt', encoding='utf-8') as f:
+        for row in tqdm(csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE), desc="Indexing ConceptNet"):
+            if len(row) < 5:
+                continue
+            start = _concept_term(row[2], language)
+            end = _concept_term(row[3], language)
+            if start is None or end is None:
+                continue
+            try:
+                weight = json.loads(row[4]).get('weight', 1.0)
+            except json.JSONDecodeError:
+                weight = 1.0
+            starts.append(term_ids.setdefault(start, len(term_ids)))
+            rels.append(rel_ids.setdefault(row[1].split('/')[-1], len(rel_ids)))
+            ends.append(term_ids.setdefault(end, len(term_ids)))
+            weights.append(weight)
+
+    # 概念 ID 重映射为按名字字节序排列的顺序，使得可以在名字表上直接二分查找
+    terms = list(term_ids)
+    del term_ids
+    encoded = [t.encode('utf-8') for t in terms]
+    order = sorted(range(len(encoded)), key=encoded.__getitem__)
+    remap = np.empty(len(order), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    encoded = [encoded[i] for i in order]
+    rel_list = list(rel_ids)
+
+    edges = np.stack([remap[np.frombuffer(starts, dtype=np.int32)],
+                      np.frombuffer(rels, dtype=np.int32).astype(np.int64),
+                      remap[np.frombuffer(ends, dtype=np.int32)]], axis=1)
+    edge_weights = np.frombuffer(weights, dtype=np.float32)
+    # 去重：按 (start, rel, end, -weight) 排序后取每组第一条
+    sort = np.lexsort((-edge_weights, edges[:, 2], edges[:, 1], edges[:, 0]))
+    edges, edge_weights = edges[sort], edge_weights[sort]
+    first = np.ones(len(edges), dtype=bool)
+    first[1:] = np.any(edges[1:] != edges[:-1], axis=1)
+    edges, edge_weights = edges[first], edge_weights[first]
+
+    # 概念 -> 边：每条边挂在起点和终点下（自环只挂一次），组内按权重降序
+    edge_ids = np.arange(len(edges))
+    loop = edges[:, 0] == edges[:, 2]
+    owners = np.concatenate([edges[:, 0], edges[~loop, 2]])
+    owned = np.concatenate([edge_ids, edge_ids[~loop]])
+    sort = np.lexsort((owned, -edge_weights[owned], owners))
+    indptr = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owners, minlength=len(encoded)), out=indptr[1:])
+
+    os.makedirs(index_dir, exist_ok=True)
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(index_dir, "terms.bin"), 'wb') as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(index_dir, "term_offsets.npy"), offsets)
+    with open(os.path.join(index_dir, "relations.json"), 'w', encoding='utf-8') as f:
+        json.dump(rel_list, f)
+    np.save(os.path.join(index_dir, "edges.npy"), edges.astype(np.int32))
+    np.save(os.path.join(index_dir, "weights.npy"), edge_weights)
+    np.save(os.path.join(index_dir, "concept_indptr.npy"), indptr)
+    np.save(os.path.join(index_dir, "concept_edges.npy"), owned[sort].astype(np.int32))
+    with open(os.path.join(index_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "format_version": INDEX_FORMAT_VERSION,
+            "language": language,
+            "num_concepts": len(encoded),
+            "num_relations": len(rel_list),
+            "num_edges": int(len(edges)),
+            "source": os.path.abspath(assertions_path),
+        }, f, indent=2)
+    print(f"ConceptNet index built at '{index_dir}': {len(encoded)} concepts, {len(edges)} edges.")
+
+
+class ConceptNetIndex:
+    """本地 ConceptNet 索引的只读视图（memory-map），查询结果与在线 API 的 (start, rel, end) 三元组格式相同。"""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"ConceptNet index at '{index_dir}' has format {self.meta.get('format_version')}, "
+                             f"expected {INDEX_FORMAT_VERSION}. Rebuild it with build_conceptnet_index().")
+        with open(os.path.join(index_dir, "relations.json"), 'r', encoding='utf-8') as f:
+            self.relation_names = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+
+        self.term_offsets = load("term_offsets.npy")
+        self.edges = load("edges.npy")
+        self.weights = load("weights.npy")
+        self.concept_indptr = load("concept_indptr.npy")
+        self.concept_edges = load("concept_edges.npy")
+        terms_path = os.path.join(index_dir, "terms.bin")
+        self._terms = np.memmap(terms_path, dtype=np.uint8, mode='r') if os.path.getsize(terms_path) else np.zeros(0, np.uint8)
+        self.num_concepts = self.meta["num_concepts"]
+
+    def _term_bytes(self, concept_id):
+        return self._terms[self.term_offsets[concept_id]:self.term_offsets[concept_id + 1]].tobytes()
+
+    def label(self, concept_id):
+        return self._term_bytes(concept_id).decode('utf-8').replace('_', ' ')
+
+    def concept_id(self, entity):
+        key = normalize_entity(entity).encode('utf-8')
+        lo, hi = 0, self.num_concepts
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_concepts and self._term_bytes(lo) == key:
+            return lo
+        return -1
+
+    def lookup(self, entity, max_results=10):
+        concept = self.concept_id(entity)
+        if concept < 0:
+            return []
+        start = self.concept_indptr[concept]
+        end = min(self.concept_indptr[concept + 1], start + max_results)
+        edge_ids = np.asarray(self.concept_edges[start:end])
+        return [(self.label(s), self.relation_names[r], self.label(e)) for s, r, e in self.edges[edge_ids]]
+
+    def lookup_many(self, entities, max_results=10):
+        """批量查询，返回 {entity: [(start, rel, end), ...]}，只包含有结果的实体。"""
+        results = {}
+        for entity in entities:
+            triples = self.lookup(entity, max_results)
+            if triples:
+                results[entity] = triples
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser("Fetch ConceptNet triples for the extracted entities.")
+    parser.add_argument("--entities", default="output_entities.txt")
+    parser.add_argument("--output", default="entity_conceptnet_knowledge.json")
+    parser.add_argument("--mode", choices=["offline", "online"], default="offline")
+    parser.add_argument("--assertions", default="conceptnet-assertions-5.7.0.csv.gz",
+                        help="ConceptNet assertions dump, ingested once into --index_dir (offline mode).")
+    parser.add_argument("--index_dir", default="conceptnet_index")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--max_results", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.entities, 'r') as f:
+        all_entities = sorted(item.strip() for item in f if item.strip())
+
+    if args.mode == "offline":
+        if not os.path.exists(os.path.join(args.index_dir, "meta.json")):
+            build_conceptnet_index(args.assertions, args.index_dir, args.language)
+        index = ConceptNetIndex(args.index_dir)
+        entity_knowledge = index.lookup_many(tqdm(all_entities, desc="Looking up entities"), args.max_results)
+    else:
+        entity_knowledge = {}
+        for entity in tqdm(all_entities):
+            triples = query_conceptnet(entity, args.language, args.max_results)
+            if triples:
+                entity_knowledge[entity] = triples
+    print(f"Found ConceptNet triples for {len(entity_knowledge)} of {len(all_entities)} entities.")
+
+    with open(args.output, "w", encoding="utf-8") as fw:
+        json.dump(entity_knowledge, fw, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
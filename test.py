@@ -4,35 +4,27 @@ import json
 from typing import List, Dict
 from scispacy.abbreviation import AbbreviationDetector
 from tqdm import tqdm
+from itertools import tee
+from KG.stream_io import iter_jsonl, ResumableJsonlWriter
+from KG.dict_linker import ENTITY_TYPE_MAPPING, TypeKeywordMatcher
 
 nlp_general = spacy.load("en_core_web_trf")    
 nlp_sci = spacy.load("en_core_sci_scibert")   
 nlp_sci.add_pipe("abbreviation_detector")
-ENTITY_TYPE_MAPPING = {
-    "Person": ["professor", "scientist", "student", "author", "researcher"],
-    "Organization": ["university", "institute", "company", "lab", "department"],
-    "Location": ["china", "germany", "hospital", "center", "beijing"],
-    "Technology": ["deep learning", "cnn", "transformer", "wireless sensor", "mri", "algorithm", "blockchain"],
-    "Medical": ["diabetes", "cancer", "brain", "liver", "antibody", "virus", "therapy", "alzheimer", "epilepsy"],
-    "Biological": ["bacteria", "protein", "enzyme", "mouse", "dna", "gene"],
-    "Abstract": ["intelligence", "emotion", "consciousness", "freedom"],
-    "Product": ["iphone", "mri machine", "vaccine"],
-    "Event": ["covid-19", "earthquake", "war"],
-}
+# 类型关键词表编译成一个 Aho-Corasick 自动机，每个实体只扫描一遍（结果与逐关键词子串判断相同）
+_type_matcher = TypeKeywordMatcher(ENTITY_TYPE_MAPPING)
+
 
 def guess_entity_type(entity_text: str) -> str:
-    text_lower = entity_text.lower()
-    for entity_type, keywords in ENTITY_TYPE_MAPPING.items():
-        for keyword in keywords:
-            if keyword in text_lower:
-                return entity_type
-    return "Unknown"
+    return _type_matcher.guess(entity_text)
+
 
 def extract_entities_combined(text: str) -> List[Dict]:
+    return combine_entities(nlp_general(text), nlp_sci(text))
+
+def combine_entities(doc_general, doc_sci) -> List[Dict]:
     results = {}
 
-    doc_general = nlp_general(text)
-    doc_sci = nlp_sci(text)
     for ent in doc_general.ents:
         if ent.label_ not in {"CARDINAL", "DATE", "TIME", "PERCENT", "MONEY", "QUANTITY"}:
             key = ent.text.strip().lower()
@@ -67,26 +59,32 @@ def extract_entities_combined(text: str) -> List[Dict]:
 
     return list(results.values())
 
+def extract_streaming(input_path: str, output_path: str, batch_size: int = 32, n_process: int = 1,
+                      commit_every: int = 500):
+    """两条 pipeline 各自用 nlp.pipe 批量处理同一个惰性文本流，结果逐条写入并定期 checkpoint。"""
+    with ResumableJsonlWriter(input_path, output_path) as writer:
+        if writer.finished:
+            return
+        records = ((offset, idx, item) for idx, (offset, item) in enumerate(iter_jsonl(input_path, writer.input_offset),
+                                                                            start=writer.records))
+        records_general, records_sci, records_meta = tee(records, 3)
+        docs_general = nlp_general.pipe((item["doc_token"] for _, _, item in records_general),
+                                        batch_size=batch_size, n_process=n_process)
+        docs_sci = nlp_sci.pipe((item["doc_token"] for _, _, item in records_sci),
+                                batch_size=batch_size, n_process=n_process)
+        offset = writer.input_offset
+        for doc_general, doc_sci, (offset, idx, item) in tqdm(zip(docs_general, docs_sci, records_meta),
+                                                              initial=writer.records):
+            writer.write({
+                "doc_id": item.get("doc_id", f"doc_{idx}"),
+                "entities": combine_entities(doc_general, doc_sci)
+            })
+            if writer.pending >= commit_every:
+                writer.commit(offset)
+        writer.commit(offset, finished=True)
+
 if __name__ == "__main__":
     input_path = "dataset/WebOfScience/wos_total.json"
     output_path = "dataset/WebOfScience/wos_entities.json"
 
-    with open(input_path, 'r') as f:
-        data = [json.loads(line) for line in f]
-
-    output = []
-
-    for idx, item in enumerate(tqdm(data)):
-        doc_id = item.get("doc_id", f"doc_{idx}")
-        text = item["doc_token"]
-        entities = extract_entities_combined(text)
-
-        output.append({
-            "doc_id": doc_id,
-            "entities": entities
-        })
-
-    with open(output_path, 'w') as fout:
-        for record in output:
-            fout.write(json.dumps(record, ensure_ascii=False) + "\n")
-
+    extract_streaming(input_path, output_path)
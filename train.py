@@ -39,6 +39,10 @@ def main():
     parser.add_argument("--result_file", type=str, default="few_shot_train.txt")
     parser.add_argument("--knowledge_emb_path",type=str,default="KG/deepwalk.pt")
     parser.add_argument("--knowledge_dir",type=str,default="KG/final_enriched_kg/entity2id.txt")
+    parser.add_argument("--knowledge_table",type=str,default=None,choices=["fp32","fp16","bf16","int8"],
+                        help="entity table precision; None keeps the format stored in knowledge_emb_path")
+    parser.add_argument("--knowledge_mmap",type=int,default=0,help="memory-map knowledge_emb_path (.npy) and read only the rows a batch uses")
+    parser.add_argument("--knowledge_cache_rows",type=int,default=4096)
     parser.add_argument("--multi_mask", type=int, default=1)
     parser.add_argument("--description",default="dataset/KGWebOfScience/wos_label_description_10.json",type=str)
     parser.add_argument("--dropout", default=0.1, type=float)
@@ -1,12 +1,12 @@
+import argparse
 import json
 import spacy
 
-nlp = spacy.load("en_core_web_sm")  # 可换成更强的模型如 'en_core_web_trf'
-
 label_entities = set()
 text_entities = set()
 
-with open("dataset/WebOfScience/wos_train.json", "r", encoding="utf-8") as f:
+
+def iter_texts(f):
     for line in f:
         obj = json.loads(line)
 
@@ -14,19 +14,32 @@ with open("dataset/WebOfScience/wos_train.json", "r", encoding="utf-8") as f:
         labels = obj.get("doc_label", [])
         label_entities.update(label.lower() for label in labels)
 
-        # 2. 从 doc_token 中抽取名词短语
-        text = obj.get("doc_token", "")
-        doc = nlp(text)
-        for chunk in doc.noun_chunks:
-            phrase = chunk.text.lower().strip()
-            if len(phrase.split()) <= 6 and len(phrase) > 2:
-                text_entities.add(phrase)
-
-# 合并所有实体
-all_entities = label_entities.union(text_entities)
-
-# 输出结果
-print(f"共提取实体数：{len(all_entities)}")
-with open("dataset/WebOfScience/extracted_entities.txt", "w", encoding="utf-8") as fw:
-    for e in sorted(all_entities):
-        fw.write(e + "\n")
+        yield obj.get("doc_token", "")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("")
+    parser.add_argument("--input", default="dataset/WebOfScience/wos_train.json")
+    parser.add_argument("--output", default="dataset/WebOfScience/extracted_entities.txt")
+    parser.add_argument("--model", default="en_core_web_sm", help="可换成更强的模型如 en_core_web_trf")
+    parser.add_argument("--batch_size", default=256, type=int)
+    parser.add_argument("--n_process", default=4, type=int)
+    args = parser.parse_args()
+
+    nlp = spacy.load(args.model, disable=["ner"])  # noun_chunks 只依赖 parser
+    with open(args.input, "r", encoding="utf-8") as f:
+        # 2. 从 doc_token 中抽取名词短语（nlp.pipe 批量、多进程处理，按行惰性读取）
+        for doc in nlp.pipe(iter_texts(f), batch_size=args.batch_size, n_process=args.n_process):
+            for chunk in doc.noun_chunks:
+                phrase = chunk.text.lower().strip()
+                if len(phrase.split()) <= 6 and len(phrase) > 2:
+                    text_entities.add(phrase)
+
+    # 合并所有实体
+    all_entities = label_entities.union(text_entities)
+
+    # 输出结果
+    print(f"共提取实体数：{len(all_entities)}")
+    with open(args.output, "w", encoding="utf-8") as fw:
+        for e in sorted(all_entities):
+            fw.write(e + "\n")
@@ -0,0 +1,244 @@
+# -*- coding:utf-8 -*-
+import argparse
+import os
+from collections import OrderedDict
+import numpy as np
+import torch
+
+TABLE_FORMATS = ("fp32", "fp16", "bf16", "int8")
+_FLOAT_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+_NUMPY_FORMATS = {"float32": "fp32", "float16": "fp16", "int8": "int8"}
+
+
+def scale_path(path):
+    """int8 .npy 表的逐行 scale 存在旁边的 <name>.scale.npy 中。"""
+    return os.path.splitext(path)[0] + ".scale.npy"
+
+
+def quantize_table(weight, fmt):
+    """
+    把 (num_rows, dim) 的实体 embedding 转成指定格式，返回可直接 torch.save 的 dict。
+
+    int8 为逐行对称量化：scale = 行内最大绝对值 / 127，codes = round(w / scale)。
+    """
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"Unknown knowledge table format '{fmt}', expected one of {TABLE_FORMATS}.")
+    weight = weight.detach().float().cpu()
+    if fmt == "int8":
+        scale = weight.abs().amax(dim=1, keepdim=True).clamp_min(1e-12) / 127.0
+        codes = torch.round(weight / scale).clamp_(-127, 127).to(torch.int8)
+        return {"format": fmt, "weight": codes, "scale": scale.squeeze(1)}
+    return {"format": fmt, "weight": weight.to(_FLOAT_DTYPES[fmt]), "scale": None}
+
+
+class KnowledgeTable:
+    """
+    实体 embedding 表，按压缩格式常驻内存/显存，取行时再反量化为 float32。
+
+    与原来的 tensor 用法一致：table[row]、table[rows]、len(table)、table.shape。
+    """
+
+    def __init__(self, weight, scale=None, fmt="fp32", device="cpu"):
+        self.format = fmt
+        self.weight = weight.to(device)
+        self.scale = scale.to(device) if scale is not None else None
+
+    @classmethod
+    def from_state(cls, state, device="cpu"):
+        return cls(state["weight"], state.get("scale"), state["format"], device)
+
+    def __len__(self):
+        return self.weight.shape[0]
+
+    @property
+    def shape(self):
+        return self.weight.shape
+
+    @property
+    def device(self):
+        return self.weight.device
+
+    def __getitem__(self, index):
+        rows = self.weight[index].float()
+        if self.scale is not None:
+            rows = rows * self.scale[index].unsqueeze(-1)
+        return rows
+
+    def to(self, device):
+        return KnowledgeTable(self.weight, self.scale, self.format, device)
+
+    def dequantize(self):
+        return self[:]
+
+    def nbytes(self):
+        size = self.weight.numel() * self.weight.element_size()
+        if self.scale is not None:
+            size += self.scale.numel() * self.scale.element_size()
+        return size
+
+
+class MmapKnowledgeTable:
+    """
+    memory-map 磁盘上的 .npy 实体表，只读取被索引的行，并在 device 上缓存最近用过的 cache_rows 行（LRU）。
+
+    启动开销和常驻内存与 KG 规模无关；用法与 KnowledgeTable 相同，可直接替换。
+    支持 float32 / float16 表，以及 int8 codes + <name>.scale.npy 的逐行量化表。
+    """
+
+    def __init__(self, path, device="cpu", cache_rows=4096):
+        self.path = path
+        self.weight = np.load(path, mmap_mode='r')
+        if self.weight.dtype.name not in _NUMPY_FORMATS:
+            raise ValueError(f"'{path}' has dtype {self.weight.dtype}, expected one of {tuple(_NUMPY_FORMATS)}.")
+        self.format = _NUMPY_FORMATS[self.weight.dtype.name]
+        self.scale = np.load(scale_path(path), mmap_mode='r') if self.format == "int8" else None
+        self.device = torch.device(device)
+        self.cache_rows = cache_rows
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.weight.shape[0]
+
+    @property
+    def shape(self):
+        return torch.Size(self.weight.shape)
+
+    def _gather(self, rows):
+        # 按行号排序后读取，访问 memory-map 时尽量顺序
+        order = np.argsort(rows)
+        sorted_rows = rows[order]
+        data = np.asarray(self.weight[sorted_rows], dtype=np.float32)
+        if self.scale is not None:
+            data *= np.asarray(self.scale[sorted_rows], dtype=np.float32)[:, None]
+        out = np.empty_like(data)
+        out[order] = data
+        return torch.from_numpy(out).to(self.device)
+
+    def __getitem__(self, index):
+        if isinstance(index, torch.Tensor):
+            index = index.tolist()
+        if isinstance(index, slice):
+            # 整段读取（如 parity_report 逐块比较）不经过缓存
+            return self._gather(np.arange(*index.indices(len(self)), dtype=np.int64))
+        single = isinstance(index, (int, np.integer))
+        rows = [int(index) % len(self)] if single else [int(i) % len(self) for i in index]
+        missing = [r for r in dict.fromkeys(rows) if r not in self._cache]
+        self.misses += len(missing)
+        self.hits += len(rows) - len(missing)
+        if missing:
+            for row, vector in zip(missing, self._gather(np.array(missing, dtype=np.int64))):
+                self._cache[row] = vector
+        result = []
+        for row in rows:
+            self._cache.move_to_end(row)
+            result.append(self._cache[row])
+        while len(self._cache) > self.cache_rows:
+            self._cache.popitem(last=False)
+        if single:
+            return result[0]
+        return torch.stack(result) if result else torch.zeros((0, self.weight.shape[1]), device=self.device)
+
+    def to(self, device):
+        return MmapKnowledgeTable(self.path, device, self.cache_rows)
+
+    def nbytes(self):
+        """磁盘上表的字节数；常驻内存只有 cache_bytes()，memory-map 的页面由操作系统按需换入换出。"""
+        return self.weight.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def cache_bytes(self):
+        return len(self._cache) * self.weight.shape[1] * 4
+
+
+def load_knowledge_table(path, fmt=None, device="cpu", mmap=False, cache_rows=4096):
+    """
+    读取实体 embedding 表。
+
+    path 可以是 deepwalk.pt 这样的普通 tensor（此时按 fmt 在加载时转换，默认 fp32 即原样使用），
+    也可以是 convert_table 写出的压缩表（格式已确定，fmt 必须为空或与之一致）。
+    mmap 时 path 须为 .npy（如 deepwalk 的 out-of-core 输出或 convert_table 写出的 .npy），返回 MmapKnowledgeTable。
+    """
+    if mmap:
+        if not path.endswith(".npy"):
+            raise ValueError(f"Memory-mapped knowledge tables must be .npy files, got '{path}'; "
+                             f"convert it with util/knowledge_table.py --output <name>.npy.")
+        table = MmapKnowledgeTable(path, device, cache_rows)
+        if fmt not in (None, table.format):
+            raise ValueError(f"'{path}' is stored as {table.format}, cannot load it as {fmt}.")
+        return table
+    if path.endswith(".npy"):
+        weight = torch.from_numpy(np.load(path))
+        if weight.dtype == torch.int8:
+            state = {"format": "int8", "weight": weight, "scale": torch.from_numpy(np.load(scale_path(path)))}
+        else:
+            state = weight
+    else:
+        state = torch.load(path, map_location="cpu")
+    if isinstance(state, dict) and "format" in state:
+        if fmt not in (None, state["format"]):
+            raise ValueError(f"'{path}' is stored as {state['format']}, cannot load it as {fmt}; "
+                             f"convert the original table instead.")
+        return KnowledgeTable.from_state(state, device)
+    return KnowledgeTable.from_state(quantize_table(state, fmt or "fp32"), device)
+
+
+def parity_report(reference, table, chunk_rows=65536):
+    """
+    与原始 fp32 表对比的误差统计：最大绝对误差、相对 L2 误差、逐行余弦相似度的均值和最小值，以及内存占用。
+    """
+    reference = reference.detach().float().cpu()
+    max_abs, err_sq, ref_sq = 0.0, 0.0, 0.0
+    cos_sum, cos_min = 0.0, 1.0
+    for start in range(0, len(reference), chunk_rows):
+        ref = reference[start:start + chunk_rows]
+        approx = table[start:start + chunk_rows].cpu()
+        diff = approx - ref
+        max_abs = max(max_abs, diff.abs().max().item())
+        err_sq += diff.pow(2).sum().item()
+        ref_sq += ref.pow(2).sum().item()
+        cos = torch.nn.functional.cosine_similarity(approx, ref, dim=1)
+        cos_sum += cos.sum().item()
+        cos_min = min(cos_min, cos.min().item())
+    fp32_bytes = reference.numel() * 4
+    return {
+        "format": table.format,
+        "rows": len(reference),
+        "max_abs_error": max_abs,
+        "relative_l2_error": (err_sq / max(ref_sq, 1e-30)) ** 0.5,
+        "mean_cosine": cos_sum / max(len(reference), 1),
+        "min_cosine": cos_min,
+        "fp32_mb": fp32_bytes / 2 ** 20,
+        "table_mb": table.nbytes() / 2 ** 20,
+        "compression": fp32_bytes / max(table.nbytes(), 1),
+    }
+
+
+def convert_table(input_path, output_path, fmt):
+    """把 deepwalk.pt 等 fp32 表转换为 fmt 格式并保存（.pt 或可 memory-map 的 .npy），返回 parity_report 的结果。"""
+    weight = torch.load(input_path, map_location="cpu")
+    state = quantize_table(weight, fmt)
+    if output_path.endswith(".npy"):
+        # .npy 输出可以被 MmapKnowledgeTable 直接 memory-map；numpy 没有 bfloat16
+        if fmt == "bf16":
+            raise ValueError("bf16 tables cannot be stored as .npy; use fp16 or int8.")
+        np.save(output_path, state["weight"].numpy())
+        if state["scale"] is not None:
+            np.save(scale_path(output_path), state["scale"].numpy())
+        table = MmapKnowledgeTable(output_path, cache_rows=0)
+    else:
+        torch.save(state, output_path)
+        table = KnowledgeTable.from_state(state)
+    report = parity_report(weight, table)
+    for key, value in report.items():
+        print(f"{key:<18} {value:.6g}" if isinstance(value, float) else f"{key:<18} {value}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Convert an entity embedding table to fp16/bf16/int8 and report the accuracy parity.")
+    parser.add_argument("--input", default="KG/deepwalk.pt")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--format", default="int8", choices=TABLE_FORMATS)
+    args = parser.parse_args()
+    convert_table(args.input, args.output or args.input.replace(".pt", f".{args.format}.pt"), args.format)